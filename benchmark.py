@@ -0,0 +1,624 @@
+import argparse
+import collections
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import item_revive_v2 as app
+
+# 基准测试用的物品种类
+BENCH_TYPE = "食品"
+BENCH_ATTRIBUTES = ["保质期", "数量"]
+
+def build_fields(count):
+    fields = []
+    for i in range(count):
+        fields.append((
+            (f"物品{i}", f"第{i}件捐赠物品的说明", f"北京市朝阳区{i % 100}号",
+             f"138{i:08d}", f"user{i}@example.com", f"user{i % 1000}"),
+            {"保质期": f"2025-{i % 12 + 1:02d}-01", "数量": str(i % 50)}))
+    return fields
+
+# 旧版物品布局：所有字段都放在每个实例的 __dict__ 中
+class DictItem:
+    def __init__(self, name, description, location, contact_phone, email, added_by, **kwargs):
+        self.name = name
+        self.description = description
+        self.location = location
+        self.contact_phone = contact_phone
+        self.email = email
+        self.added_by = added_by
+        self.item_id = None
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+# 分别用 __dict__ 布局和 __slots__ 布局创建物品；字段字符串事先建好，只统计物品对象本身分配的内存
+def measure_layout(fields, slots):
+    if slots:
+        item_class = app.create_item_class(BENCH_TYPE, BENCH_ATTRIBUTES)
+    else:
+        item_class = type(BENCH_TYPE, (DictItem,), {})
+    gc.collect()
+    tracing = tracemalloc.is_tracing()  # 没有 resource 时整个运行期间都在跟踪，不能停掉
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [item_class(*base, **attributes) for base, attributes in fields]
+    current = tracemalloc.get_traced_memory()[0] - before
+    if not tracing:
+        tracemalloc.stop()
+    del items
+    gc.collect()
+    return current
+
+def bench_memory(counts):
+    print(f"{'物品数':>10} {'dict 布局(MB)':>14} {'slots 布局(MB)':>14} {'每件节省(B)':>12} {'比例':>8}")
+    for count in counts:
+        fields = build_fields(count)
+        dict_bytes = measure_layout(fields, slots=False)
+        slots_bytes = measure_layout(fields, slots=True)
+        saved = (dict_bytes - slots_bytes) / count
+        print(f"{count:>10} {dict_bytes / 2**20:>14.1f} {slots_bytes / 2**20:>14.1f} {saved:>12.1f} {slots_bytes / dict_bytes:>8.2f}")
+
+# ---------- 合成数据 ----------
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂"
+PROVINCES = {
+    "北京市": ["朝阳区", "海淀区", "东城区", "西城区", "丰台区"],
+    "上海市": ["浦东新区", "徐汇区", "静安区", "黄浦区", "闵行区"],
+    "广东省广州市": ["天河区", "越秀区", "海珠区", "白云区"],
+    "广东省深圳市": ["南山区", "福田区", "罗湖区", "宝安区"],
+    "浙江省杭州市": ["西湖区", "上城区", "拱墅区", "滨江区"],
+    "四川省成都市": ["锦江区", "青羊区", "武侯区", "成华区"],
+}
+ADJECTIVES = ["九成新", "全新未拆封", "八成新", "闲置", "几乎没用过", "有轻微划痕", "功能完好", "包装完整"]
+NOUNS = ["台灯", "书桌", "自行车", "电饭煲", "羽绒服", "围巾", "儿童绘本", "键盘", "显示器", "保温杯",
+         "运动鞋", "收纳箱", "电风扇", "吉他", "背包", "微波炉", "字典", "毛毯", "手机", "耳机"]
+REASONS = ["搬家带不走", "孩子长大用不上了", "买重复了", "换了新的", "毕业清理宿舍", "家里地方不够"]
+TYPE_NAMES = ["食品", "书籍", "电子设备", "衣物", "工具", "家具", "玩具", "文具", "厨具", "运动器材",
+              "乐器", "母婴用品", "宠物用品", "日用品", "装饰品"]
+ATTRIBUTE_NAMES = ["数量", "品牌", "颜色", "尺寸", "型号", "保质期", "材质", "重量", "产地", "作者",
+                   "出版社", "适用年龄", "购买年份", "成色"]
+
+def random_person(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_NAMES) for _ in range(rng.randint(1, 2)))
+
+def random_location(rng):
+    province = rng.choice(list(PROVINCES))
+    return f"{province}{rng.choice(PROVINCES[province])}{rng.randint(1, 300)}号"
+
+def random_attribute_value(rng, attr):
+    if attr == "数量":
+        return str(rng.randint(1, 200))
+    if attr == "保质期":
+        return f"202{rng.randint(4, 7)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    if attr in ("尺寸", "重量"):
+        return rng.choice(["S", "M", "L", "XL", "1kg", "2kg", "30cm", "50cm"])
+    return rng.choice(NOUNS) + rng.choice(["牌", "款", "系列", ""])
+
+def random_item(rng, item_type, item_id, users):
+    noun = rng.choice(NOUNS)
+    data = {
+        "name": f"{rng.choice(ADJECTIVES)}{noun}",
+        "description": f"{random_person(rng)}的{noun}，{rng.choice(REASONS)}，{rng.choice(ADJECTIVES)}",
+        "location": random_location(rng),
+        "contact_phone": f"13{rng.randint(100000000, 999999999)}",
+        "email": f"donor{item_id - 1}@example.com",
+        "added_by": f"user{rng.randrange(users)}" if users else "admin",
+        "type": item_type["name"],
+        "id": item_id,
+    }
+    for attr in item_type["attributes"]:
+        data[attr] = random_attribute_value(rng, attr)
+    return data
+
+# 生成指定规模的 users.json / item_types.json / items.json
+def generate_catalog(directory, items=100000, users=1000, types=10, attributes_per_type=3, pending_ratio=0.2, seed=1):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    type_names = [TYPE_NAMES[i] if i < len(TYPE_NAMES) else f"{TYPE_NAMES[i % len(TYPE_NAMES)]}{i}" for i in range(types)]
+    item_types = [{"name": name, "attributes": rng.sample(ATTRIBUTE_NAMES, min(attributes_per_type, len(ATTRIBUTE_NAMES)))}
+                  for name in type_names]
+
+    users_data = [{"username": "admin", "password": "123456", "address": "北京市朝阳区1号",
+                   "contact_info": "13800000000", "user_type": "admin", "is_approved": True}]
+    for i in range(users):
+        users_data.append({
+            "username": f"user{i}", "password": f"pw{i}", "address": random_location(rng),
+            "contact_info": f"13{rng.randint(100000000, 999999999)}", "user_type": "user",
+            "is_approved": rng.random() >= pending_ratio})
+
+    items_data = [random_item(rng, rng.choice(item_types), i + 1, users) for i in range(items)]
+
+    app.atomic_write_json(os.path.join(directory, "users.json"), users_data, indent=4)
+    app.atomic_write_json(os.path.join(directory, "item_types.json"), item_types, ensure_ascii=False, indent=4)
+    app.atomic_write_json(os.path.join(directory, "items.json"), items_data, ensure_ascii=False, indent=4)
+    return directory
+
+# ---------- 计时与统计 ----------
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def summarize(samples, count=None):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "runs": len(samples),
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p90_ms": percentile(samples, 0.90) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "max_ms": samples[-1] * 1000 if samples else 0.0,
+        "mean_ms": total / len(samples) * 1000 if samples else 0.0,
+        "throughput_per_s": (count or len(samples)) / total if total else 0.0,
+    }
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+# resource 只在 POSIX 上有；其他平台（Windows）退回 tracemalloc 记录的 Python 分配峰值，
+# 不含解释器和扩展模块自己的内存，需要在运行前调用 start_memory_tracking
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return tracemalloc.get_traced_memory()[1] / (1 << 20) if tracemalloc.is_tracing() else 0.0
+    # Linux 下 ru_maxrss 以 KB 为单位，macOS 下以字节为单位
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+def start_memory_tracking():
+    try:
+        import resource
+    except ImportError:
+        tracemalloc.start()
+
+def open_service(directory):
+    storage = app.JsonStorage(os.path.join(directory, "users.json"),
+                              os.path.join(directory, "item_types.json"),
+                              os.path.join(directory, "items.json"))
+    return app.ItemReviveService(storage)
+
+# ---------- 各项基准 ----------
+
+def bench_load(directory, repeat):
+    results = {}
+    samples = []
+    for _ in range(repeat):
+        service = open_service(directory)
+        gc.collect()
+        elapsed, _ = timed(service.load_items)
+        samples.append(elapsed)
+    results["load_items"] = summarize(samples)
+    results["load_items"]["items"] = len(service.items)
+
+    with open(os.path.join(directory, "items.json"), "r", encoding="utf-8") as file:
+        items_data = json.load(file)
+    samples = []
+    for data in items_data[:min(len(items_data), 20000)]:
+        elapsed, _ = timed(app.Item.from_dict, data)
+        samples.append(elapsed)
+    results["item_from_dict"] = summarize(samples)
+    return results, service
+
+def bench_save(service, repeat):
+    results = {}
+    storage = service.storage
+    items = list(service.items.values())
+    samples = [timed(storage.save_items, items)[0] for _ in range(repeat)]
+    results["save_items_snapshot"] = summarize(samples)
+    results["save_items_snapshot"]["bytes"] = os.path.getsize(storage.items_filename)
+
+    # 单次增删只追加日志
+    user = service.get_user("admin")
+    item_type = service.item_types[0]
+    samples = []
+    for i in range(200):
+        attributes = {attr: "1" for attr in item_type.attributes}
+        elapsed, item = timed(service.add_item, user, item_type.name, f"基准物品{i}", "基准测试", "北京市朝阳区",
+                              "13800000000", "bench@example.com", attributes)
+        samples.append(elapsed)
+        samples.append(timed(service.delete_item, item.item_id)[0])
+    results["save_items_append"] = summarize(samples)
+    return results
+
+def bench_search(service, queries, seed):
+    rng = random.Random(seed)
+    type_names = [item_type.name for item_type in service.item_types]
+    keywords = NOUNS + ADJECTIVES + [noun[:1] for noun in NOUNS] + ["user1", "不存在的关键词"]
+    samples = []
+    hits = 0
+    for _ in range(queries):
+        elapsed, (found, total) = timed(service.find_items, rng.choice(type_names), rng.choice(keywords))
+        samples.append(elapsed)
+        hits += total
+    results = summarize(samples)
+    results["mean_hits"] = hits / queries if queries else 0
+    return {"find_item": results}
+
+# 第一次登录要做 PBKDF2（明文密码顺便迁移成哈希），之后同一用户再登录走会话缓存，两者分开统计
+# 每次 PBKDF2 要几百毫秒，只在 max_users 个用户中抽样
+def bench_login(service, logins, seed, max_users=20):
+    rng = random.Random(seed)
+    passwords = {user.username: user.password for user in service.users if user.is_approved}
+    usernames = rng.sample(sorted(passwords), min(max_users, len(passwords)))
+    cold = []
+    warm = []
+    logged_in = set()
+    for _ in range(logins):
+        username = rng.choice(usernames)
+        samples = warm if username in logged_in else cold
+        samples.append(timed(service.login, username, passwords[username])[0])
+        logged_in.add(username)
+    return {"login_user": summarize(cold), "login_user_cached": summarize(warm)}
+
+def bench_approve(service, batch_size):
+    results = {}
+    elapsed, pending = timed(service.pending_users)
+    results["pending_users"] = summarize([elapsed])
+    results["pending_users"]["pending"] = len(pending)
+    samples = []
+    approved = 0
+    while True:
+        batch = [user.username for user in service.pending_users()[:batch_size]]
+        if not batch:
+            break
+        samples.append(timed(service.approve, batch)[0])
+        approved += len(batch)
+    results["approve_users"] = summarize(samples, approved)
+    return results
+
+# JSON 快照与二进制快照对比：文件大小、整体加载、按种类计数、列出名称、打开单件物品
+# 单件物品分冷启动（打开文件后按编号查找）和已打开（按已知位置读取）两种
+def bench_snapshot(directory, repeat, opens=2000, seed=1):
+    json_filename = os.path.join(directory, "items.json")
+    binary_filename = os.path.join(directory, "items.bin")
+    elapsed, count = timed(app.convert_snapshot, json_filename, binary_filename,
+                           os.path.join(directory, "item_types.json"))
+    results = {"convert_snapshot": summarize([elapsed], count)}
+
+    def load(filename):
+        return sum(1 for entry in app.ItemJournal(filename).iter_load())
+
+    def count_json():
+        return collections.Counter(data["type"] for offset, data in app.iter_json_array(json_filename))
+
+    def count_binary():
+        reader = app.BinarySnapshot(binary_filename)
+        try:
+            return reader.count_by_type()
+        finally:
+            reader.close()
+
+    def names_json():
+        return sum(1 for offset, data in app.iter_json_array(json_filename) if data["name"])
+
+    def names_binary():
+        reader = app.BinarySnapshot(binary_filename)
+        try:
+            return sum(1 for item_id, name in reader.iter_names() if name)
+        finally:
+            reader.close()
+
+    def open_json(item_id):
+        for offset, data in app.iter_json_array(json_filename):
+            if data["id"] == item_id:
+                return data
+
+    def open_binary(item_id):
+        reader = app.BinarySnapshot(binary_filename)
+        try:
+            return reader.record(reader.position_of(item_id))
+        finally:
+            reader.close()
+
+    for name, json_func, binary_func in (("load", lambda: load(json_filename), lambda: load(binary_filename)),
+                                         ("count_by_type", count_json, count_binary),
+                                         ("list_names", names_json, names_binary)):
+        results[f"{name}_json"] = summarize([timed(json_func)[0] for _ in range(repeat)])
+        results[f"{name}_binary"] = summarize([timed(binary_func)[0] for _ in range(repeat)])
+
+    rng = random.Random(seed)
+    item_ids = [rng.randint(1, count) for _ in range(opens)]
+    results["open_item_cold_json"] = summarize([timed(open_json, item_id)[0] for item_id in item_ids[:repeat]])
+    results["open_item_cold_binary"] = summarize([timed(open_binary, item_id)[0] for item_id in item_ids])
+
+    offsets = {data["id"]: offset for offset, data in app.iter_json_array(json_filename)}
+    results["open_item_json"] = summarize([timed(app.read_json_at, json_filename, offsets[item_id])[0]
+                                           for item_id in item_ids])
+    reader = app.BinarySnapshot(binary_filename)
+    try:
+        reader.position_of(1)
+        results["open_item_binary"] = summarize([timed(reader.record, reader.position_of(item_id))[0]
+                                                 for item_id in item_ids])
+    finally:
+        reader.close()
+
+    print(f"{'文件':<10} {'大小(MB)':>10}")
+    for filename in (json_filename, binary_filename):
+        print(f"{os.path.basename(filename):<10} {os.path.getsize(filename) / 2**20:>10.1f}")
+    return results
+
+# 在临时目录中生成数据并运行全部基准，结果写成 JSON
+# 保存的搜索：随机的种类、关键词、数量条件和省份组合，形状与界面中“保存为求购”一致
+def random_search(rng, search_id, item_types):
+    item_type = rng.choice(item_types)
+    conditions = []
+    if "数量" in item_type.attributes and rng.random() < 0.3:
+        conditions.append(["数量", rng.choice([">=", "<="]), str(rng.randint(1, 200))])
+    return {
+        "id": search_id,
+        "category": item_type.name if rng.random() < 0.7 else None,
+        "keyword": rng.choice(NOUNS + ADJECTIVES) if rng.random() < 0.9 or not conditions else None,
+        "conditions": conditions,
+        "location": rng.choice(list(PROVINCES)) if rng.random() < 0.3 else None,
+    }
+
+# 新物品与保存的搜索匹配的耗时随搜索数的变化；逐条核对全部搜索的做法作为对照，只抽少量物品
+def bench_matching(service, counts, items, seed, scan_items=50):
+    rng = random.Random(seed)
+    usernames = [user.username for user in service.users]
+    item_types = [{"name": item_type.name, "attributes": item_type.attributes} for item_type in service.item_types]
+    new_items = [app.Item.from_dict(random_item(rng, rng.choice(item_types), len(service.items) + i + 1, len(usernames)))
+                 for i in range(items)]
+    results = {}
+    for count in counts:
+        searches = {}
+        for search_id in range(1, count + 1):
+            searches.setdefault(rng.choice(usernames), []).append(random_search(rng, search_id, service.item_types))
+        for user in service.users:
+            user.searches = searches.get(user.username, [])
+        elapsed, _ = timed(service.searches.rebuild, service.users, service._anchor_frequency)
+        results[f"index_searches_{count}"] = summarize([elapsed], count)
+
+        samples = []
+        matches = 0
+        for item in new_items:
+            elapsed, found = timed(service.searches.match, item)
+            samples.append(elapsed)
+            matches += len(found)
+        results[f"match_{count}"] = summarize(samples)
+        results[f"match_{count}"]["mean_hits"] = matches / items if items else 0
+
+        def scan(item):
+            return [key for key, search in service.searches.searches.items()
+                    if key[0] != item.added_by and service.searches.accepts(search, item)]
+        results[f"scan_{count}"] = summarize([timed(scan, item)[0] for item in new_items[:scan_items]])
+    for user in service.users:
+        user.searches = []
+    service.searches.rebuild(service.users)
+    return results
+
+# 日志追加的落盘代价：同样多的物品按不同批量追加，比较每批 fsync 与不 fsync
+# 以及抢救损坏快照的代价：在快照中间写入不同大小的垃圾，与完好时的加载时间对比
+def bench_durability(directory, appends, batch_sizes, damage_sizes, seed):
+    rng = random.Random(seed)
+    item_types = [{"name": item_type.name, "attributes": item_type.attributes}
+                  for item_type in app.load_item_types(os.path.join(directory, "item_types.json"))]
+    for item_type in item_types:
+        if item_type["name"] not in app.item_classes:
+            app.item_classes.register(item_type["name"], item_type["attributes"])
+    results = {}
+    scratch = tempfile.mkdtemp(prefix="item_revive_journal_", dir=directory)
+    try:
+        for batch_size in batch_sizes:
+            for sync in (False, True):
+                journal = app.ItemJournal(os.path.join(scratch, f"items_{batch_size}_{int(sync)}.json"),
+                                          compact_threshold=float("inf"), sync=sync)
+                records = [random_item(rng, rng.choice(item_types), item_id, 0) for item_id in range(1, appends + 1)]
+                samples = []
+                for start in range(0, appends, batch_size):
+                    items = [app.Item.from_dict(data) for data in records[start:start + batch_size]]
+                    samples.append(timed(journal.append_adds, items)[0])
+                results[f"append_batch{batch_size}_{'fsync' if sync else 'nosync'}"] = summarize(samples, appends)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    # 先压缩一次，写出带校验和的快照
+    filename = os.path.join(directory, "items.json")
+    journal = app.ItemJournal(filename)
+    journal.load()
+    journal.compact()
+    with open(filename, "rb") as file:
+        clean = file.read()
+
+    def load():
+        journal = app.ItemJournal(filename)
+        count = sum(1 for entry in journal.iter_load())
+        return count, journal.take_damaged()
+
+    try:
+        samples = [timed(load)[0] for _ in range(3)]
+        results["load_clean"] = summarize(samples)
+        total = load()[0]
+        for size in damage_sizes:
+            damaged = bytearray(clean)
+            start = len(damaged) // 2
+            damaged[start:start + size] = bytes(rng.randrange(256) for _ in range(size))
+            with open(filename, "wb") as file:
+                file.write(damaged)
+            samples = []
+            for _ in range(3):
+                elapsed, (count, regions) = timed(load)
+                samples.append(elapsed)
+            results[f"load_damaged_{size}"] = summarize(samples)
+            results[f"load_damaged_{size}"]["lost_records"] = total - count
+    finally:
+        with open(filename, "wb") as file:
+            file.write(clean)
+    return results
+
+def run_suite(args):
+    directory = args.data or tempfile.mkdtemp(prefix="item_revive_bench_")
+    try:
+        if not args.data or not os.path.exists(os.path.join(directory, "items.json")):
+            print(f"生成合成数据: {args.items} 件物品, {args.users} 个用户, {args.types} 个类型")
+            generate_catalog(directory, args.items, args.users, args.types, args.attributes, seed=args.seed)
+
+        report = {
+            "config": {"items": args.items, "users": args.users, "types": args.types,
+                       "attributes_per_type": args.attributes, "seed": args.seed},
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": {},
+        }
+        results = report["results"]
+        load_results, service = bench_load(directory, args.repeat)
+        results.update(load_results)
+        results.update(bench_search(service, args.queries, args.seed))
+        results.update(bench_login(service, args.queries, args.seed))
+        results.update(bench_save(service, args.repeat))
+        results.update(bench_approve(service, args.approve_batch))
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        if not args.data:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+        print(f"结果已写入 {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare_reports(json.load(file), report)
+    return report
+
+def run_snapshot(args):
+    directory = args.data or tempfile.mkdtemp(prefix="item_revive_bench_")
+    try:
+        if not args.data or not os.path.exists(os.path.join(directory, "items.json")):
+            print(f"生成合成数据: {args.items} 件物品, {args.users} 个用户, {args.types} 个类型")
+            generate_catalog(directory, args.items, args.users, args.types, args.attributes, seed=args.seed)
+        report = {"results": bench_snapshot(directory, args.repeat, args.opens, args.seed), "peak_rss_mb": peak_rss_mb()}
+    finally:
+        if not args.data:
+            shutil.rmtree(directory, ignore_errors=True)
+    print_report(report)
+    return report
+
+def run_matching(args):
+    directory = args.data or tempfile.mkdtemp(prefix="item_revive_bench_")
+    try:
+        if not args.data or not os.path.exists(os.path.join(directory, "items.json")):
+            print(f"生成合成数据: {args.items} 件物品, {args.users} 个用户, {args.types} 个类型")
+            generate_catalog(directory, args.items, args.users, args.types, args.attributes, seed=args.seed)
+        service = open_service(directory)
+        service.load_items()
+        counts = [int(count) for count in args.counts.split(",")]
+        report = {"results": bench_matching(service, counts, args.new_items, args.seed), "peak_rss_mb": peak_rss_mb()}
+    finally:
+        if not args.data:
+            shutil.rmtree(directory, ignore_errors=True)
+    print_report(report)
+    for name, result in report["results"].items():
+        if "mean_hits" in result:
+            print(f"{name}: 平均每件物品命中 {result['mean_hits']:.1f} 条搜索")
+    return report
+
+def run_durability(args):
+    directory = args.data or tempfile.mkdtemp(prefix="item_revive_bench_")
+    try:
+        if not args.data or not os.path.exists(os.path.join(directory, "items.json")):
+            print(f"生成合成数据: {args.items} 件物品, {args.users} 个用户, {args.types} 个类型")
+            generate_catalog(directory, args.items, args.users, args.types, args.attributes, seed=args.seed)
+        batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+        damage_sizes = [int(size) for size in args.damage_sizes.split(",")]
+        report = {"results": bench_durability(directory, args.appends, batch_sizes, damage_sizes, args.seed),
+                  "peak_rss_mb": peak_rss_mb()}
+    finally:
+        if not args.data:
+            shutil.rmtree(directory, ignore_errors=True)
+    print_report(report)
+    for name, result in report["results"].items():
+        if name.startswith("append_"):
+            print(f"{name}: 每件物品 {result['mean_ms'] * result['runs'] / args.appends * 1000:.1f} 微秒")
+        elif "lost_records" in result:
+            print(f"{name}: 丢失 {result['lost_records']} 件物品")
+    return report
+
+def print_report(report):
+    print(f"{'操作':<22} {'次数':>7} {'p50(ms)':>10} {'p90(ms)':>10} {'p99(ms)':>10} {'吞吐(次/秒)':>12}")
+    for name, result in report["results"].items():
+        print(f"{name:<22} {result['runs']:>7} {result['p50_ms']:>10.3f} {result['p90_ms']:>10.3f} "
+              f"{result['p99_ms']:>10.3f} {result['throughput_per_s']:>12.1f}")
+    print(f"峰值内存: {report['peak_rss_mb']:.1f} MB")
+
+# 与之前的结果对比 p50，变慢超过 threshold 的标记出来
+def compare_reports(baseline, current, threshold=1.2):
+    print(f"{'操作':<22} {'基线p50':>10} {'本次p50':>10} {'比例':>8}")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before["p50_ms"]:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"]
+        flag = "  变慢" if ratio > threshold else ""
+        print(f"{name:<22} {before['p50_ms']:>10.3f} {result['p50_ms']:>10.3f} {ratio:>8.2f}{flag}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="物品复活软件基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="生成合成数据")
+    generate_parser.add_argument("directory")
+
+    run_parser = subparsers.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("--data", help="使用（或生成到）该目录中的数据，默认使用临时目录")
+    run_parser.add_argument("--repeat", type=int, default=3, help="加载和快照保存的重复次数")
+    run_parser.add_argument("--queries", type=int, default=2000, help="搜索和登录的次数")
+    run_parser.add_argument("--approve-batch", type=int, default=50, help="每批审核的用户数")
+    run_parser.add_argument("--output", help="结果 JSON 文件")
+    run_parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="比较 JSON 快照与二进制快照")
+    snapshot_parser.add_argument("--data", help="使用（或生成到）该目录中的数据，默认使用临时目录")
+    snapshot_parser.add_argument("--repeat", type=int, default=3, help="整体读取的重复次数")
+    snapshot_parser.add_argument("--opens", type=int, default=2000, help="打开单件物品的次数")
+
+    matching_parser = subparsers.add_parser("matching", help="新物品与保存的搜索匹配")
+    matching_parser.add_argument("--data", help="使用（或生成到）该目录中的数据，默认使用临时目录")
+    matching_parser.add_argument("--counts", default="1000,10000,50000", help="逗号分隔的保存搜索数")
+    matching_parser.add_argument("--new-items", type=int, default=2000, help="参与匹配的新物品数")
+
+    durability_parser = subparsers.add_parser("durability", help="日志落盘代价与损坏快照的抢救")
+    durability_parser.add_argument("--data", help="使用（或生成到）该目录中的数据，默认使用临时目录")
+    durability_parser.add_argument("--appends", type=int, default=2000, help="每种批量追加的物品数")
+    durability_parser.add_argument("--batch-sizes", default="1,10,100", help="逗号分隔的每批物品数")
+    durability_parser.add_argument("--damage-sizes", default="100,10000,1000000", help="逗号分隔的损坏字节数")
+
+    for sub in (generate_parser, run_parser, snapshot_parser, matching_parser, durability_parser):
+        sub.add_argument("--items", type=int, default=100000)
+        sub.add_argument("--users", type=int, default=1000)
+        sub.add_argument("--types", type=int, default=10)
+        sub.add_argument("--attributes", type=int, default=3, help="每个类型的特有属性数")
+        sub.add_argument("--seed", type=int, default=1)
+
+    memory_parser = subparsers.add_parser("memory", help="比较物品对象的内存布局")
+    memory_parser.add_argument("--counts", default="100000,1000000", help="逗号分隔的物品数量")
+    args = parser.parse_args()
+
+    start_memory_tracking()
+    if args.command == "generate":
+        generate_catalog(args.directory, args.items, args.users, args.types, args.attributes, seed=args.seed)
+    elif args.command == "run":
+        run_suite(args)
+    elif args.command == "snapshot":
+        run_snapshot(args)
+    elif args.command == "matching":
+        run_matching(args)
+    elif args.command == "durability":
+        run_durability(args)
+    else:
+        bench_memory([int(count) for count in args.counts.split(",")])
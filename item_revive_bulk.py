@@ -0,0 +1,235 @@
+import argparse
+import collections
+import csv
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import item_revive_v2 as app
+
+BASE_FIELDS = ("name", "description", "location", "contact_phone", "email", "added_by")
+
+# 工作进程中的校验上下文：物品种类 -> (特有属性列表, 结构变更记录)
+validator_types = {}
+
+def init_validator(item_types):
+    global validator_types
+    validator_types = item_types
+
+# 把一行记录校验并规范化成 add_items 使用的字典；JSONL 的行在这里才解析，解析也分摊到工作进程
+# CSV 中属于其他种类的空白列忽略，非空的多余字段报错；id 列忽略，导入时重新编号
+# 带 schema 的记录（导出的结构变更后的物品）先按变更记录升级到当前结构，schema 本身不算属性
+def normalize_row(row):
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"不是合法的 JSON: {e.msg}")
+    if not isinstance(row, dict):
+        raise ValueError("记录必须是 JSON 对象")
+
+    item_type = str(row.get("type") or "").strip()
+    if not item_type:
+        raise ValueError("缺少物品种类")
+    if item_type not in validator_types:
+        raise ValueError(f"未知的物品种类 '{item_type}'")
+    attributes, changes = validator_types[item_type]
+    if row.get("schema") not in (None, ""):
+        try:
+            version = int(row["schema"])
+        except ValueError:
+            raise ValueError(f"结构版本不正确: {row['schema']}")
+        if not 1 <= version <= len(changes) + 1:
+            raise ValueError(f"种类 '{item_type}' 没有第 {version} 版结构")
+        row = app.apply_changes(dict(row, schema=version), changes)
+
+    data = {"type": item_type}
+    for field in BASE_FIELDS:
+        value = row.get(field)
+        data[field] = "" if value is None else str(value).strip()
+    if not data["name"]:
+        raise ValueError("缺少物品名称")
+    for attr in attributes:
+        value = row.get(attr)
+        if value is None:
+            raise ValueError(f"缺少属性 '{attr}'")
+        data[attr] = str(value).strip()
+
+    extra = [key for key, value in row.items()
+             if key not in data and key not in ("id", "schema") and value not in (None, "")]
+    if extra:
+        raise ValueError(f"种类 '{item_type}' 没有这些属性: {', '.join(extra)}")
+    return data
+
+# 校验一块记录，返回 [(行号, 规范化后的记录, 错误信息)]，两者之一为 None
+def validate_rows(rows):
+    results = []
+    for lineno, row in rows:
+        try:
+            results.append((lineno, normalize_row(row), None))
+        except ValueError as e:
+            results.append((lineno, None, str(e)))
+    return results
+
+def detect_format(filename, fmt=None):
+    if fmt:
+        return fmt
+    return "csv" if os.path.splitext(filename)[1].lower() == ".csv" else "jsonl"
+
+# 流式读取输入文件，逐行产出 (行号, 记录)；JSONL 产出原始文本
+def iter_rows(filename, fmt):
+    if fmt == "csv":
+        with open(filename, "r", encoding="utf-8-sig", newline="") as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+    else:
+        with open(filename, "r", encoding="utf-8") as file:
+            for lineno, line in enumerate(file, 1):
+                if line.strip():
+                    yield lineno, line
+
+def iter_chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+# 按块交给进程池校验，按输入顺序产出结果；同时在途的块数有上限，内存占用与文件大小无关
+def validate_stream(rows, item_types, workers=None, chunk_size=1000):
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        init_validator(item_types)
+        for chunk in iter_chunks(rows, chunk_size):
+            yield from validate_rows(chunk)
+        return
+    with ProcessPoolExecutor(workers, initializer=init_validator, initargs=(item_types,)) as pool:
+        pending = collections.deque()
+        for chunk in iter_chunks(rows, chunk_size):
+            pending.append(pool.submit(validate_rows, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+# 导入进度文件：记录已经落盘的批次处理到的行号，导入中断后用 resume 从下一行继续
+def progress_filename(filename):
+    return filename + ".progress"
+
+def read_progress(filename):
+    try:
+        with open(progress_filename(filename), "r", encoding="utf-8") as file:
+            return json.load(file)["line"]
+    except FileNotFoundError:
+        return 0
+
+# 导入物品：校验通过的记录每 batch_size 条通过 add_items 提交一次，校验失败的行逐行报告
+# 整个文件只提交一次需要把所有记录留在内存中，大文件做不到，所以按批提交：中断时已提交的批次保留，
+# 每批落盘后把处理到的行号写进进度文件，resume 为 True 时跳过这些行接着导入，全部完成后删除进度文件
+# 批次落盘后、进度写入前崩溃时，续传会把这一批再导入一次
+# 返回 (导入条数, 失败条数)
+def import_items(service, user, filename, fmt=None, workers=None, batch_size=5000, dry_run=False, resume=False,
+                 errors=sys.stderr):
+    start = read_progress(filename) if resume else 0
+    if not resume and not dry_run and os.path.exists(progress_filename(filename)):
+        raise ValueError(f"上次导入 {filename} 没有完成，请加 --resume 继续，或删除 {progress_filename(filename)} 后重新导入")
+    item_types = {item_type.name: (item_type.attributes, item_type.changes) for item_type in service.item_types}
+    rows = ((lineno, row) for lineno, row in iter_rows(filename, detect_format(filename, fmt)) if lineno > start)
+    imported = failed = 0
+    batch = []
+
+    def commit(lineno):
+        if not dry_run:
+            service.add_items(user, batch)
+            service.durable().result()
+            app.atomic_write_json(progress_filename(filename), {"line": lineno})
+
+    lineno = start
+    for lineno, data, error in validate_stream(rows, item_types, workers):
+        if error is not None:
+            failed += 1
+            print(f"第 {lineno} 行: {error}", file=errors)
+            continue
+        batch.append(data)
+        if len(batch) >= batch_size:
+            commit(lineno)
+            imported += len(batch)
+            batch = []
+    if batch:
+        commit(lineno)
+        imported += len(batch)
+    if not dry_run and os.path.exists(progress_filename(filename)):
+        os.remove(progress_filename(filename))
+    return imported, failed
+
+# 导出物品：逐条从存储流式读出，按种类筛选后直接写文件，不在内存中构建完整列表，也不建立编号表
+# 返回导出条数
+def export_items(storage, filename, fmt=None, item_types=None):
+    selected = [it for it in storage.load_item_types() if not item_types or it.name in item_types]
+    names = {item_type.name for item_type in selected}
+    fmt = detect_format(filename, fmt)
+    count = 0
+    if fmt == "csv":
+        attributes = list(dict.fromkeys(attr for item_type in selected for attr in item_type.attributes))
+        file = open(filename, "w", encoding="utf-8-sig", newline="")
+        writer = csv.DictWriter(file, ["id", "type", *BASE_FIELDS, *attributes], restval="", extrasaction="ignore")
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        file = open(filename, "w", encoding="utf-8")
+        write = lambda data: file.write(json.dumps(data, ensure_ascii=False) + "\n")
+    with file:
+        for item in storage.iter_records():
+            if item.type_name in names:
+                write(item.to_dict())
+                count += 1
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="物品复活软件批量导入导出")
+    parser.add_argument("--storage", choices=["json", "sqlite", "binary"], default="json", help="存储后端")
+    parser.add_argument("--db", default="item_revive.db", help="SQLite 数据库文件")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="从 CSV / JSONL 文件导入物品")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--user", required=True, help="记为该用户添加（记录中没有 added_by 时）")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], help="默认按扩展名判断")
+    import_parser.add_argument("--workers", type=int, help="校验进程数，默认为 CPU 核数")
+    import_parser.add_argument("--batch-size", type=int, default=5000, help="每次提交的物品数")
+    import_parser.add_argument("--dry-run", action="store_true", help="只校验，不写入")
+    import_parser.add_argument("--resume", action="store_true", help="从上次中断的位置继续导入")
+
+    export_parser = commands.add_parser("export", help="导出物品到 CSV / JSONL 文件")
+    export_parser.add_argument("file")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], help="默认按扩展名判断")
+    export_parser.add_argument("--type", action="append", dest="types", help="只导出该种类，可重复指定")
+    args = parser.parse_args()
+
+    service = app.ItemReviveService(app.open_storage(args.storage, args.db))
+    app.exit_on_sigterm()
+    try:
+        if args.command == "import":
+            user = service.get_user(args.user)
+            if user is None:
+                sys.exit(f"用户 '{args.user}' 不存在")
+            service.load_items(lazy=True)  # 只需要编号和索引，完整物品按需读取
+            try:
+                imported, failed = import_items(service, user, args.file, args.format, args.workers,
+                                                args.batch_size, args.dry_run, args.resume)
+            except ValueError as e:
+                sys.exit(str(e))
+            print(f"{'校验通过' if args.dry_run else '导入'} {imported} 件物品，失败 {failed} 行")
+        else:
+            count = export_items(service.storage, args.file, args.format, args.types)
+            print(f"导出 {count} 件物品")
+    finally:
+        service.close()
+    for error in service.take_errors():
+        print(f"保存失败: {error}", file=sys.stderr)
+    for message in service.take_damaged():
+        print(message, file=sys.stderr)
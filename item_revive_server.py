@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import signal
+import time
+import traceback
+from urllib.parse import parse_qs, urlsplit
+
+import item_revive_v2 as app
+
+STATUS_TEXT = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def item_to_json(entry):
+    return entry.hydrate().to_dict()
+
+def user_to_json(user):
+    data = user.to_dict()
+    data.pop("password")
+    return data
+
+# 基于 asyncio 的 HTTP/JSON 服务，所有业务逻辑都交给 ItemReviveService
+# 服务层只操作内存数据，调用很快，直接在事件循环中执行；JSON 后端的写盘在后台线程完成
+class ItemReviveServer:
+    def __init__(self, service, max_page_size=100, max_body_size=1 << 20, idle_timeout=30):
+        self.service = service
+        self.max_page_size = max_page_size
+        self.max_body_size = max_body_size
+        self.idle_timeout = idle_timeout
+        self.routes = {
+            ("POST", "/register"): self.register,
+            ("POST", "/login"): self.login,
+            ("POST", "/logout"): self.logout,
+            ("GET", "/users/pending"): self.pending_users,
+            ("POST", "/users/approve"): self.approve,
+            ("GET", "/item_types"): self.list_item_types,
+            ("POST", "/item_types"): self.add_item_type,
+            ("POST", "/item_types/change"): self.change_item_type,
+            ("POST", "/item_types/expiry"): self.set_item_expiry,
+            ("GET", "/items"): self.list_items,
+            ("GET", "/me/items"): self.my_items,
+            ("GET", "/me/searches"): self.list_searches,
+            ("POST", "/me/searches"): self.save_search,
+            ("DELETE", "/me/searches"): self.delete_search,
+            ("GET", "/me/notifications"): self.notifications,
+            ("POST", "/me/notifications/read"): self.dismiss_notifications,
+            ("GET", "/archive"): self.archived_items,
+            ("POST", "/items"): self.add_item,
+            ("GET", "/items/search"): self.find_items,
+            ("GET", "/items/filter"): self.filter_items,
+            ("GET", "/items/nearby"): self.nearby_items,
+            ("GET", "/metrics"): self.get_metrics,
+            ("POST", "/metrics/profile"): self.set_profile,
+        }
+
+    # 处理一个连接，支持 keep-alive 连续处理多个请求
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.write_response(writer, 400, {"error": "请求格式不正确"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                # 只接受十进制数字，int() 能接受的 "-1"、"+5"、"1_0" 都按格式错误处理
+                length = headers.get("content-length", "") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    await self.write_response(writer, 400, {"error": "Content-Length 不正确"}, False)
+                    break
+                length = int(length)
+                if length > self.max_body_size:
+                    await self.write_response(writer, 413, {"error": "请求体过大"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                start = time.perf_counter()
+                status, payload, extra_headers = await self.dispatch(method, target, headers, body)
+                if app.metrics.enabled:
+                    app.metrics.observe_latency(self.route_label(method, target), time.perf_counter() - start)
+                await self.write_response(writer, status, payload, keep_alive, extra_headers)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # payload 为字符串时按纯文本返回（/metrics 的 Prometheus 格式），否则为 JSON
+    async def write_response(self, writer, status, payload, keep_alive, extra_headers=None):
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                + "".join(f"{name}: {value}\r\n" for name, value in (extra_headers or {}).items())
+                + "\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    # 处理函数一般直接返回 (状态码, 数据)；需要等待工作线程的（如登录）可以写成协程
+    # 返回 (状态码, 数据, 额外的响应头)
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            self.service.sync()  # 其他进程可能改过共享的数据文件
+            data = json.loads(body) if body else {}
+            if url.path.startswith("/items/") and url.path not in ("/items/search", "/items/filter", "/items/nearby"):
+                handler = self.item_routes(method)
+                result = handler(url.path[len("/items/"):], headers, query, data)
+            else:
+                handler = self.routes.get((method, url.path))
+                if handler is None:
+                    if any(path == url.path for _, path in self.routes):
+                        raise HttpError(405, "不支持的请求方法")
+                    raise HttpError(404, "接口不存在")
+                result = handler(headers, query, data)
+            if inspect.isawaitable(result):
+                result = await result
+            status, payload = result
+            return status, payload, {}
+        except HttpError as e:
+            return e.status, {"error": e.message}, {}
+        except app.LoginThrottled as e:
+            return 429, {"error": str(e)}, {"Retry-After": str(e.retry_after)}
+        except PermissionError as e:
+            return 401, {"error": str(e)}, {}
+        except (ValueError, TypeError, KeyError) as e:
+            return 400, {"error": str(e)}, {}
+        except Exception as e:
+            traceback.print_exc()
+            return 500, {"error": str(e)}, {}
+
+    # 指标按路由归类，物品编号和不存在的路径不各自占一个标签
+    def route_label(self, method, target):
+        path = urlsplit(target).path
+        if (method, path) in self.routes:
+            return f"http {method} {path}"
+        if path.startswith("/items/"):
+            return f"http {method} /items/{{id}}"
+        return "http other"
+
+    def item_routes(self, method):
+        if method == "GET":
+            return self.get_item
+        if method == "DELETE":
+            return self.delete_item
+        raise HttpError(405, "不支持的请求方法")
+
+    def current_user(self, headers, admin=False):
+        token = headers.get("authorization", "").removeprefix("Bearer ").strip()
+        username = self.service.sessions.get(token)
+        user = self.service.get_user(username) if username else None
+        if user is None:
+            raise HttpError(401, "请先登录")
+        if admin and user.user_type != "admin":
+            raise HttpError(403, "需要管理员权限")
+        return user
+
+    def page_args(self, query):
+        offset = max(0, int(query.get("offset", 0)))
+        limit = min(self.max_page_size, max(1, int(query.get("limit", self.max_page_size))))
+        return offset, limit
+
+    # 注册不需要登录，哈希密码同样放在工作线程中，否则每次注册都会让所有连接停顿
+    async def register(self, headers, query, data):
+        username, password = data.get("username"), data.get("password")
+        address, contact_info = data.get("address"), data.get("contact_info")
+        if not isinstance(password, str):
+            raise ValueError("请输入所有必填信息")
+        future = self.service.begin_register(username, password, address, contact_info)
+        user = self.service.end_register(username, address, contact_info, await asyncio.wrap_future(future))
+        return 201, user_to_json(user)
+
+    # 密码校验在工作线程中进行，等待期间事件循环继续处理其他连接
+    async def login(self, headers, query, data):
+        username, password = data.get("username"), data.get("password")
+        if not isinstance(username, str) or not isinstance(password, str):
+            raise ValueError("请输入用户名和密码")
+        future = self.service.begin_login(username, password)
+        user = self.service.end_login(username, password, await asyncio.wrap_future(future))
+        token = self.service.sessions.create(user.username)
+        return 200, {"token": token, "user": user_to_json(user)}
+
+    def logout(self, headers, query, data):
+        self.current_user(headers)
+        self.service.sessions.revoke(headers.get("authorization", "").removeprefix("Bearer ").strip())
+        return 200, {}
+
+    def pending_users(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        return 200, {"users": [user_to_json(user) for user in self.service.pending_users()]}
+
+    def approve(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        approved = self.service.approve(data.get("usernames", []))
+        return 200, {"users": [user_to_json(user) for user in approved]}
+
+    def list_item_types(self, headers, query, data):
+        return 200, {"item_types": [{"name": it.name, "attributes": it.attributes, "version": it.version,
+                                     "expires": it.expires} for it in self.service.item_types]}
+
+    def add_item_type(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        item_type = self.service.add_item_type(data.get("name"), data.get("attributes", []))
+        return 201, {"name": item_type.name, "attributes": item_type.attributes}
+
+    # {"name": 种类, "op": "add" / "rename" / "remove", "attr": 属性, "value": 默认值或新属性名}
+    def change_item_type(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        item_type = self.service.change_item_type(data.get("name"), data.get("op"), data.get("attr"), data.get("value"))
+        return 200, {"name": item_type.name, "attributes": item_type.attributes, "version": item_type.version}
+
+    def cursor_args(self, query):
+        cursor = int(query["cursor"]) if query.get("cursor") else None
+        limit = min(self.max_page_size, max(1, int(query.get("limit", self.max_page_size))))
+        return cursor, limit
+
+    # {"name": 种类, "attr": 表示到期日的属性}，attr 为空表示该种类不过期
+    def set_item_expiry(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        item_type = self.service.set_item_expiry(data.get("name"), data.get("attr"))
+        return 200, {"name": item_type.name, "expires": item_type.expires}
+
+    # 归档的物品（管理员），按归档顺序分页
+    def archived_items(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        offset, limit = self.page_args(query)
+        records = list(itertools.islice(self.service.iter_archived(), offset, offset + limit + 1))
+        return 200, {"items": records[:limit], "offset": offset, "limit": limit, "more": len(records) > limit}
+
+    # 传 offset 时按位置分页（兼容旧的调用方）；否则按游标分页，可以用 owner、type 筛选，
+    # 响应中的 next_cursor 作为下一页的 cursor 参数，为 null 表示没有下一页
+    def list_items(self, headers, query, data):
+        if "offset" in query:
+            offset, limit = self.page_args(query)
+            items, total = self.service.list_items(offset, limit)
+            return 200, {"items": [item_to_json(item) for item in items], "total": total, "offset": offset, "limit": limit}
+        cursor, limit = self.cursor_args(query)
+        items, next_cursor, total = self.service.browse_items(cursor, limit, query.get("owner"), query.get("type"))
+        return 200, {"items": [item_to_json(item) for item in items], "total": total, "next_cursor": next_cursor,
+                     "limit": limit}
+
+    def my_items(self, headers, query, data):
+        user = self.current_user(headers)
+        cursor, limit = self.cursor_args(query)
+        items, next_cursor, total = self.service.my_items(user, cursor, limit, query.get("type"))
+        return 200, {"items": [item_to_json(item) for item in items], "total": total, "next_cursor": next_cursor,
+                     "limit": limit}
+
+    def list_searches(self, headers, query, data):
+        user = self.current_user(headers)
+        return 200, {"searches": self.service.list_searches(user)}
+
+    # 保存求购条件：{"type": 种类, "keyword": 关键词, "where": "数量>=10,品牌=华为", "location": 地区}，至少给出一项
+    def save_search(self, headers, query, data):
+        user = self.current_user(headers)
+        search = self.service.save_search(user, data.get("type"), data.get("keyword"), data.get("where", ""),
+                                          data.get("location"))
+        return 201, search
+
+    def delete_search(self, headers, query, data):
+        user = self.current_user(headers)
+        search_id = int(query.get("id", data.get("id", 0)))
+        self.service.delete_search(user, search_id)
+        return 200, {"id": search_id}
+
+    # 未读通知，每条含 seq、命中的搜索编号 search、物品编号 item 及物品名称、种类
+    def notifications(self, headers, query, data):
+        user = self.current_user(headers)
+        return 200, {"notifications": self.service.notifications(user)}
+
+    # {"seq": 序号} 把不超过该序号的通知标为已读，不传时全部标为已读
+    def dismiss_notifications(self, headers, query, data):
+        user = self.current_user(headers)
+        seq = data.get("seq")
+        self.service.dismiss_notifications(user, int(seq) if seq is not None else None)
+        return 200, {}
+
+    # ranked=1 时使用容许错字的排序搜索，此时 type 可以不传
+    def find_items(self, headers, query, data):
+        offset, limit = self.page_args(query)
+        if query.get("ranked") in ("1", "true"):
+            items, total = self.service.search_items(query.get("keyword"), query.get("type"), offset, limit)
+        else:
+            items, total = self.service.find_items(query.get("type"), query.get("keyword"), offset, limit)
+        return 200, {"items": [item_to_json(item) for item in items], "total": total, "offset": offset, "limit": limit}
+
+    # where 参数的格式与界面一致，例如 where=数量>=10,保质期<2025-03-01
+    def filter_items(self, headers, query, data):
+        offset, limit = self.page_args(query)
+        conditions = app.parse_conditions(query.get("where", ""))
+        items, total, facets = self.service.filter_items(query.get("type"), query.get("keyword"), conditions,
+                                                         query.get("location"), offset, limit)
+        return 200, {"items": [item_to_json(item) for item in items], "total": total, "offset": offset,
+                     "limit": limit, "facets": facets}
+
+    # 按与 address 的远近排序；不传 address 时使用当前登录用户的住址
+    def nearby_items(self, headers, query, data):
+        offset, limit = self.page_args(query)
+        address = query.get("address") or self.current_user(headers).address
+        items, total = self.service.items_near(address, query.get("region"), offset, limit)
+        return 200, {"items": [item_to_json(item) for item in items], "total": total, "offset": offset, "limit": limit}
+
+    # 默认返回 Prometheus 文本格式，format=json 时返回 JSON；只有管理员可以查看
+    def get_metrics(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        if query.get("format") == "json":
+            return 200, app.metrics.to_dict()
+        return 200, app.metrics.to_prometheus()
+
+    # {"rate": 抽样比例}，0 表示停止抽样
+    def set_profile(self, headers, query, data):
+        self.current_user(headers, admin=True)
+        app.metrics.set_profile_rate(float(data.get("rate", 0)))
+        return 200, {"rate": float(data.get("rate", 0))}
+
+    # 增删的日志行由后台线程写盘，落盘后再回复，等待期间事件循环照常处理其他请求
+    async def add_item(self, headers, query, data):
+        user = self.current_user(headers)
+        item = self.service.add_item(user, data.get("type"), data.get("name", ""), data.get("description", ""),
+                                     data.get("location", ""), data.get("contact_phone", ""),
+                                     data.get("email", ""), data.get("attributes", {}))
+        await asyncio.wrap_future(self.service.durable())
+        return 201, item_to_json(item)
+
+    def get_item(self, item_id, headers, query, data):
+        return 200, item_to_json(self.service.get_item(int(item_id)))
+
+    async def delete_item(self, item_id, headers, query, data):
+        user = self.current_user(headers)
+        try:
+            self.service.delete_item(int(item_id), user)
+        except PermissionError as e:
+            raise HttpError(403, str(e))
+        await asyncio.wrap_future(self.service.durable())
+        return 200, {"id": int(item_id)}
+
+# 定时把过期物品移到归档文件；一批没处理完时让出事件循环后接着处理下一批
+async def archive_expired(service, interval):
+    while True:
+        try:
+            archived = service.archive_expired()
+        except Exception:
+            traceback.print_exc()
+            archived = []
+        # 存储忙时本批被跳过，过一秒再试
+        await asyncio.sleep(0 if archived else min(1, interval) if service.has_expired() else interval)
+
+async def serve(service, host, port, archive_interval=60):
+    server = ItemReviveServer(service)
+    listener = await asyncio.start_server(server.handle_client, host, port, backlog=1024)
+    print(f"物品复活服务已启动: http://{host}:{port}")
+    archiver = asyncio.create_task(archive_expired(service, archive_interval)) if service.auto_archive else None
+    # 收到 SIGTERM 时和 Ctrl+C 一样正常退出，关闭存储前把排队中的写入落盘
+    stopped = asyncio.Event()
+    if os.name != "nt":
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+    try:
+        async with listener:
+            await stopped.wait()
+    finally:
+        if archiver is not None:
+            archiver.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="物品复活软件 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--storage", choices=["json", "sqlite", "binary"], default="json", help="存储后端")
+    parser.add_argument("--db", default="item_revive.db", help="SQLite 数据库文件")
+    parser.add_argument("--metrics", metavar="FILE", nargs="?", const="",
+                        help="记录运行指标，由 GET /metrics 导出（需要管理员令牌）；给出 FILE 时退出时写入（.prom 为 Prometheus 格式，否则为 JSON）")
+    parser.add_argument("--profile-sample", type=float, default=0, metavar="RATE",
+                        help="按比例抽样用 cProfile 分析被计时的操作（需要 --metrics），也可以通过 POST /metrics/profile 调整")
+    parser.add_argument("--profile-output", default="item_revive.prof", help="cProfile 抽样结果文件")
+    parser.add_argument("--archive", action="store_true", help="定时把过期物品移到归档文件")
+    parser.add_argument("--archive-grace", type=int, default=0, metavar="DAYS", help="过期超过 DAYS 天才归档")
+    parser.add_argument("--archive-interval", type=float, default=60, help="检查过期物品的间隔（秒）")
+    args = parser.parse_args()
+    if args.profile_sample and args.metrics is None:
+        parser.error("--profile-sample 需要同时指定 --metrics")
+    if args.metrics is not None:
+        app.metrics.enable()
+        app.metrics.set_profile_rate(args.profile_sample)
+
+    service = app.ItemReviveService(app.open_storage(args.storage, args.db), args.archive, args.archive_grace)
+    service.migrate_passwords()
+    service.load_items()
+    for message in service.take_damaged():
+        print(message)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.archive_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        if args.metrics:
+            app.metrics.dump(args.metrics)
+        if args.metrics is not None:
+            app.metrics.dump_profile(args.profile_output)
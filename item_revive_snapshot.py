@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import sys
+
+import item_revive_v2 as app
+
+# 二进制快照工具：JSON 与二进制快照互相转换，查看二进制快照的统计、名称和单件物品
+# 查看类命令只读取快照文件本身，不包含日志中还没压缩进快照的修改
+
+def open_snapshot(filename):
+    try:
+        return app.BinarySnapshot(filename)
+    except FileNotFoundError:
+        sys.exit(f"文件 '{filename}' 不存在")
+    except ValueError:
+        sys.exit(f"'{filename}' 不是二进制快照")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="物品复活软件二进制快照工具")
+    parser.add_argument("--item-types", default="item_types.json", help="物品类型文件，写二进制快照时需要")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = commands.add_parser("convert", help="转换快照格式，按扩展名判断（.bin 为二进制）")
+    convert_parser.add_argument("source")
+    convert_parser.add_argument("target")
+
+    info_parser = commands.add_parser("info", help="显示物品数和各种类的物品数")
+    info_parser.add_argument("file")
+
+    names_parser = commands.add_parser("names", help="列出物品编号和名称")
+    names_parser.add_argument("file")
+
+    show_parser = commands.add_parser("show", help="显示一件物品")
+    show_parser.add_argument("file")
+    show_parser.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if os.path.abspath(args.source) == os.path.abspath(args.target):
+            sys.exit("源文件和目标文件不能相同")
+        try:
+            count = app.convert_snapshot(args.source, args.target, args.item_types)
+        except ValueError as e:
+            sys.exit(f"转换失败: {e}")
+        print(f"转换 {count} 件物品: {args.source} -> {args.target}")
+    else:
+        snapshot = open_snapshot(args.file)
+        try:
+            if args.command == "info":
+                print(f"物品数: {len(snapshot)}，文件大小: {os.path.getsize(args.file)} 字节")
+                for info in snapshot.types:
+                    print(f"{info['name']}: {info['count']} 件（结构版本 {info['schema']}，"
+                          f"{info['string_count']} 个不同的字符串）")
+            elif args.command == "names":
+                for item_id, name in snapshot.iter_names():
+                    print(f"{item_id}\t{name}")
+            else:
+                position = snapshot.position_of(args.id)
+                if position is None:
+                    sys.exit(f"物品 {args.id} 不存在")
+                print(json.dumps(snapshot.record(position), ensure_ascii=False, indent=4))
+        finally:
+            snapshot.close()
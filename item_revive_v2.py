@@ -1,11 +1,236 @@
+import time
+STARTUP_BEGIN = time.perf_counter()  # 启动计时起点，用于 --profile-startup
+
+import argparse
+import bisect
+import codecs
+import collections
+import datetime
+import hashlib
+import heapq
+import hmac
+import itertools
 import json
-import tkinter as tk
-from tkinter import simpledialog, messagebox
-from tkinter import font
+import mmap
+import os
+import queue
+import re
+import secrets
+import shutil
+import struct
+import sys
+import threading
+import zlib
 from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# tkinter 只在启动图形界面时才导入，HTTP 服务和基准测试不需要加载它
+tk = simpledialog = messagebox = font = None
+
+def import_tk():
+    global tk, simpledialog, messagebox, font
+    if tk is None:
+        import tkinter as tk
+        from tkinter import simpledialog, messagebox
+        from tkinter import font
+
+# 字体对象按 (字号, 粗细) 缓存共用，不再为每个控件新建一个
+_fonts = {}
 
 def MiSans(size=12, weight="normal"):
-    return font.Font(family="MiSans", size=size, weight=weight)
+    key = (size, weight)
+    if key not in _fonts:
+        _fonts[key] = font.Font(family="MiSans", size=size, weight=weight)
+    return _fonts[key]
+
+# 记录启动各阶段的时间点
+startup_marks = []
+
+def mark_startup(label):
+    startup_marks.append((label, time.perf_counter()))
+
+def print_startup_profile():
+    print("启动耗时分解:")
+    previous = STARTUP_BEGIN
+    for label, moment in startup_marks:
+        print(f"  {label:<12}{(moment - previous) * 1000:>9.1f} ms")
+        previous = moment
+    print(f"  {'合计':<12}{(previous - STARTUP_BEGIN) * 1000:>9.1f} ms")
+
+# 运行指标：各操作的耗时直方图、调用次数、记录大小和写盘字节数
+# 默认关闭，关闭时埋点只多一次属性判断；可以导出为 Prometheus 文本格式或 JSON
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格是 +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum,
+                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], itertools.accumulate(self.counts)))}
+
+# 关闭时使用的空计时器，不必每次新建对象
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Timer:
+    def __init__(self, metrics, op):
+        self.metrics = metrics
+        self.op = op
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe_latency(self.op, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    size_buckets = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+    null_timer = _NullTimer()
+
+    def __init__(self):
+        self.enabled = False
+        self.latencies = {}  # 操作 -> 耗时直方图（秒）
+        self.sizes = {}      # 记录种类 -> 大小直方图（字节）
+        self.counters = {}   # (指标, 标签值) -> 累计值
+        self.lock = threading.Lock()  # 后台写盘线程也会记录
+        self.profile_interval = 0     # 每隔多少次被计时的调用抽样一次 cProfile，0 表示不抽样
+        self.profile_calls = 0
+        self.profile_stats = None     # 累计的 pstats.Stats
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def observe_latency(self, op, seconds):
+        with self.lock:
+            histogram = self.latencies.get(op)
+            if histogram is None:
+                histogram = self.latencies[op] = Histogram(self.latency_buckets)
+            histogram.observe(seconds)
+
+    def observe_size(self, kind, nbytes):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.sizes.get(kind)
+            if histogram is None:
+                histogram = self.sizes[kind] = Histogram(self.size_buckets)
+            histogram.observe(nbytes)
+
+    def count(self, name, amount=1, label=""):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name, label] = self.counters.get((name, label), 0) + amount
+
+    # 用法：with metrics.timer("save_items"): ...
+    def timer(self, op):
+        return _Timer(self, op) if self.enabled else self.null_timer
+
+    # 装饰器：记录函数耗时；开启抽样时每 profile_interval 次调用用 cProfile 跑一次
+    def timed(self, op):
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    if self.profile_interval:
+                        return self._maybe_profile(func, args, kwargs)
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe_latency(op, time.perf_counter() - start)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    # 运行中随时可以调整；rate 为抽样比例，0 表示关闭
+    def set_profile_rate(self, rate):
+        self.profile_interval = round(1 / rate) if rate > 0 else 0
+
+    # POSIX 上收到 SIGUSR1 时在关闭和 rate 之间切换抽样，不必重启进程
+    def install_profile_toggle(self, rate):
+        import signal
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.set_profile_rate(0 if self.profile_interval else rate))
+
+    def _maybe_profile(self, func, args, kwargs):
+        with self.lock:
+            self.profile_calls += 1
+            sample = self.profile_calls % self.profile_interval == 0
+        # 同一线程中已经有 profiler 在运行（嵌套的计时调用）时不再抽样
+        if not sample or sys.getprofile() is not None:
+            return func(*args, **kwargs)
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self.lock:
+                if self.profile_stats is None:
+                    self.profile_stats = pstats.Stats(profiler)
+                else:
+                    self.profile_stats.add(profiler)
+
+    def dump_profile(self, filename):
+        with self.lock:
+            if self.profile_stats is not None:
+                self.profile_stats.dump_stats(filename)
+
+    def to_dict(self):
+        with self.lock:
+            counters = {}
+            for (name, label), value in self.counters.items():
+                counters.setdefault(name, {})[label] = value
+            return {"latency_seconds": {op: histogram.to_dict() for op, histogram in self.latencies.items()},
+                    "record_bytes": {kind: histogram.to_dict() for kind, histogram in self.sizes.items()},
+                    "counters": counters}
+
+    def to_prometheus(self, prefix="item_revive"):
+        data = self.to_dict()
+        lines = []
+        for metric, label, histograms in ((f"{prefix}_operation_seconds", "op", data["latency_seconds"]),
+                                          (f"{prefix}_record_bytes", "kind", data["record_bytes"])):
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in histograms.items():
+                for bound, count in histogram["buckets"].items():
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram["sum"]}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {histogram["count"]}')
+        for name, values in data["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for label, value in values.items():
+                labels = f'{{target="{label}"}}' if label else ""
+                lines.append(f"{prefix}_{name}_total{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    # 扩展名为 .prom 时写 Prometheus 文本格式，否则写 JSON
+    def dump(self, filename):
+        if filename.endswith(".prom"):
+            with open(filename, "w", encoding="utf-8") as file:
+                file.write(self.to_prometheus())
+        else:
+            atomic_write_json(filename, self.to_dict(), ensure_ascii=False, indent=4)
+
+metrics = Metrics()
 
 # 启用高 DPI 支持
 def enable_high_dpi_awareness():
@@ -27,180 +252,4091 @@ def adjust_window_size(root, base_width, base_height):
     new_height = int(base_height * scaling_factor)
     root.geometry(f"{new_width}x{new_height}")
 
-# 定义物品类型类
-class ItemType:
-    def __init__(self, name, attributes):
-        self.name = name
-        self.attributes = attributes
+# 定义物品类型类
+# changes 是结构变更记录：第 i 条把第 i+1 版升级到第 i+2 版，没有变更时为第 1 版
+# 每条为 {"op": "add", "attr": 属性, "default": 默认值}、{"op": "rename", "attr": 原属性, "to": 新属性}
+# 或 {"op": "remove", "attr": 属性}；旧版本的物品记录在读出时按这些记录升级（见 upgrade_record）
+# expires 为表示到期日的特有属性（如食品的保质期），过期的物品会被归档；None 表示不会过期
+class ItemType:
+    def __init__(self, name, attributes, changes=(), expires=None):
+        self.name = name
+        self.attributes = attributes
+        self.changes = list(changes)
+        self.expires = expires
+
+    @property
+    def version(self):
+        return len(self.changes) + 1
+
+    # 属性列表换成新列表，已经生成的物品类仍引用旧列表
+    def apply_change(self, change):
+        attr = change["attr"]
+        if change["op"] == "add":
+            self.attributes = self.attributes + [attr]
+        elif change["op"] == "rename":
+            self.attributes = [change["to"] if a == attr else a for a in self.attributes]
+            if self.expires == attr:
+                self.expires = change["to"]
+        else:
+            self.attributes = [a for a in self.attributes if a != attr]
+            if self.expires == attr:
+                self.expires = None
+        self.changes.append(change)
+
+    def to_dict(self):
+        data = {"name": self.name, "attributes": self.attributes}
+        if self.changes:
+            data["changes"] = self.changes
+        if self.expires:
+            data["expires"] = self.expires
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        return ItemType(data["name"], data["attributes"], data.get("changes", ()), data.get("expires"))
+
+# 定义用户类
+# searches 为用户保存的搜索（求购条件），每条是含 id、category、keyword、conditions、location 的字典
+class User:
+    def __init__(self, username, password, address, contact_info, user_type="user", is_approved=False, searches=()):
+        self.username = username
+        self.password = password
+        self.address = address
+        self.contact_info = contact_info
+        self.user_type = user_type
+        self.is_approved = is_approved
+        self.searches = list(searches)
+
+    def to_dict(self):
+        data = {
+            "username": self.username,
+            "password": self.password,
+            "address": self.address,
+            "contact_info": self.contact_info,
+            "user_type": self.user_type,
+            "is_approved": self.is_approved
+        }
+        if self.searches:
+            data["searches"] = self.searches
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        return User(
+            data["username"],
+            data["password"],
+            data["address"],
+            data["contact_info"],
+            data["user_type"],
+            data["is_approved"],
+            data.get("searches", ())
+        )
+
+# 用户仓库：按用户名建哈希索引，另外维护未批准用户的二级索引
+class UserRepository:
+    def __init__(self, users=()):
+        self.by_username = {}
+        self.pending_users = {}  # 未批准的用户，保持注册顺序
+        for user in users:
+            self.append(user)
+
+    def __iter__(self):
+        return iter(self.by_username.values())
+
+    def __len__(self):
+        return len(self.by_username)
+
+    def __contains__(self, username):
+        return username in self.by_username
+
+    def get(self, username):
+        return self.by_username.get(username)
+
+    def append(self, user):
+        self.by_username[user.username] = user
+        if user.is_approved:
+            self.pending_users.pop(user.username, None)
+        else:
+            self.pending_users[user.username] = user
+
+    def set_approved(self, username, is_approved=True):
+        user = self.by_username[username]
+        user.is_approved = is_approved
+        if is_approved:
+            self.pending_users.pop(username, None)
+        else:
+            self.pending_users[username] = user
+        return user
+
+    def pending(self):
+        return list(self.pending_users.values())
+
+
+# 密码以 PBKDF2-SHA256 哈希保存，格式为 pbkdf2_sha256$迭代次数$盐$哈希值
+# 旧数据中的明文密码在登录成功或后台迁移时换成哈希
+PASSWORD_SCHEME = "pbkdf2_sha256"
+PASSWORD_ITERATIONS = 600000
+
+def hash_password(password, iterations=PASSWORD_ITERATIONS):
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{PASSWORD_SCHEME}${iterations}${salt.hex()}${digest.hex()}"
+
+def is_password_hash(stored):
+    return stored.startswith(PASSWORD_SCHEME + "$")
+
+# 校验密码，返回 (是否正确, 需要替换成的新哈希或 None)
+# 明文记录或迭代次数低于当前设置的哈希在校验通过后顺便重新哈希；耗时较长，在工作线程中调用
+@metrics.timed("check_password")
+def check_password(stored, password):
+    if not is_password_hash(stored):
+        if not hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")):
+            return False, None
+        return True, hash_password(password)
+    scheme, iterations, salt, expected = stored.split("$")
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+    if not hmac.compare_digest(digest.hex(), expected):
+        return False, None
+    return True, hash_password(password) if int(iterations) < PASSWORD_ITERATIONS else None
+
+# 登录会话：令牌在 ttl 秒内没有使用就过期，每次使用后顺延
+# 另外记住最近验证通过的密码指纹（用进程内随机密钥做 HMAC，不落盘），
+# 同一用户在 ttl 内重复登录时不必再做一次 PBKDF2
+class SessionCache:
+    def __init__(self, ttl=1800):
+        self.ttl = ttl
+        self.sessions = {}  # 令牌 -> (用户名, 过期时间)
+        self.verified = {}  # 用户名 -> (密码指纹, 当时的密码哈希, 过期时间)
+        self.key = os.urandom(32)
+
+    def create(self, username):
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = (username, time.monotonic() + self.ttl)
+        return token
+
+    def get(self, token):
+        entry = self.sessions.get(token)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[1] < now:
+            del self.sessions[token]
+            return None
+        self.sessions[token] = (entry[0], now + self.ttl)
+        return entry[0]
+
+    def revoke(self, token):
+        self.sessions.pop(token, None)
+
+    # 清理过期的令牌和密码指纹，登录时顺便调用
+    def prune(self):
+        now = time.monotonic()
+        self.sessions = {token: entry for token, entry in self.sessions.items() if entry[1] >= now}
+        self.verified = {name: entry for name, entry in self.verified.items() if entry[2] >= now}
+
+    def _fingerprint(self, password):
+        return hmac.new(self.key, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def remember(self, user, password):
+        self.verified[user.username] = (self._fingerprint(password), user.password, time.monotonic() + self.ttl)
+
+    # 密码哈希变了（其他进程改过密码）或已过期时不算数
+    def recall(self, user, password):
+        entry = self.verified.get(user.username)
+        if entry is None or entry[1] != user.password or entry[2] < time.monotonic():
+            return False
+        return hmac.compare_digest(entry[0], self._fingerprint(password))
+
+# 按用户名限制登录失败：前 free_attempts 次失败不限制，之后每次失败锁定的秒数翻倍，最长 max_delay 秒
+# 登录成功时清除记录；正常登录只多一次字典查找
+# 登录被限流：仍是 PermissionError，另带需要等待的秒数，服务器据此返回 429 和 Retry-After
+class LoginThrottled(PermissionError):
+    def __init__(self, retry_after):
+        super().__init__(f"登录失败次数过多，请 {retry_after} 秒后再试。")
+        self.retry_after = retry_after
+
+class LoginThrottle:
+    def __init__(self, free_attempts=5, max_delay=300):
+        self.free_attempts = free_attempts
+        self.max_delay = max_delay
+        self.failures = {}  # 用户名 -> (连续失败次数, 解锁时间)
+
+    def check(self, username):
+        entry = self.failures.get(username)
+        if entry is not None:
+            wait = entry[1] - time.monotonic()
+            if wait > 0:
+                raise LoginThrottled(int(wait) + 1)
+
+    def failed(self, username):
+        count = self.failures.get(username, (0, 0))[0] + 1
+        delay = 0 if count < self.free_attempts else min(self.max_delay, 2 ** (count - self.free_attempts))
+        self.failures[username] = (count, time.monotonic() + delay)
+
+    def succeeded(self, username):
+        self.failures.pop(username, None)
+
+# 替换文件后把所在目录也落盘，断电后新的文件名才一定生效（Windows 不能对目录 fsync）
+def fsync_directory(filename):
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# 先写临时文件并落盘，再原子替换目标文件，写到一半崩溃也不会损坏原文件
+def atomic_write_json(filename, data, **kwargs):
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "w", encoding="utf-8") as file:
+        json.dump(data, file, **kwargs)
+        file.flush()
+        os.fsync(file.fileno())
+        metrics.count("bytes_written", file.tell(), os.path.basename(filename))
+    os.replace(temp_filename, filename)
+    fsync_directory(filename)
+
+# 每条记录带 CRC32 校验和：作为最后一个键 "_crc"，覆盖记录中它前面的全部字节
+# JSON 数组（快照、users.json、item_types.json）中的记录按 indent=4 排版，日志中每条记录占一行
+# 读入时核对并去掉校验和；没有校验和的旧记录照常读入
+CHECKSUM_KEY = "_crc"
+RECORD_BOUNDARY = ",\n    {"  # JSON 数组中两条记录的分界，字符串值里不会出现换行
+
+def encode_record(data, ensure_ascii=False):
+    body = json.dumps(data, ensure_ascii=ensure_ascii, indent=4)[:-2].replace("\n", "\n    ").encode("utf-8")
+    return body + b',\n        "_crc": %d\n    }' % zlib.crc32(body)
+
+def encode_line(data):
+    body = json.dumps(data, ensure_ascii=False)[:-1].encode("utf-8")
+    return body + b', "_crc": %d}\n' % zlib.crc32(body)
+
+# raw 为记录的原始字节，data 为解析出的记录；去掉 data 中的校验和，不符时返回 False
+def verify_checksum(raw, data):
+    crc = data.pop(CHECKSUM_KEY, None) if isinstance(data, dict) else None
+    if crc is None:
+        return True
+    end = raw.rfind(b",", 0, raw.rfind(b'"_crc"'))
+    return zlib.crc32(raw[:end]) == crc
+
+# 把记录列表原子地写成 JSON 数组，每条记录带校验和
+def atomic_write_records(filename, records, ensure_ascii=False):
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as file:
+        file.write(b"[")
+        for index, data in enumerate(records):
+            file.write(b",\n    " if index else b"\n    ")
+            file.write(encode_record(data, ensure_ascii))
+        file.write(b"\n]" if records else b"]")
+        file.flush()
+        os.fsync(file.fileno())
+        metrics.count("bytes_written", file.tell(), os.path.basename(filename))
+    os.replace(temp_filename, filename)
+    fsync_directory(filename)
+
+# 保留损坏的原文件供排查，修复时会用抢救出的记录重写它
+def preserve_damaged(filename):
+    try:
+        shutil.copyfile(filename, filename + ".damaged")
+    except FileNotFoundError:
+        pass
+
+# 进程间的建议性文件锁：读时加共享锁，写时加排他锁（Windows 上只有排他锁）
+# 锁加在单独的 .lock 文件上，被保护的数据文件仍然可以原子替换
+class FileLock:
+    def __init__(self, filename, shared=False):
+        self.filename = filename + ".lock"
+        self.shared = shared
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.filename, "a+b")
+        if os.name == "nt":
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if os.name == "nt":
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+
+# 文件签名：替换文件会换 inode，原地修改会改变大小或修改时间；文件不存在时为 None
+def file_signature(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+# 多个进程共用的 JSON 列表文件（users.json、item_types.json），按 key 字段区分记录
+# 记下上次读写时的文件签名和每条记录的内容（base）；保存时在排他锁内比对签名，
+# 文件被其他进程改过就重新读入并逐条合并，只有同一条记录两边改得不一样才算冲突
+# 文件损坏时抢救出完好的记录，记入 damaged；下次保存时先备份原文件，再整体重写
+class SharedJsonFile:
+    def __init__(self, filename, key, ensure_ascii=False):
+        self.filename = filename
+        self.key = key
+        self.ensure_ascii = ensure_ascii
+        self.signature = None
+        self.base = {}            # key -> 上次看到的记录
+        self.remote_changes = []  # 保存时顺带读到的其他进程的修改，等 poll 取走
+        self.damaged = []         # 读到的损坏区域 (文件名, 字节偏移, 长度)，等 take_damaged 取走
+        self.needs_repair = False
+        self.lock = threading.Lock()
+
+    def _read(self):
+        damaged = []
+        try:
+            records = [data for offset, data in iter_json_array(self.filename, damaged=damaged)]
+        except FileNotFoundError:
+            records = []
+        if damaged:
+            self.damaged.extend((self.filename, offset, length) for offset, length in damaged)
+            self.needs_repair = True
+        return {record[self.key]: record for record in records if isinstance(record, dict) and self.key in record}
+
+    def take_damaged(self):
+        with self.lock:
+            damaged, self.damaged = self.damaged, []
+        return damaged
+
+    def _diff(self, current):
+        changes = [("add" if key not in self.base else "update", record)
+                   for key, record in current.items() if self.base.get(key) != record]
+        changes += [("remove", record) for key, record in self.base.items() if key not in current]
+        return changes
+
+    def load(self):
+        with self.lock, FileLock(self.filename, shared=True):
+            self.base = self._read()
+            self.signature = file_signature(self.filename)
+            self.remote_changes = []
+            return list(self.base.values())
+
+    # 提交本进程修改过的记录（key -> 记录），返回冲突的 key；不冲突的修改照常写入
+    def commit(self, changes):
+        with self.lock, FileLock(self.filename):
+            base = self.base
+            if file_signature(self.filename) != self.signature:
+                current = self._read()
+                self.remote_changes.extend(self._diff(current))
+                self.base = current
+            merged = dict(self.base)
+            conflicts = []
+            for key, record in changes.items():
+                if record == base.get(key):
+                    continue  # 本进程没有改动
+                theirs = merged.get(key)
+                if theirs is not None and theirs != base.get(key) and theirs != record:
+                    conflicts.append(key)
+                else:
+                    merged[key] = record
+            if merged != self.base or self.needs_repair:
+                if self.needs_repair:
+                    preserve_damaged(self.filename)
+                    self.needs_repair = False
+                atomic_write_records(self.filename, list(merged.values()), self.ensure_ascii)
+                self.base = merged
+                self.signature = file_signature(self.filename)
+        return conflicts
+
+    # 取出其他进程的修改 [(动作, 记录)]；文件签名没变时只需要一次 stat
+    # pending 中的记录本进程还有修改没写盘，保留原来的 base，提交时才能发现冲突
+    def poll(self, pending=()):
+        with self.lock:
+            if file_signature(self.filename) != self.signature:
+                with FileLock(self.filename, shared=True):
+                    current = self._read()
+                    self.signature = file_signature(self.filename)
+                self.remote_changes.extend(self._diff(current))
+                base = dict(current)
+                for key in pending:
+                    if key in self.base:
+                        base[key] = self.base[key]
+                    else:
+                        base.pop(key, None)
+                self.base = base
+            changes, self.remote_changes = self.remote_changes, []
+        return [(action, record) for action, record in changes if record[self.key] not in pending]
+
+# 保存和加载用户信息
+def save_users(users, filename="users.json"):
+    users_data = [user.to_dict() for user in users]
+    atomic_write_records(filename, users_data, ensure_ascii=True)
+
+def load_users(filename="users.json"):
+    try:
+        return UserRepository(User.from_dict(data) for offset, data in iter_json_array(filename))
+    except FileNotFoundError:
+        return UserRepository()
+
+# 保存和加载物品类型信息
+def save_item_types(item_types, filename="item_types.json"):
+    item_types_data = [it.to_dict() for it in item_types]
+    atomic_write_records(filename, item_types_data)
+
+def load_item_types(filename="item_types.json"):
+    try:
+        return [ItemType.from_dict(it) for offset, it in iter_json_array(filename)]
+    except FileNotFoundError:
+        return []
+
+# 定义抽象基类 Item
+# 使用 __slots__ 存放字段，物品对象不再携带每实例的 __dict__
+class Item(ABC):
+    __slots__ = ("name", "description", "location", "contact_phone", "email", "added_by", "item_id")
+    version = 1  # 物品种类的结构版本，由 create_item_class 覆盖
+
+    def __init__(self, name, description, location, contact_phone, email, added_by, **kwargs):
+        self.name = name
+        self.description = description
+        self.location = location
+        self.contact_phone = contact_phone
+        self.email = email
+        self.added_by = added_by
+        self.item_id = None  # 物品编号，由 ItemJournal 分配
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @property
+    def type_name(self):
+        return self.__class__.__name__
+
+    # 完整物品对象本身就是已加载的，与 LazyItem 接口保持一致
+    def hydrate(self):
+        return self
+
+    @abstractmethod
+    def get_details(self):
+        pass
+
+    def to_dict(self):
+        data = {
+            "name": self.name,
+            "description": self.description,
+            "location": self.location,
+            "contact_phone": self.contact_phone,
+            "email": self.email,
+            "added_by": self.added_by,
+            "type": self.__class__.__name__
+        }
+        if self.item_id is not None:
+            data["id"] = self.item_id
+        if self.version > 1:
+            data["schema"] = self.version
+        for key, value in getattr(self, "__dict__", {}).items():
+            if key not in data:
+                data[key] = value
+        return data
+
+    @staticmethod
+    @metrics.timed("item_from_dict")
+    def from_dict(data):
+        item_type = data.get("type")
+        if item_type in item_classes:
+            item_class = item_classes[item_type]
+            if data.get("schema", 1) < item_class.version:
+                data = upgrade_record(data)
+            args = {
+                "name": data["name"],
+                "description": data["description"],
+                "location": data["location"],
+                "contact_phone": data["contact_phone"],
+                "email": data["email"],
+                "added_by": data["added_by"]
+            }
+            for attr in item_class.attributes:
+                args[attr] = data.get(attr, "")  # 其他进程已经按更新的结构写入、本进程还没同步到
+            item = item_class(**args)
+            item.item_id = data.get("id")
+            return item
+        else:
+            raise ValueError("Unknown item type")
+
+# 动态创建的物品种类类
+# 登记时只记下属性列表，第一次用到某个种类时才真正生成类
+# 结构变更后重新登记，旧的类不再使用，下次用到时按新的属性列表生成
+class ItemClassRegistry(dict):
+    def __init__(self):
+        super().__init__()
+        self.pending = {}  # 已登记但尚未生成的种类 -> (属性列表, 结构变更记录)
+
+    def register(self, name, attributes, changes=()):
+        self.pending[name] = (attributes, list(changes))
+        self.pop(name, None)
+
+    # 后台压缩线程也会用到物品类，两个线程同时生成时以后生成的为准
+    def __missing__(self, name):
+        item_class = create_item_class(name, *self.pending[name])
+        self.pending.pop(name, None)
+        return item_class
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.pending
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+item_classes = ItemClassRegistry()
+
+# 按结构变更记录把旧版本的物品记录升级到种类的当前版本，返回新字典；原记录和文件都不改动
+# 新增的属性取默认值，改名的属性换键，删除的属性去掉
+def upgrade_record(data):
+    item_class = item_classes.get(data.get("type"))
+    return apply_changes(data, item_class.changes) if item_class is not None else data
+
+# 按变更记录 changes 升级一条记录；不依赖已登记的物品类，批量导入的校验进程中也能用
+def apply_changes(data, changes):
+    version = data.get("schema", 1)
+    if version >= len(changes) + 1:
+        return data
+    data = dict(data)
+    for change in changes[version - 1:]:
+        attr = change["attr"]
+        if change["op"] == "add":
+            data.setdefault(attr, change.get("default", ""))
+        elif change["op"] == "rename":
+            if attr in data:
+                data[change["to"]] = data.pop(attr)
+        else:
+            data.pop(attr, None)
+    data["schema"] = len(changes) + 1
+    return data
+
+# 按属性列表生成 __slots__；不是合法标识符的属性名仍放进 __dict__
+def create_item_class(name, attributes, changes=()):
+    def get_details(self):
+        details = (f"物品名称: {self.name}\n"
+                   f"物品说明: {self.description}\n"
+                   f"所在地址: {self.location}\n"
+                   f"联系人手机: {self.contact_phone}\n"
+                   f"邮箱: {self.email}\n"
+                   f"物品种类: {self.__class__.__name__}\n"
+                   f"添加用户名: {self.added_by}\n")
+        for attr in attributes:
+            details += f"{attr}: {getattr(self, attr)}\n"
+        return details
+
+    def to_dict(self):
+        data = super(type(self), self).to_dict()
+        data.update({attr: getattr(self, attr) for attr in attributes})
+        data["type"] = name
+        return data
+
+    def from_dict(data):
+        args = {
+            "name": data["name"],
+            "description": data["description"],
+            "location": data["location"],
+            "contact_phone": data["contact_phone"],
+            "email": data["email"],
+            "added_by": data["added_by"]
+        }
+        for attr in attributes:
+            args[attr] = data.get(attr, "")
+        return type(name, (Item,), args)(**args)
+
+    namespace = {
+        "__init__": lambda self, name, description, location, contact_phone, email, added_by, **kwargs: Item.__init__(self, name, description, location, contact_phone, email, added_by, **kwargs),
+        "get_details": get_details,
+        "to_dict": to_dict,
+        "from_dict": from_dict,
+        "attributes": attributes,  # 存储属性列表
+        "changes": changes,
+        "version": len(changes) + 1
+    }
+    slot_names = tuple(dict.fromkeys(attr for attr in attributes if attr.isidentifier() and attr not in Item.__slots__))
+    if len(slot_names) < len(set(attributes)):
+        slot_names += ("__dict__",)
+    namespace["__slots__"] = slot_names
+    item_class = type(name, (Item,), namespace)
+    item_classes[name] = item_class
+    return item_class
+
+# 流式解析 JSON 数组：按块读取文件，逐个产出 (字节偏移, 元素)，不必一次读入整个文件
+# source 可以是文件名，也可以是已经以二进制方式打开的文件（读完后关闭）
+# 元素带校验和时顺便核对。damaged 为列表时是抢救模式：损坏或校验和不符的元素跳过，
+# 把 (字节偏移, 长度) 记入 damaged，不抛出 ValueError；无效的 UTF-8 字节按原样保留以便计算偏移
+def iter_json_array(source, chunk_size=1 << 16, damaged=None):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+    with open(source, "rb") if isinstance(source, str) else source as file:
+        buffer = ""
+        mark = 0  # buffer 中已经解析完的位置
+        base = 0  # buffer[mark] 在文件中的字节偏移
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            data = end = None
+            if pos < len(buffer):
+                if not started and (buffer[pos] == "[" or damaged is None):
+                    if buffer[pos] != "[":
+                        raise ValueError("文件格式不正确")
+                    started = True
+                    pos += 1
+                    continue
+                if started and buffer[pos] == "]":
+                    return
+                try:
+                    data, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    pass  # 元素被块边界截断，读入下一块后重试
+            if end is not None:
+                raw = buffer[pos:end].encode("utf-8", "surrogateescape")
+                if not verify_checksum(raw, data):
+                    if damaged is None:
+                        raise ValueError("文件格式不正确")
+                    end = None  # 校验和不符，按损坏处理
+            if end is None:
+                # 抢救模式：损坏的元素之后还有分界时直接跳到下一条记录，只多读损坏的部分
+                boundary = buffer.find(RECORD_BOUNDARY, pos + 1) if damaged is not None else -1
+                if boundary >= 0 or (eof and damaged is not None):
+                    stop = boundary + 1 if boundary >= 0 else len(buffer)
+                    offset = base + len(buffer[mark:pos].encode("utf-8", "surrogateescape"))
+                    length = len(buffer[pos:stop].encode("utf-8", "surrogateescape"))
+                    damaged.append((offset, length))
+                    metrics.count("damaged_bytes", length, "json")
+                    if boundary < 0:
+                        return
+                    started = True
+                    base = offset + length
+                    mark = pos = stop
+                    continue
+                if eof:
+                    raise ValueError("文件格式不正确")
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[mark:] + utf8.decode(chunk, final=eof)
+                pos -= mark
+                mark = 0
+                continue
+            offset = base + len(buffer[mark:pos].encode("utf-8", "surrogateescape"))
+            yield offset, data
+            started = True
+            base = offset + len(raw)
+            mark = pos = end
+
+# 读取文件中指定字节偏移处的一个 JSON 值，带校验和时核对并去掉
+def read_json_at(filename, offset, chunk_size=4096):
+    decoder = json.JSONDecoder()
+    with open(filename, "rb") as file:
+        file.seek(offset)
+        data = b""
+        while True:
+            chunk = file.read(chunk_size)
+            data += chunk
+            text = data.decode("utf-8", "surrogateescape")
+            try:
+                value, end = decoder.raw_decode(text)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise ValueError("文件格式不正确")
+                continue
+            if not verify_checksum(text[:end].encode("utf-8", "surrogateescape"), value):
+                raise ValueError("文件格式不正确")
+            return value
+
+# 二进制快照（items.bin）：同一种类的记录共用一张字符串字典，每条记录只存各字段在字典中的序号
+# 文件用 mmap 打开，列名称、按种类计数、读单个物品都只触及需要的字节
+# 布局（小端）：
+#   文件头   魔数 b"IRBS"、格式版本 u32、元数据偏移 u64、元数据长度 u32
+#   每个种类 字符串偏移表 u32[字符串数 + 1]、字符串数据、记录表 u32[记录数 × 字段数]
+#   记录索引 物品编号 u32[n]、种类内行号 u32[n]、种类序号 u16[n]
+#   元数据   JSON：各种类的名称、属性、结构版本、记录数和各表的位置
+# 字段依次为 BINARY_BASE_FIELDS 和种类的特有属性；不是字符串的值以 "\0" 开头按 JSON 存放
+# 每个字符串的 UTF-8 编码后跟一个 0xFF（UTF-8 中不会出现），整体加载时一次解码整块再切分
+SNAPSHOT_MAGIC = b"IRBS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sIQI")
+BINARY_BASE_FIELDS = ("name", "description", "location", "contact_phone", "email", "added_by")
+
+def _write_array(file, values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    file.write(values.tobytes())
+    file.write(b"\0" * (-file.tell() % 4))
+
+# 把记录写成二进制快照，file 为以二进制方式打开的可定位文件；返回 {物品编号: 记录位置}
+# 记录先按种类的当前结构升级；快照中只保留基本字段和当前的特有属性
+def write_binary_snapshot(file, records):
+    types = {}
+    ids = array("I")
+    rows = array("I")
+    type_nos = array("H")
+    positions = {}
+    for data in records:
+        data = upgrade_record(data)
+        state = types.get(data["type"])
+        if state is None:
+            item_class = item_classes.get(data["type"])
+            if item_class is None:
+                raise ValueError(f"未知的物品种类 '{data['type']}'")
+            state = types[data["type"]] = {"no": len(types), "attributes": list(item_class.attributes),
+                                           "schema": item_class.version, "strings": {}, "encoded": [], "rows": array("I"),
+                                           "count": 0}
+        strings = state["strings"]
+        for field in BINARY_BASE_FIELDS + tuple(state["attributes"]):
+            value = data.get(field, "")
+            if not isinstance(value, str) or value.startswith("\0"):
+                value = "\0" + json.dumps(value, ensure_ascii=False)
+            sid = strings.get(value)
+            if sid is None:
+                sid = strings[value] = len(strings)
+                if value.startswith("\0"):
+                    state["encoded"].append(sid)
+            state["rows"].append(sid)
+        positions[data["id"]] = len(ids)
+        ids.append(data["id"])
+        rows.append(state["count"])
+        type_nos.append(state["no"])
+        state["count"] += 1
+
+    file.write(b"\0" * SNAPSHOT_HEADER.size)
+    meta = {"count": len(ids), "types": []}
+    for name, state in types.items():
+        offsets = array("I", [0])
+        blob = []
+        for value in state["strings"]:
+            blob.append(value.encode("utf-8") + b"\xff")
+            offsets.append(offsets[-1] + len(blob[-1]))
+        strings_offset = file.tell()
+        _write_array(file, offsets)
+        blob_offset = file.tell()
+        file.write(b"".join(blob))
+        file.write(b"\0" * (-file.tell() % 4))
+        rows_offset = file.tell()
+        _write_array(file, state["rows"])
+        meta["types"].append({"name": name, "attributes": state["attributes"], "schema": state["schema"],
+                              "count": state["count"], "string_count": len(state["strings"]), "encoded": state["encoded"],
+                              "strings": strings_offset, "blob": blob_offset, "rows": rows_offset})
+    meta["index"] = file.tell()
+    meta["sorted"] = all(ids[i] < ids[i + 1] for i in range(len(ids) - 1))
+    _write_array(file, ids)
+    _write_array(file, rows)
+    _write_array(file, type_nos)
+    meta_offset = file.tell()
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    file.write(meta_bytes)
+    end = file.tell()
+    file.seek(0)
+    file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, meta_offset, len(meta_bytes)))
+    file.seek(end)
+    return positions
+
+# 只读打开二进制快照；source 可以是文件名，也可以是已经以二进制方式打开的文件（映射后关闭）
+class BinarySnapshot:
+    def __init__(self, source):
+        file = open(source, "rb") if isinstance(source, str) else source
+        try:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError("文件格式不正确")  # 空文件
+        finally:
+            file.close()
+        if len(self.mm) < SNAPSHOT_HEADER.size:
+            self.mm.close()
+            raise ValueError("文件格式不正确")
+        magic, version, meta_offset, meta_length = SNAPSHOT_HEADER.unpack_from(self.mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.mm.close()
+            raise ValueError("文件格式不正确")
+        meta = json.loads(self.mm[meta_offset:meta_offset + meta_length])
+        self.views = []
+        self.count = meta["count"]
+        self.types = meta["types"]
+        for info in self.types:
+            info["fields"] = BINARY_BASE_FIELDS + tuple(info["attributes"])
+            info["row"] = struct.Struct(f"<{len(info['fields'])}I")
+        index = meta["index"]
+        self.ids = self._array("I", index, self.count)
+        self.rows = self._array("I", index + 4 * self.count, self.count)
+        self.type_nos = self._array("H", index + 8 * self.count, self.count)
+        self.sorted = meta.get("sorted", False)
+        self.strings = [{} for info in self.types]  # 每个种类已解码的字符串：序号 -> 值
+        self.positions = None
+
+    # 索引表按小端存放；小端机器上直接把映射区看成数组，不复制；否则复制成数组再转换字节序
+    def _array(self, typecode, offset, count, copy=False):
+        size = array(typecode).itemsize * count
+        if sys.byteorder == "little" and not copy:
+            view = memoryview(self.mm)[offset:offset + size].cast(typecode)
+            self.views.append(view)
+            return view
+        values = array(typecode)
+        values.frombytes(self.mm[offset:offset + size])
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def __len__(self):
+        return self.count
+
+    # 映射区上的数组视图要先释放才能关闭映射
+    def close(self):
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.mm.close()
+
+    def count_by_type(self):
+        return {info["name"]: info["count"] for info in self.types}
+
+    def _string(self, type_no, sid):
+        cache = self.strings[type_no]
+        value = cache.get(sid)
+        if value is None:
+            info = self.types[type_no]
+            start, end = struct.unpack_from("<II", self.mm, info["strings"] + 4 * sid)
+            value = self.mm[info["blob"] + start:info["blob"] + end - 1].decode("utf-8")
+            if value.startswith("\0"):
+                value = json.loads(value[1:])
+            cache[sid] = value
+        return value
+
+    # 一次解码某个种类的全部字符串，整体加载时比逐个读快
+    def _load_strings(self, type_no):
+        info = self.types[type_no]
+        end, = struct.unpack_from("<I", self.mm, info["strings"] + 4 * info["string_count"])
+        text = self.mm[info["blob"]:info["blob"] + end].decode("utf-8", "surrogateescape")
+        values = text.split("\udcff")  # 0xFF 解码成这个代理字符
+        values.pop()
+        if len(values) != info["string_count"]:
+            raise ValueError("文件格式不正确")
+        for sid in info["encoded"]:
+            values[sid] = json.loads(values[sid][1:])
+        self.strings[type_no] = dict(enumerate(values))
+        return values
+
+    def _row(self, position):
+        info = self.types[self.type_nos[position]]
+        return info, info["row"].unpack_from(self.mm, info["rows"] + info["row"].size * self.rows[position])
+
+    # 只读名称一列，不解码其他字段
+    def name(self, position):
+        type_no = self.type_nos[position]
+        info = self.types[type_no]
+        sid, = struct.unpack_from("<I", self.mm, info["rows"] + info["row"].size * self.rows[position])
+        return self._string(type_no, sid)
+
+    def type_name(self, position):
+        return self.types[self.type_nos[position]]["name"]
+
+    def iter_names(self):
+        for position in range(self.count):
+            yield self.ids[position], self.name(position)
+
+    # 按记录位置读出一条记录，字段顺序与 Item.to_dict 相同
+    def record(self, position):
+        type_no = self.type_nos[position]
+        info = self.types[type_no]
+        sids = info["row"].unpack_from(self.mm, info["rows"] + info["row"].size * self.rows[position])
+        return self._build(info, position, [self._string(type_no, sid) for sid in sids])
+
+    def _build(self, info, position, values):
+        data = dict(zip(info["fields"], values))
+        data["type"] = info["name"]
+        data["id"] = self.ids[position]
+        if info["schema"] > 1:
+            data["schema"] = info["schema"]
+        return data
+
+    # 编号按升序写入时二分查找，否则第一次查找时建立编号到位置的字典
+    def position_of(self, item_id):
+        if self.sorted:
+            position = bisect.bisect_left(self.ids, item_id)
+            return position if position < self.count and self.ids[position] == item_id else None
+        if self.positions is None:
+            self.positions = {item_id: position for position, item_id in enumerate(self.ids)}
+        return self.positions.get(item_id)
+
+    # 依次产出 (记录位置, 记录)，与 iter_json_array 的 (偏移, 记录) 对应
+    def iter_records(self):
+        tables = [self._load_strings(type_no).__getitem__ for type_no in range(len(self.types))]
+        for position in range(self.count):
+            type_no = self.type_nos[position]
+            info = self.types[type_no]
+            sids = info["row"].unpack_from(self.mm, info["rows"] + info["row"].size * self.rows[position])
+            yield position, self._build(info, position, map(tables[type_no], sids))
+
+# 懒加载模式下的轻量物品记录：只保留编号、名称、种类和在数据源中的位置，需要时再读出完整物品
+class LazyItem:
+    __slots__ = ("item_id", "name", "type_name", "offset", "source")
+
+    def __init__(self, item_id, name, type_name, offset, source):
+        self.item_id = item_id
+        self.name = name
+        self.type_name = type_name
+        self.offset = offset
+        self.source = source
+
+    def hydrate(self):
+        return self.source.hydrate(self)
+
+    def get_details(self):
+        return self.hydrate().get_details()
+
+    def to_dict(self):
+        return self.hydrate().to_dict()
+
+def completed_future(result=None):
+    future = Future()
+    future.set_result(result)
+    return future
+
+# 收到 SIGTERM 时和 Ctrl+C 一样抛出异常退出，finally 中的 close() 照常把排队的写入落盘
+def exit_on_sigterm():
+    if os.name != "nt":
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+# 后台写入线程：把保存操作移出 Tk 主线程
+# 任务按提交顺序执行；相同 key 的待执行任务只保留最新的一个，一连串修改合并成一次写盘
+# 交给后台的修改在写盘之前进程崩溃会丢失（最多是 delay 加上一次写盘的时间）；需要确认落盘的调用方
+# 等 Storage.durable() 返回的 Future。正常退出、Ctrl+C 和 SIGTERM 都会经过 close()，等排队的任务写完
+class PersistenceWorker:
+    def __init__(self, delay=0.05):
+        self.delay = delay  # 收到任务后稍等片刻，把同一批修改攒在一起
+        self.tasks = {}     # key -> 写入函数
+        self.busy = False
+        self.closed = False
+        self.errors = queue.Queue()
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="persistence-worker", daemon=True)
+        self.thread.start()
+
+    def submit(self, key, func):
+        with self.condition:
+            self.tasks[key] = func
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.tasks and not self.closed:
+                    self.condition.wait()
+                if not self.tasks:
+                    return
+                if not self.closed:
+                    self.condition.wait(self.delay)
+                tasks = list(self.tasks.values())
+                self.tasks.clear()
+                self.busy = True
+            for func in tasks:
+                try:
+                    func()
+                except Exception as e:
+                    self.errors.put(e)
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    # 等待所有已提交的写入完成
+    def flush(self):
+        with self.condition:
+            while self.tasks or self.busy:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def take_errors(self):
+        errors = []
+        while not self.errors.empty():
+            errors.append(self.errors.get())
+        return errors
+
+# 物品日志：快照文件 + 追加写日志
+# 每次增删只向日志追加一行 JSON 记录，日志累积到一定条数后再压缩成完整快照
+# 传入 worker 时日志追加和快照压缩都交给后台线程完成，追加返回的 Future 在这批日志行落盘后完成
+# 多个进程可以共用同一组文件：读写都在 items.json.lock 上加建议锁，新物品编号从共享的
+# items.json.ids 中按块领取；日志记录带写入者标识，poll 只取出其他进程追加的记录
+# 快照文件扩展名为 .bin 时使用二进制快照（见 BinarySnapshot），偏移换成记录位置，日志格式不变
+# 日志每行和 JSON 快照的每条记录都带校验和。读到损坏的记录时跳过，其余记录照常加载，
+# 额外的代价只和损坏部分的大小有关；随后的压缩先备份损坏的文件，再用抢救出的记录重写
+# 写到一半崩溃留下的不完整日志行在下次追加前截掉，不必重写快照
+class ItemJournal:
+    id_block_size = 64
+
+    # sync 为 True 时每批日志追加后都 fsync，一批记录（add_items、后台合并的写入）只落盘一次
+    def __init__(self, filename, compact_threshold=1000, worker=None, sync=True):
+        self.filename = filename
+        self.journal_filename = filename + ".journal"
+        self.id_filename = filename + ".ids"
+        self.compact_threshold = compact_threshold
+        self.worker = worker
+        self.sync = sync
+        self.writer = f"{os.getpid()}-{os.urandom(4).hex()}"
+        self.pending = 0  # 上次压缩后本进程追加的记录条数
+        self.torn_tail = False
+        self.next_id = 1
+        self.reserved_ids = iter(())
+        self.lock = threading.Lock()
+        self.generation = 0  # 每次压缩加一，之后追加的记录必须写在压缩之后
+        self.buffers = {}    # generation -> 尚未写盘的日志行
+        self.waiters = {}    # generation -> 等这些日志行落盘的 Future
+        self.last_write = completed_future()  # 最近一次追加的 Future
+        self.loaded = False
+        self.journal_offset = 0         # 日志中已经读过的字节数
+        self.snapshot_signature = None  # 内存中的物品对应的快照文件签名
+        self.offsets = None             # 快照重写后：物品编号 -> 新快照中的字节偏移
+        self.offsets_signature = None
+        self.remote_records = []        # 压缩时读到、还没交给 poll 的其他进程的记录
+        self.needs_resync = False       # 压缩前快照已被其他进程重写，需要整体比对
+        self.rewrites = 0               # 已提交、还没完成的快照重写（压缩或整体替换），期间读快照要等排他锁
+        self.binary = os.path.splitext(filename)[1] == ".bin"
+        self.reader = None              # 二进制快照的只读映射，快照重写后重新打开
+        self.reader_signature = None
+        self.damaged = []               # 读到的损坏区域 (文件名, 字节偏移, 长度)，等 take_damaged 取走
+        self.needs_repair = set()       # 有损坏的快照或日志文件，压缩时先备份
+
+    # 快照中没有编号的旧记录按顺序补编号
+    def assign_id(self, item):
+        if item.item_id is None:
+            item.item_id = self.next_id
+        self.next_id = max(self.next_id, item.item_id + 1)
+
+    # 新物品的编号从共享计数文件中按块领取，多个进程同时添加也不会重复
+    def reserve_id(self):
+        for item_id in self.reserved_ids:
+            return item_id
+        with FileLock(self.id_filename):
+            try:
+                with open(self.id_filename, "r") as file:
+                    start = int(file.read())
+            except (FileNotFoundError, ValueError):
+                start = 0
+            start = max(start, self.next_id)
+            atomic_write_json(self.id_filename, start + self.id_block_size)
+        self.reserved_ids = iter(range(start + 1, start + self.id_block_size))
+        return start
+
+    def allocate_id(self, item):
+        if item.item_id is None:
+            item.item_id = self.reserve_id()
+        self.next_id = max(self.next_id, item.item_id + 1)
+
+    def _record_damage(self, filename, offset, length):
+        if (filename, offset, length) not in self.damaged:
+            self.damaged.append((filename, offset, length))
+            metrics.count("damaged_bytes", length, os.path.basename(filename))
+        self.needs_repair.add(filename)
+
+    def take_damaged(self):
+        with self.lock:
+            damaged, self.damaged = self.damaged, []
+        return damaged
+
+    # 从 start 字节处读出日志中完整的记录，返回 (记录列表, 读到的位置)
+    # 最后一行没有换行说明写入时崩溃，留给下次追加时截掉；中间解析不了或校验和不符的行跳过
+    def _read_records(self, start=0):
+        self.torn_tail = False
+        try:
+            with open(self.journal_filename, "rb") as file:
+                file.seek(start)
+                data = file.read()
+        except FileNotFoundError:
+            return [], start
+        records = []
+        position = 0
+        while position < len(data):
+            end = data.find(b"\n", position)
+            if end < 0:
+                self.torn_tail = True
+                break
+            line = data[position:end]
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict) or not verify_checksum(line, record):
+                    raise ValueError
+            except ValueError:
+                self._record_damage(self.journal_filename, start + position, end + 1 - position)
+            else:
+                records.append(record)
+            position = end + 1
+        return records, start + position
+
+    # 日志记录按编号操作，重复重放结果不变
+    @staticmethod
+    def _replay(records):
+        added = {}
+        deleted = set()
+        for record in records:
+            if record["op"] == "add":
+                item_id = record["item"].get("id")
+                added[item_id] = record["item"]
+                deleted.discard(item_id)
+            elif record["op"] == "delete":
+                added.pop(record["id"], None)
+                deleted.add(record["id"])
+        return added, deleted
+
+    # 依次产出快照加日志后的 (偏移, 记录)；偏移为 None 表示记录来自日志
+    def _iter_state(self, records, snapshot=None):
+        added, deleted = self._replay(records)
+        self.next_id = 1
+        try:
+            for offset, data in self._iter_snapshot(snapshot):
+                if data.get("id") is None:
+                    data["id"] = self.next_id
+                self.next_id = max(self.next_id, data["id"] + 1)
+                if data["id"] in deleted:
+                    continue
+                if data["id"] in added:
+                    yield None, added.pop(data["id"])
+                else:
+                    yield offset, data
+        except FileNotFoundError:
+            pass
+        for data in added.values():
+            self.next_id = max(self.next_id, data["id"] + 1)
+            yield None, data
+
+    def _iter_snapshot(self, snapshot=None):
+        if not self.binary:
+            damaged = []
+            try:
+                yield from iter_json_array(snapshot or self.filename, damaged=damaged)
+            finally:
+                for offset, length in damaged:
+                    self._record_damage(self.filename, offset, length)
+            return
+        reader = BinarySnapshot(snapshot or self.filename)
+        try:
+            yield from reader.iter_records()
+        finally:
+            reader.close()
+
+    # 调用方需持有文件锁
+    def _snapshot_reader(self, signature):
+        if self.reader is None or self.reader_signature != signature:
+            self._close_reader()
+            self.reader = BinarySnapshot(self.filename)
+            self.reader_signature = signature
+        return self.reader
+
+    def _close_reader(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    # 依次产出 (列表项, 完整物品)；lazy 为 True 时快照中的物品以 LazyItem 作为列表项
+    # 在共享锁内读完日志并打开快照，之后的流式解析不再持锁
+    def iter_load(self, lazy=False):
+        with FileLock(self.filename, shared=True), self.lock:
+            records, self.journal_offset = self._read_records()
+            self.pending = len(records)
+            self.snapshot_signature = file_signature(self.filename)
+            self.offsets = self.offsets_signature = None
+            self.remote_records = []
+            self.needs_resync = False
+            self.loaded = True
+            try:
+                snapshot = open(self.filename, "rb")
+            except FileNotFoundError:
+                snapshot = None
+
+        for offset, data in self._iter_state(records, snapshot):
+            item = Item.from_dict(data)
+            metrics.count("records_loaded", 1, "journal" if offset is None else "snapshot")
+            if lazy and offset is not None:
+                yield LazyItem(item.item_id, item.name, item.type_name, offset, self), item
+            else:
+                yield item, item
+
+    # 只读地逐条产出当前的完整物品（快照加日志），不改动加载状态，也不保留列表项；供导出使用
+    def iter_records(self):
+        with FileLock(self.filename, shared=True), self.lock:
+            records, _ = self._read_records()
+            try:
+                snapshot = open(self.filename, "rb")
+            except FileNotFoundError:
+                snapshot = None
+        for offset, data in self._iter_state(records, snapshot):
+            yield Item.from_dict(data)
+
+    def load(self):
+        items = [entry for entry, item in self.iter_load()]
+        if self.needs_repair or self.needs_compaction():
+            self.compact()
+        return items
+
+    # 调用方需持有文件锁；快照被重写过时按编号查新偏移，必要时重新扫描一遍快照
+    def _read_entry(self, entry):
+        signature = file_signature(self.filename)
+        if signature == self.snapshot_signature and self.offsets is None:
+            offset = entry.offset
+        else:
+            if signature != self.offsets_signature:
+                if self.binary:
+                    reader = self._snapshot_reader(signature)
+                    self.offsets = {item_id: position for position, item_id in enumerate(reader.ids)}
+                else:
+                    self.offsets = {data.get("id"): offset for offset, data in self._iter_snapshot()}
+                self.offsets_signature = signature
+            offset = self.offsets.get(entry.item_id)
+            if offset is None:
+                raise ValueError("物品不存在")
+        if self.binary:
+            return self._snapshot_reader(signature).record(offset)
+        data = read_json_at(self.filename, offset)
+        data["id"] = entry.item_id
+        return data
+
+    def hydrate(self, entry):
+        with FileLock(self.filename, shared=True), self.lock:
+            data = self._read_entry(entry)
+        return Item.from_dict(data)
+
+    # 一次加锁读出多件物品
+    def hydrate_many(self, entries):
+        with FileLock(self.filename, shared=True), self.lock:
+            records = [self._read_entry(entry) for entry in entries]
+        return [Item.from_dict(data) for data in records]
+
+    def append_add(self, item):
+        return self.append_adds([item])
+
+    # 一批物品只写一次日志（后台写入时也只落盘一次）；返回这批记录落盘后完成的 Future
+    def append_adds(self, items):
+        for item in items:
+            self.allocate_id(item)
+        return self._append(*[{"op": "add", "item": item.to_dict()} for item in items])
+
+    def append_delete(self, item):
+        return self._append({"op": "delete", "id": item.item_id})
+
+    def append_deletes(self, items):
+        return self._append(*[{"op": "delete", "id": item.item_id} for item in items])
+
+    def _append(self, *records):
+        lines = []
+        for record in records:
+            record["writer"] = self.writer
+            lines.append(encode_line(record))
+            if metrics.enabled:
+                metrics.observe_size("journal_record", len(lines[-1]))
+        self.pending += len(lines)
+        if self.worker is None:
+            self._write_lines(lines)
+            self.last_write = completed_future()
+            return self.last_write
+        future = Future()
+        with self.lock:
+            generation = self.generation
+            self.buffers.setdefault(generation, []).extend(lines)
+            self.waiters.setdefault(generation, []).append(future)
+            self.last_write = future
+        self.worker.submit(("journal", generation), lambda: self._flush_buffer(generation))
+        return future
+
+    # 写完后通知等待的调用方；写盘失败时 Future 带上异常，错误同时留给 take_errors
+    def _flush_buffer(self, generation):
+        with self.lock:
+            lines = self.buffers.pop(generation, [])
+            waiters = self.waiters.pop(generation, [])
+        try:
+            if lines:
+                self._write_lines(lines)
+        except Exception as e:
+            for future in waiters:
+                future.set_exception(e)
+            raise
+        for future in waiters:
+            future.set_result(None)
+
+    def _write_lines(self, lines):
+        with FileLock(self.filename):
+            with open(self.journal_filename, "a+b") as file:
+                self._truncate_torn_tail(file)
+                data = b"".join(lines)
+                file.write(data)
+                metrics.count("bytes_written", len(data), "journal")
+                if self.sync:
+                    file.flush()
+                    with metrics.timer("fsync"):
+                        os.fsync(file.fileno())
+
+    # 截掉上次崩溃时写了一半的最后一行，否则它会和新追加的记录连成一行；只从文件末尾往回读
+    @staticmethod
+    def _truncate_torn_tail(file, chunk_size=4096):
+        size = position = file.seek(0, os.SEEK_END)
+        while position > 0:
+            start = max(0, position - chunk_size)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < size:
+            file.truncate(position)
+            metrics.count("torn_bytes", size - position, "journal")
+
+    # 检查其他进程的修改：返回新记录列表；快照已被其他进程重写时返回 None，需要调用 resync
+    # 文件都没变时只需要两次 stat，不加锁
+    def poll(self):
+        if (not self.remote_records and not self.needs_resync
+                and file_signature(self.filename) == self.snapshot_signature
+                and (file_signature(self.journal_filename) or (0, 0))[1] == self.journal_offset):
+            return []
+        with FileLock(self.filename, shared=True), self.lock:
+            if self.needs_resync or file_signature(self.filename) != self.snapshot_signature:
+                return None
+            records, self.journal_offset = self._read_records(self.journal_offset)
+            remote, self.remote_records = self.remote_records, []
+            return remote + [record for record in records if record.get("writer") != self.writer]
+
+    # 重新扫描快照和日志，返回当前的 {物品编号: 记录}，并更新各物品在快照中的偏移
+    def resync(self):
+        with FileLock(self.filename, shared=True), self.lock:
+            records, self.journal_offset = self._read_records()
+            state = {}
+            offsets = {}
+            for offset, data in self._iter_state(records):
+                state[data["id"]] = data
+                if offset is not None:
+                    offsets[data["id"]] = offset
+            self.snapshot_signature = self.offsets_signature = file_signature(self.filename)
+            self.offsets = offsets
+            self.remote_records = []
+            self.needs_resync = False
+            return state
+
+    def needs_compaction(self):
+        return self.pending >= self.compact_threshold
+
+    # 压缩以磁盘上的快照和日志为准，其他进程追加的记录也会一并写入新快照
+    def compact(self):
+        self.pending = 0
+        self.torn_tail = False
+        with self.lock:
+            self.rewrites += 1
+        if self.worker is None:
+            self._compact()
+            return
+        self.generation += 1
+        self.worker.submit(("compact", self.generation), self._compact)
+
+    @property
+    def busy(self):
+        return self.rewrites > 0
+
+    @metrics.timed("compact")
+    def _compact(self):
+        try:
+            self._compact_locked()
+        finally:
+            with self.lock:
+                self.rewrites -= 1
+
+    def _compact_locked(self):
+        with FileLock(self.filename):
+            if self.loaded and file_signature(self.filename) == self.snapshot_signature:
+                records, end = self._read_records(self.journal_offset)
+                self.remote_records.extend(record for record in records if record.get("writer") != self.writer)
+            elif self.loaded:
+                self.needs_resync = True
+            records, end = self._read_records()
+            # 顺便把旧版本的记录升级到各种类的当前结构
+            self._write_snapshot(upgrade_record(data) for offset, data in self._iter_state(records))
+
+    # 用给定的物品整体替换快照（save_items）；加载之后其他进程改过物品时拒绝覆盖
+    def replace(self, items):
+        items = list(items)
+        self.pending = 0
+        self.torn_tail = False
+        with self.lock:
+            self.rewrites += 1
+        if self.worker is None:
+            self._replace(items)
+            return
+        self.generation += 1
+        self.worker.submit(("compact", self.generation), lambda: self._replace(items))
+
+    @metrics.timed("write_snapshot")
+    def _replace(self, items):
+        try:
+            self._replace_locked(items)
+        finally:
+            with self.lock:
+                self.rewrites -= 1
+
+    def _replace_locked(self, items):
+        with FileLock(self.filename):
+            if self.loaded:
+                records, end = self._read_records(self.journal_offset)
+                if (file_signature(self.filename) != self.snapshot_signature
+                        or any(record.get("writer") != self.writer for record in records)):
+                    raise ValueError("物品已被其他进程修改，请重新加载后再保存")
+            self._write_snapshot(self._read_entry(item) if isinstance(item, LazyItem) else item.to_dict()
+                                 for item in items)
+
+    # 调用方需持有排他锁。先写临时文件再替换，最后清空日志；中途崩溃时重放日志仍然得到相同结果
+    # 逐条写出并记下各物品的新偏移，懒加载的物品按编号查新位置
+    def _write_snapshot(self, records):
+        offsets = {}
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "wb") as file:
+            if self.binary:
+                offsets = write_binary_snapshot(file, records)
+            else:
+                file.write(b"[")
+                for data in records:
+                    file.write(b",\n    " if offsets else b"\n    ")
+                    offsets[data["id"]] = file.tell()
+                    file.write(encode_record(data))
+                file.write(b"\n]" if offsets else b"]")
+            file.flush()
+            os.fsync(file.fileno())
+            metrics.count("bytes_written", file.tell(), "snapshot")
+        with self.lock:
+            for filename in self.needs_repair:
+                preserve_damaged(filename)
+            self.needs_repair = set()
+            self._close_reader()  # Windows 上仍被映射的文件不能替换
+            os.replace(temp_filename, self.filename)
+            open(self.journal_filename, "w", encoding="utf-8").close()
+            fsync_directory(self.filename)
+            self.snapshot_signature = self.offsets_signature = file_signature(self.filename)
+            self.offsets = offsets
+            self.journal_offset = 0
+            self.loaded = True
+
+# 近似子串编辑距离：pattern 与 text 中最接近的一段之间的编辑距离（Sellers 算法）
+# 已经找到完全匹配的一段时提前结束
+def approximate_distance(pattern, text):
+    column = list(range(len(pattern) + 1))
+    best = column[-1]
+    for char in text:
+        diagonal = column[0]
+        column[0] = 0  # 匹配可以从 text 的任意位置开始
+        for i in range(1, len(column)):
+            current = column[i]
+            column[i] = min(current + 1, column[i - 1] + 1, diagonal + (pattern[i - 1] != char))
+            diagonal = current
+        best = min(best, column[-1])
+        if best == 0:
+            break
+    return best
+
+# 查询结果的 LRU 缓存：记下每个查询用到的 n-gram，物品增删时只淘汰与该物品 n-gram 有交集的查询
+# （能出现在结果中的物品至少与关键词共有一个 n-gram，其他查询的结果不受影响）
+class QueryCache:
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()  # 查询 -> (结果, n-gram 集合)
+        self.by_gram = {}                         # n-gram -> 用到它的查询集合
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, results, grams):
+        if key in self.entries:
+            self._evict(key)
+        self.entries[key] = (results, grams)
+        for gram in grams:
+            self.by_gram.setdefault(gram, set()).add(key)
+        while len(self.entries) > self.capacity:
+            self._evict(next(iter(self.entries)))
+
+    def _evict(self, key):
+        results, grams = self.entries.pop(key)
+        for gram in grams:
+            keys = self.by_gram[gram]
+            keys.discard(key)
+            if not keys:
+                del self.by_gram[gram]
+
+    def invalidate(self, grams):
+        for gram in grams & self.by_gram.keys():
+            for key in list(self.by_gram.get(gram, ())):
+                self._evict(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.by_gram.clear()
+
+# 关键词倒排索引：按物品种类分桶，并对搜索字段和特有属性值建单字/双字 n-gram 倒排表
+# 双字 n-gram 能覆盖中文等不分词文本的任意子串匹配
+class KeywordIndex:
+    search_fields = ("name", "description", "added_by")
+    # 排序搜索中各字段的权重，attributes 指物品种类的特有属性值
+    field_weights = (("name", 3.0), ("attributes", 1.5), ("description", 1.0), ("added_by", 0.5))
+    max_candidates = 1000
+
+    def __init__(self):
+        self.by_type = {}   # 物品种类 -> {物品编号: 物品}
+        self.postings = {}  # n-gram -> 物品编号集合
+        self.cache = QueryCache()
+
+    @staticmethod
+    def _text_grams(text):
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        return grams
+
+    def _fields(self, item):
+        fields = {field: [getattr(item, field).lower()] for field in self.search_fields}
+        fields["attributes"] = [str(getattr(item, attr, "")).lower() for attr in getattr(item, "attributes", ())]
+        return fields
+
+    def _grams(self, item):
+        grams = set()
+        for texts in self._fields(item).values():
+            for text in texts:
+                grams.update(self._text_grams(text))
+        return grams
+
+    # entry 是列表中实际保存的对象（懒加载时为 LazyItem），item 为用于建索引的完整物品
+    def add(self, item, entry=None):
+        self.by_type.setdefault(item.type_name, {})[item.item_id] = entry or item
+        grams = self._grams(item)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(item.item_id)
+        self.cache.invalidate(grams)
+
+    def remove(self, entry):
+        self.by_type.get(entry.type_name, {}).pop(entry.item_id, None)
+        grams = self._grams(entry.hydrate())
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(entry.item_id)
+                if not posting:
+                    del self.postings[gram]
+        self.cache.invalidate(grams)
+
+    # 被其他进程删除的物品可能已经读不到完整内容，只从种类表中移除；
+    # 倒排表中残留的编号在 search 中找不到对应物品，会被直接跳过。不知道 n-gram，只能清空缓存
+    def discard(self, entry):
+        self.by_type.get(entry.type_name, {}).pop(entry.item_id, None)
+        self.cache.clear()
+
+    def rebuild(self, items):
+        self.by_type = {}
+        self.postings = {}
+        self.cache.clear()
+        for item in items:
+            self.add(item)
+
+    def _entry(self, item_id):
+        for type_items in self.by_type.values():
+            entry = type_items.get(item_id)
+            if entry is not None:
+                return entry
+        return None
+
+    # 关键词越长允许的错字越多；单个字必须精确出现
+    @staticmethod
+    def max_typos(keyword):
+        return 0 if len(keyword) <= 1 else 1 if len(keyword) <= 4 else 2
+
+    # 排序搜索：先按单字/双字 n-gram 的命中数挑出候选（每个错字最多影响三个 n-gram），
+    # 包含全部 n-gram 的候选都参与打分，其余只取命中最多的 max_candidates 个；再逐字段打分：完全相同 > 前缀 > 子串 > 编辑距离在容许范围内的近似匹配，乘以字段权重相加
+    # 返回按得分从高到低排列的 [(得分, 物品编号)]，结果进入 LRU 缓存
+    def rank(self, keyword, category=None):
+        keyword = keyword.strip().lower()
+        if not keyword:
+            return []
+        key = (category, keyword)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        grams = self._text_grams(keyword)
+        max_typos = self.max_typos(keyword)
+        need = max(1, len(grams) - 3 * max_typos)
+        type_items = self.by_type.get(category, {}) if category else None
+        counts = {}
+        for gram in grams:
+            for item_id in self.postings.get(gram, ()):
+                counts[item_id] = counts.get(item_id, 0) + 1
+        candidates = [item_id for item_id, count in counts.items()
+                      if count >= need and (type_items is None or item_id in type_items)]
+        candidates.sort(key=lambda item_id: (-counts[item_id], item_id))
+        limit = max(self.max_candidates, bisect.bisect_left([-counts[item_id] for item_id in candidates], -len(grams) + 1))
+
+        results = []
+        for item_id in candidates[:limit]:
+            entry = type_items.get(item_id) if type_items is not None else self._entry(item_id)
+            if entry is None:
+                continue
+            score = self._score(keyword, self._fields(entry.hydrate()), max_typos)
+            if score > 0:
+                results.append((round(score, 3), item_id))
+        results.sort(key=lambda pair: (-pair[0], pair[1]))
+        self.cache.put(key, results, grams)
+        return results
+
+    def _score(self, keyword, fields, max_typos):
+        score = 0.0
+        for field, weight in self.field_weights:
+            best = 0.0
+            for text in fields[field]:
+                if text == keyword:
+                    best = 1.0
+                    break
+                if text.startswith(keyword):
+                    best = max(best, 0.8)
+                elif keyword in text:
+                    best = max(best, 0.6)
+                elif max_typos and best < 0.4 and sum(char not in text for char in keyword) <= max_typos:
+                    # 关键词中不在 text 里出现的字数是编辑距离的下界，超出容许范围时不必计算
+                    distance = approximate_distance(keyword, text)
+                    if distance <= max_typos:
+                        best = max(best, 0.4 * (1 - distance / (max_typos + 1)))
+            score += weight * best
+        return score
+
+    def search(self, category, keyword):
+        keyword = keyword.lower()
+        type_items = self.by_type.get(category)
+        if not type_items or not keyword:
+            return []
+
+        if len(keyword) == 1:
+            grams = {keyword}
+        else:
+            grams = {keyword[i:i + 2] for i in range(len(keyword) - 1)}
+
+        # 从最短的倒排表开始求交集
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            posting = self.postings.get(gram)
+            if not posting:
+                return []
+            candidates = set(posting) if candidates is None else candidates & posting
+
+        # n-gram 命中只是候选，还要确认关键词确实是某个字段的子串
+        found_items = []
+        for item_id in sorted(candidates):
+            entry = type_items.get(item_id)
+            if entry is None:
+                continue
+            item = entry.hydrate()
+            if any(keyword in getattr(item, field).lower() for field in self.search_fields):
+                found_items.append(entry)
+        return found_items
+
+# 把 "2025-02-01"、"2025/2/1"、"2025年2月1日" 等日期写法统一成 ISO 格式，不是日期时返回 None
+DATE_PATTERN = re.compile(r"^\s*(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*日?\s*$")
+
+def parse_date(value):
+    match = DATE_PATTERN.match(str(value))
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+def parse_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number == number else None  # 排除 NaN
+
+# 解析 "数量>10, 保质期<2025-03-01, 品牌=华为" 形式的属性条件
+CONDITION_PATTERN = re.compile(r"^\s*(.+?)\s*(>=|<=|=|>|<)\s*(.+?)\s*$")
+
+def parse_conditions(text):
+    conditions = []
+    for part in re.split(r"[,，;；]", text):
+        if not part.strip():
+            continue
+        match = CONDITION_PATTERN.match(part)
+        if not match:
+            raise ValueError(f"无法识别的条件: {part.strip()}")
+        conditions.append(match.groups())
+    return conditions
+
+# 分面索引：按物品种类的特有属性建哈希索引（等值查询、分面计数）
+# 和有序索引（数值、日期的区间查询），地址另建有序索引支持前缀查询
+class FacetIndex:
+    def __init__(self):
+        self.by_type = {}   # 物品种类 -> 物品编号集合
+        self.values = {}    # 属性 -> {属性值: 物品编号集合}
+        self.forward = {}   # 属性 -> {物品编号: 属性值}，用于删除和分面计数
+        self.numbers = {}   # 属性 -> [(数值, 物品编号)]，有序
+        self.dates = {}     # 属性 -> [(ISO 日期, 物品编号)]，有序
+        self.locations = [] # [(地址, 物品编号)]，有序
+        self.item_locations = {}  # 物品编号 -> 地址
+        self.bulk = False   # 批量加载中：有序表只追加，用到时再整体排序
+        self.unsorted = False
+
+    # 逐个 insort 每次都要移动后面的元素，整体加载是 O(N²)；批量加载时先追加，结束时各排序一次
+    def start_bulk(self):
+        self.bulk = True
+
+    def finish_bulk(self):
+        self.bulk = False
+        self._sort()
+
+    # 批量加载中途查询或删除时先排好序；Timsort 对已排好的部分只需线性时间
+    def _sort(self):
+        if self.unsorted:
+            for entries in itertools.chain(self.numbers.values(), self.dates.values(), [self.locations]):
+                entries.sort()
+            self.unsorted = False
+
+    def _insert(self, entries, key):
+        if self.bulk:
+            entries.append(key)
+            self.unsorted = True
+        else:
+            bisect.insort(entries, key)
+
+    def add(self, item):
+        item_id = item.item_id
+        self.by_type.setdefault(item.type_name, set()).add(item_id)
+        for attr in item.attributes:
+            value = getattr(item, attr)
+            self.values.setdefault(attr, {}).setdefault(value, set()).add(item_id)
+            self.forward.setdefault(attr, {})[item_id] = value
+            number = parse_number(value)
+            if number is not None:
+                self._insert(self.numbers.setdefault(attr, []), (number, item_id))
+            date = parse_date(value)
+            if date is not None:
+                self._insert(self.dates.setdefault(attr, []), (date, item_id))
+        self._insert(self.locations, (item.location, item_id))
+        self.item_locations[item_id] = item.location
+
+    @staticmethod
+    def _remove_sorted(entries, key):
+        position = bisect.bisect_left(entries, key)
+        if position < len(entries) and entries[position] == key:
+            del entries[position]
+
+    # 删除只需要物品编号和种类，属性值从正向表中取，不必读出完整物品
+    def remove(self, entry):
+        item_id = entry.item_id
+        self._sort()
+        self.by_type.get(entry.type_name, set()).discard(item_id)
+        for attr, forward in self.forward.items():
+            if item_id not in forward:
+                continue
+            value = forward.pop(item_id)
+            postings = self.values[attr].get(value)
+            if postings is not None:
+                postings.discard(item_id)
+                if not postings:
+                    del self.values[attr][value]
+            number = parse_number(value)
+            if number is not None:
+                self._remove_sorted(self.numbers[attr], (number, item_id))
+            date = parse_date(value)
+            if date is not None:
+                self._remove_sorted(self.dates[attr], (date, item_id))
+        location = self.item_locations.pop(item_id, None)
+        if location is not None:
+            self._remove_sorted(self.locations, (location, item_id))
+
+    def rebuild(self, items):
+        self.__init__()
+        self.start_bulk()
+        for item in items:
+            self.add(item)
+        self.finish_bulk()
+
+    def _range(self, entries, op, key):
+        if op in (">", ">="):
+            start = bisect.bisect_right(entries, (key, float("inf"))) if op == ">" else bisect.bisect_left(entries, (key,))
+            return {item_id for _, item_id in entries[start:]}
+        stop = bisect.bisect_left(entries, (key,)) if op == "<" else bisect.bisect_right(entries, (key, float("inf")))
+        return {item_id for _, item_id in entries[:stop]}
+
+    def _match(self, attr, op, value):
+        if op == "=":
+            return set(self.values.get(attr, {}).get(value, ()))
+        self._sort()
+        number = parse_number(value)
+        if number is not None:
+            return self._range(self.numbers.get(attr, []), op, number)
+        date = parse_date(value)
+        if date is not None:
+            return self._range(self.dates.get(attr, []), op, date)
+        raise ValueError(f"属性 '{attr}' 只能按数值或日期比较大小")
+
+    def _location_prefix(self, prefix):
+        self._sort()
+        start = bisect.bisect_left(self.locations, (prefix,))
+        stop = bisect.bisect_left(self.locations, (prefix + "\U0010ffff",))
+        return {item_id for _, item_id in self.locations[start:stop]}
+
+    # 返回满足全部条件的物品编号集合；candidates 为已有的候选集合（例如关键词结果）
+    def query(self, item_type=None, conditions=(), location=None, candidates=None):
+        sets = []
+        if candidates is not None:
+            sets.append(set(candidates))
+        if item_type:
+            sets.append(self.by_type.get(item_type, set()))
+        for attr, op, value in conditions:
+            sets.append(self._match(attr, op, value))
+        if location:
+            sets.append(self._location_prefix(location))
+        if not sets:
+            return set(self.item_locations)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+            if not result:
+                break
+        return result
+
+    # 统计结果集中各属性值出现的次数
+    def facet_counts(self, item_ids, attributes):
+        counts = {}
+        for attr in attributes:
+            forward = self.forward.get(attr, {})
+            counter = {}
+            for item_id in item_ids:
+                value = forward.get(item_id)
+                if value is not None:
+                    counter[value] = counter.get(value, 0) + 1
+            counts[attr] = dict(sorted(counter.items(), key=lambda pair: -pair[1]))
+        return counts
+
+# 把自由填写的地址拆成 (省, 市, 区县)，识别不出的层级为 None
+# 直辖市没有省一级，省、市两级都记为直辖市本身；"北京朝阳区" 这类省略了"市"的写法也能识别
+# 省级行政区 -> 下辖的地级行政区；地级市只写简称（不带“市”），自治州、地区、盟写全称
+# 直辖市的市和省相同，特别行政区不再细分
+PREFECTURES = {
+    "北京市": "", "天津市": "", "上海市": "", "重庆市": "",
+    "河北省": "石家庄 唐山 秦皇岛 邯郸 邢台 保定 张家口 承德 沧州 廊坊 衡水",
+    "山西省": "太原 大同 阳泉 长治 晋城 朔州 晋中 运城 忻州 临汾 吕梁",
+    "内蒙古自治区": "呼和浩特 包头 乌海 赤峰 通辽 鄂尔多斯 呼伦贝尔 巴彦淖尔 乌兰察布 兴安盟 锡林郭勒盟 阿拉善盟",
+    "辽宁省": "沈阳 大连 鞍山 抚顺 本溪 丹东 锦州 营口 阜新 辽阳 盘锦 铁岭 朝阳 葫芦岛",
+    "吉林省": "长春 吉林 四平 辽源 通化 白山 松原 白城 延边朝鲜族自治州",
+    "黑龙江省": "哈尔滨 齐齐哈尔 鸡西 鹤岗 双鸭山 大庆 伊春 佳木斯 七台河 牡丹江 黑河 绥化 大兴安岭地区",
+    "江苏省": "南京 无锡 徐州 常州 苏州 南通 连云港 淮安 盐城 扬州 镇江 泰州 宿迁",
+    "浙江省": "杭州 宁波 温州 嘉兴 湖州 绍兴 金华 衢州 舟山 台州 丽水",
+    "安徽省": "合肥 芜湖 蚌埠 淮南 马鞍山 淮北 铜陵 安庆 黄山 滁州 阜阳 宿州 六安 亳州 池州 宣城",
+    "福建省": "福州 厦门 莆田 三明 泉州 漳州 南平 龙岩 宁德",
+    "江西省": "南昌 景德镇 萍乡 九江 新余 鹰潭 赣州 吉安 宜春 抚州 上饶",
+    "山东省": "济南 青岛 淄博 枣庄 东营 烟台 潍坊 济宁 泰安 威海 日照 临沂 德州 聊城 滨州 菏泽",
+    "河南省": "郑州 开封 洛阳 平顶山 安阳 鹤壁 新乡 焦作 濮阳 许昌 漯河 三门峡 南阳 商丘 信阳 周口 驻马店 济源",
+    "湖北省": "武汉 黄石 十堰 宜昌 襄阳 鄂州 荆门 孝感 荆州 黄冈 咸宁 随州 恩施土家族苗族自治州 仙桃 潜江 天门",
+    "湖南省": "长沙 株洲 湘潭 衡阳 邵阳 岳阳 常德 张家界 益阳 郴州 永州 怀化 娄底 湘西土家族苗族自治州",
+    "广东省": "广州 韶关 深圳 珠海 汕头 佛山 江门 湛江 茂名 肇庆 惠州 梅州 汕尾 河源 阳江 清远 东莞 中山 潮州 揭阳 云浮",
+    "广西壮族自治区": "南宁 柳州 桂林 梧州 北海 防城港 钦州 贵港 玉林 百色 贺州 河池 来宾 崇左",
+    "海南省": "海口 三亚 三沙 儋州",
+    "四川省": "成都 自贡 攀枝花 泸州 德阳 绵阳 广元 遂宁 内江 乐山 南充 眉山 宜宾 广安 达州 雅安 巴中 资阳 "
+              "阿坝藏族羌族自治州 甘孜藏族自治州 凉山彝族自治州",
+    "贵州省": "贵阳 六盘水 遵义 安顺 毕节 铜仁 黔西南布依族苗族自治州 黔东南苗族侗族自治州 黔南布依族苗族自治州",
+    "云南省": "昆明 曲靖 玉溪 保山 昭通 丽江 普洱 临沧 楚雄彝族自治州 红河哈尼族彝族自治州 文山壮族苗族自治州 "
+              "西双版纳傣族自治州 大理白族自治州 德宏傣族景颇族自治州 怒江傈僳族自治州 迪庆藏族自治州",
+    "西藏自治区": "拉萨 日喀则 昌都 林芝 山南 那曲 阿里地区",
+    "陕西省": "西安 铜川 宝鸡 咸阳 渭南 延安 汉中 榆林 安康 商洛",
+    "甘肃省": "兰州 嘉峪关 金昌 白银 天水 武威 张掖 平凉 酒泉 庆阳 定西 陇南 临夏回族自治州 甘南藏族自治州",
+    "青海省": "西宁 海东 海北藏族自治州 黄南藏族自治州 海南藏族自治州 果洛藏族自治州 玉树藏族自治州 海西蒙古族藏族自治州",
+    "宁夏回族自治区": "银川 石嘴山 吴忠 固原 中卫",
+    "新疆维吾尔自治区": "乌鲁木齐 克拉玛依 吐鲁番 哈密 昌吉回族自治州 博尔塔拉蒙古自治州 巴音郭楞蒙古自治州 "
+                        "克孜勒苏柯尔克孜自治州 伊犁哈萨克自治州 阿克苏地区 喀什地区 和田地区 塔城地区 阿勒泰地区",
+    "台湾省": "", "香港特别行政区": "", "澳门特别行政区": "",
+}
+
+def _region_names():
+    names = {}
+    for province, cities in PREFECTURES.items():
+        short = re.sub(r"(?:壮族|回族|维吾尔)?(?:省|市|自治区|特别行政区)$", "", province)
+        city = province if province.endswith("市") else None
+        names[province] = (province, city, False)
+        names.setdefault(short, (province, city, True))
+        for name in cities.split():
+            if re.search(r"(?:自治州|地区|盟)$", name):
+                names[name] = (province, name, False)
+            else:
+                names[name + "市"] = (province, name + "市", False)
+                names.setdefault(name, (province, name + "市", True))
+    return names
+
+# 名称 -> (省, 市, 是否为省略了“省”“市”的简称)；省名简称优先（“吉林”是省，“吉林市”是市）
+REGION_NAMES = _region_names()
+REGION_NAME_MAX = max(map(len, REGION_NAMES))
+
+# 表中没有的省、市按后缀识别；区县只能按后缀识别，没有后缀的区县名由 LocationIndex 按已见过的区县补全
+LOCATION_PATTERN = re.compile(
+    r"(?P<province>[^省市区县]{1,12}?(?:省|自治区|特别行政区))?"
+    r"(?P<city>[^省市区县]{1,12}?(?:市|自治州|地区|盟))?")
+DISTRICT_PATTERN = re.compile(r"[^省市区县]{1,12}?(?:区|县|旗|市)")
+
+# 从 pos 开始按最长匹配查找省、市名，返回 (结束位置, 省, 市)
+# 简称后面紧跟“区”“县”等说明是区县名的一部分（如“朝阳区”），离路、街等很近说明是街道名（如“中山路”），都不算
+def _match_region(text, pos):
+    for end in range(min(len(text), pos + REGION_NAME_MAX), pos + 1, -1):
+        region = REGION_NAMES.get(text[pos:end])
+        if region is None:
+            continue
+        province, city, short = region
+        if short and (text[end:end + 1] in ("区", "县", "旗") or re.search(r"[路街道巷弄号]", text[end:end + 3])):
+            continue
+        return end, province, city
+    return pos, None, None
+
+# 返回 (省, 市, 区县, 剩余部分)；只写了市（“广州市天河区”“深圳南山区”）时按表补上省
+def split_location(text):
+    text = re.sub(r"\s+", "", str(text or ""))
+    pos, province, city = _match_region(text, 0)
+    if province and not city:
+        end, next_province, next_city = _match_region(text, pos)
+        if next_city and next_province == province:
+            pos, city = end, next_city
+    if not city:
+        match = LOCATION_PATTERN.match(text, pos)
+        province = province or match.group("province")
+        city = match.group("city")
+        pos = match.end()
+        if city:
+            province = REGION_NAMES.get(city, (province,))[0]
+    match = DISTRICT_PATTERN.match(text, pos)
+    district = match.group() if match else None
+    return province, city, district, text[match.end() if match else pos:]
+
+def parse_location(text):
+    return split_location(text)[:3]
+
+# 行政区划索引：省、市、区县三级各建一张 名称 -> 物品编号 的有序表（dict 保持插入顺序）
+# 区县按 (市, 区县) 区分，同名区县可以通过 district_names 一起找到
+# 查某个地区、按与用户住址的远近排序都只需要几次字典查找，与物品总数无关
+class LocationIndex:
+    def __init__(self):
+        self.provinces = {}
+        self.cities = {}
+        self.districts = {}       # (市, 区县) -> {物品编号: None}
+        self.district_names = {}  # 区县 -> {(市, 区县)}
+        self.paths = {}           # 物品编号 -> (省, 市, 区县)，也是按编号顺序的全部物品
+        self.path_cache = {}      # 相同的 (省, 市, 区县) 共用一个元组，地址各不相同时也不会多占内存
+        self.district_short = {}  # 市 -> {省略“区”“县”的区县名: 全称}，由已添加的物品地址得到
+
+    # 没写“区”“县”的区县（“深圳南山”“广州天河体育中心”）按同一城市已见过的区县名补全
+    def parse(self, location):
+        province, city, district, rest = split_location(location)
+        if district is None and city and rest:
+            known = self.district_short.get(city, {})
+            for end in range(min(len(rest), 12), 1, -1):
+                district = known.get(rest[:end])
+                if district:
+                    break
+        path = (province, city, district)
+        return self.path_cache.setdefault(path, path)
+
+    def add(self, item):
+        path = self.parse(item.location)
+        province, city, district = path
+        self.paths[item.item_id] = path
+        if province:
+            self.provinces.setdefault(province, {})[item.item_id] = None
+        if city:
+            self.cities.setdefault(city, {})[item.item_id] = None
+        if district:
+            self.districts.setdefault((city, district), {})[item.item_id] = None
+            self.district_names.setdefault(district, set()).add((city, district))
+            if city and len(district) > 2 and district[-1] in "区县旗":
+                self.district_short.setdefault(city, {})[district[:-1]] = district
+
+    def remove(self, entry):
+        path = self.paths.pop(entry.item_id, None)
+        if path is None:
+            return
+        province, city, district = path
+        for table, key in ((self.provinces, province), (self.cities, city), (self.districts, (city, district))):
+            ids = table.get(key)
+            if ids is not None:
+                ids.pop(entry.item_id, None)
+                if not ids:
+                    del table[key]
+                    if table is self.districts:
+                        self.district_names[district].discard(key)
+
+    def rebuild(self, items):
+        self.__init__()
+        for item in items:
+            self.add(item)
+
+    # 某个省、市或区县中的物品；也可以写完整地址（如 "北京市朝阳区"），取最细的一级
+    # 不是可识别的地区时返回 None
+    def region(self, name):
+        province, city, district = self.parse(name)
+        if district:
+            keys = [(city, district)] if city else self.district_names.get(district, ())
+            tables = [self.districts[key] for key in keys if key in self.districts]
+            if len(tables) == 1:
+                return tables[0]
+            merged = {}
+            for table in tables:
+                merged.update(table)
+            return dict(sorted(merged.items()))
+        if city:
+            return self.cities.get(city, {})
+        if province:
+            return self.provinces.get(province, {})
+        return None
+
+    # 按与 address 的远近依次产出物品编号：同区县、同城市、同省份，最后是其他物品
+    # scope 限定范围（例如某个地区），同一层内按编号顺序
+    def iter_nearby(self, address, scope=None):
+        province, city, district = self.parse(address)
+        scope = self.paths if scope is None else scope
+        tiers = [self.districts.get((city, district)) if district else None,
+                 self.cities.get(city), self.provinces.get(province), scope]
+        done = []
+        for tier in tiers:
+            if not tier:
+                continue
+            for item_id in tier:
+                if (tier is scope or item_id in scope) and not any(item_id in previous for previous in done):
+                    yield item_id
+            done.append(tier)
+
+# 归属索引：按 (添加用户, 种类) 各维护一张有序的物品编号表，None 表示不限
+# 某个用户的物品、某个种类的物品和全部物品都可以用游标（上一页最后一件的编号）分页，
+# 每页只需一次二分查找，期间增删物品不会让后面的页重复或漏掉；判断物品归属只需一次字典查找
+class OwnerIndex:
+    def __init__(self):
+        self.records = {}  # 物品编号 -> (添加用户, 种类)
+        self.lists = {}    # (添加用户或 None, 种类或 None) -> [物品编号]，有序
+
+    @staticmethod
+    def _keys(owner, type_name):
+        return (None, None), (owner, None), (None, type_name), (owner, type_name)
+
+    # 需要完整物品（懒加载的列表项没有 added_by）
+    def add(self, item):
+        item_id = item.item_id
+        if item_id in self.records:
+            return
+        self.records[item_id] = (item.added_by, item.type_name)
+        for key in self._keys(item.added_by, item.type_name):
+            ids = self.lists.get(key)
+            if ids is None:
+                self.lists[key] = [item_id]
+            elif ids[-1] < item_id:
+                ids.append(item_id)  # 加载和新增时编号基本递增，直接追加
+            else:
+                bisect.insort(ids, item_id)
+
+    def remove(self, entry):
+        record = self.records.pop(entry.item_id, None)
+        if record is None:
+            return
+        for key in self._keys(*record):
+            ids = self.lists[key]
+            FacetIndex._remove_sorted(ids, entry.item_id)
+            if not ids:
+                del self.lists[key]
+
+    def rebuild(self, items):
+        self.__init__()
+        for item in items:
+            self.add(item)
+
+    def owner_of(self, item_id):
+        record = self.records.get(item_id)
+        return record[0] if record else None
+
+    def count(self, owner=None, type_name=None):
+        return len(self.lists.get((owner, type_name), ()))
+
+    # 返回 (编号在 cursor 之后的最多 limit 件物品的编号, 下一页的游标)；没有下一页时游标为 None
+    def page(self, cursor=None, limit=50, owner=None, type_name=None):
+        ids = self.lists.get((owner, type_name), [])
+        start = bisect.bisect_right(ids, cursor) if cursor is not None else 0
+        page = ids[start:start + limit]
+        return page, page[-1] if page and start + limit < len(ids) else None
+
+# 到期调度：(到期日, 物品编号) 的最小堆，取出到期的物品只需看堆顶
+# 删除或改期时只改 dates，堆中的旧条目留到弹出时跳过；旧条目太多时按 dates 重建堆
+class ExpiryScheduler:
+    def __init__(self):
+        self.heap = []
+        self.dates = {}  # 物品编号 -> 到期日（ISO 日期）
+
+    def add(self, item_id, date):
+        if self.dates.get(item_id) == date:
+            return
+        self.dates[item_id] = date
+        heapq.heappush(self.heap, (date, item_id))
+        if len(self.heap) > 2 * len(self.dates) + 1000:
+            self.heap = [(date, item_id) for item_id, date in self.dates.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, item_id):
+        self.dates.pop(item_id, None)
+
+    def rebuild(self, entries=()):
+        self.dates = dict(entries)
+        self.heap = [(date, item_id) for item_id, date in self.dates.items()]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _discard_stale(self):
+        while self.heap and self.dates.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    # 最早的到期日，没有会到期的物品时为 None
+    def next_date(self):
+        self._discard_stale()
+        return self.heap[0][0] if self.heap else None
+
+    # 取出到期日早于 today 的物品编号，最多 limit 个，按到期日先后
+    def pop_due(self, today, limit=None):
+        due = []
+        while limit is None or len(due) < limit:
+            self._discard_stale()
+            if not self.heap or self.heap[0][0] >= today:
+                break
+            date, item_id = heapq.heappop(self.heap)
+            del self.dates[item_id]
+            due.append(item_id)
+        return due
+
+# 保存的搜索（求购条件）的匹配引擎：新物品到来时一次找出命中的全部保存搜索，不必逐条重跑查询
+# 每条搜索只登记一个锚点，按选择性从高到低：
+#   1. 关键词中最少见的单字/双字 n-gram、等值条件或可识别的地区（区县、市、省）中最少见的一个，登记在倒排表中；
+#   2. 都没有时取一个大小条件，登记在按 (种类, 属性, 数值或日期, 上界或下界) 分开的有序界值表中；
+#   3. 以上都没有（只限种类，或地址无法识别只能按前缀比较）时才退到物品种类本身
+# 物品按自身的 n-gram、属性值、地区查倒排表，按各属性值在界值表中二分得到界值被满足的搜索，再逐条核对全部条件
+# 只限种类的搜索本来就命中该种类的每件物品；退到种类的搜索中只有按地址前缀的那些需要逐条排除
+class SearchMatcher:
+    compare = {">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+               "<": lambda a, b: a < b, "<=": lambda a, b: a <= b}
+    place_levels = ("province", "city", "district")
+
+    def __init__(self):
+        self.searches = {}  # (用户名, 搜索编号) -> 搜索
+        self.keys = {}      # (用户名, 搜索编号) -> 登记的锚点 (种类或 None, 锚点)
+        self.anchors = {}   # (种类或 None, 锚点) -> {(用户名, 搜索编号)}
+        self.ranges = {}    # (种类或 None, 属性, "number" / "date", "lower" / "upper") -> ([界值], [(用户名, 搜索编号)])，按界值排序
+        self.paths = {}     # 搜索中的地址 -> (省, 市, 区县)，不同搜索写的地区大多相同
+
+    def __len__(self):
+        return len(self.searches)
+
+    # 大小条件的界值：按数值还是按日期比较由条件值决定（与 _condition 相同）；“>”“>=”是下界，“<”“<=”是上界
+    @staticmethod
+    def _bound(op, value):
+        number = parse_number(value)
+        kind, bound = ("number", number) if number is not None else ("date", parse_date(value))
+        if bound is None:
+            return None
+        return kind, "lower" if op.startswith(">") else "upper", bound
+
+    def _place_anchors(self, location):
+        path = self._path(location) if location else (None, None, None)
+        # 区县最细，同名区县由 accepts 再按市核对
+        for level, name in reversed(list(zip(self.place_levels, path))):
+            if name:
+                return [("place", level, name)]
+        return []
+
+    # frequency(锚点) 返回现有物品中带这个锚点的件数，用来挑最少见的锚点
+    def add(self, username, search, frequency=None):
+        key = (username, search["id"])
+        self.remove(*key)
+        category = search.get("category") or None
+        keyword = (search.get("keyword") or "").lower()
+        if len(keyword) == 1:
+            anchors = [("gram", keyword)]
+        else:
+            anchors = [("gram", keyword[i:i + 2]) for i in range(len(keyword) - 1)]
+        conditions = search.get("conditions", ())
+        anchors += [("attr", attr, value) for attr, op, value in conditions if op == "="]
+        anchors += self._place_anchors(search.get("location"))
+        if anchors:
+            anchor = min(anchors, key=frequency) if frequency else anchors[0]
+        else:
+            bounds = [(attr,) + self._bound(op, value) for attr, op, value in conditions
+                      if op != "=" and self._bound(op, value) is not None]
+            anchor = ("range",) + bounds[0] if bounds else ("type",)
+        anchor_key = (category, anchor)
+        if anchor[0] == "range":
+            attr, kind, side, bound = anchor[1:]
+            bounds, keys = self.ranges.setdefault((category, attr, kind, side), ([], []))
+            position = bisect.bisect_right(bounds, bound)
+            bounds.insert(position, bound)
+            keys.insert(position, key)
+        else:
+            self.anchors.setdefault(anchor_key, set()).add(key)
+        self.keys[key] = anchor_key
+        self.searches[key] = search
+
+    def remove(self, username, search_id):
+        key = (username, search_id)
+        anchor_key = self.keys.pop(key, None)
+        if anchor_key is None:
+            return
+        del self.searches[key]
+        category, anchor = anchor_key
+        if anchor[0] == "range":
+            attr, kind, side, bound = anchor[1:]
+            table = (category, attr, kind, side)
+            bounds, keys = self.ranges[table]
+            start, stop = bisect.bisect_left(bounds, bound), bisect.bisect_right(bounds, bound)
+            position = keys.index(key, start, stop)
+            del bounds[position], keys[position]
+            if not bounds:
+                del self.ranges[table]
+            return
+        keys = self.anchors[anchor_key]
+        keys.discard(key)
+        if not keys:
+            del self.anchors[anchor_key]
+
+    def rebuild(self, users, frequency=None):
+        self.__init__()
+        for user in users:
+            for search in user.searches:
+                self.add(user.username, search, frequency)
+
+    # 与 FacetIndex 相同：等值比较原值，大小比较先按数值、再按日期
+    def _condition(self, item, attr, op, value):
+        if attr not in item.attributes:
+            return False
+        actual = getattr(item, attr)
+        if op == "=":
+            return actual == value
+        for parse in (parse_number, parse_date):
+            expected = parse(value)
+            if expected is not None:
+                actual = parse(actual)
+                return actual is not None and self.compare[op](actual, expected)
+        return False
+
+    # 与 filter_items 相同：可识别的省、市、区县按行政区划比较，否则按前缀
+    # item_path 为物品地址解析出的 (省, 市, 区县)
+    def _path(self, location):
+        path = self.paths.get(location)
+        if path is None:
+            path = self.paths[location] = parse_location(location)
+        return path
+
+    def _location(self, item, item_path, location):
+        province, city, district = self._path(location)
+        if district:
+            return district == item_path[2] and (not city or city == item_path[1])
+        if city:
+            return city == item_path[1]
+        if province:
+            return province == item_path[0]
+        return item.location.startswith(location)
+
+    # texts 为物品各搜索字段的小写文本，匹配一件物品时只算一次
+    def accepts(self, search, item, texts=None, item_path=None):
+        category = search.get("category")
+        if category and category != item.type_name:
+            return False
+        keyword = search.get("keyword")
+        if keyword:
+            keyword = keyword.lower()
+            if texts is None:
+                texts = [getattr(item, field).lower() for field in KeywordIndex.search_fields]
+            if not any(keyword in text for text in texts):
+                return False
+        if not all(self._condition(item, *condition) for condition in search.get("conditions", ())):
+            return False
+        location = search.get("location")
+        return not location or self._location(item, item_path or parse_location(item.location), location)
+
+    # 返回物品命中的 [(用户名, 搜索)]，不通知用户自己添加的物品
+    def match(self, item):
+        texts = [getattr(item, field).lower() for field in KeywordIndex.search_fields]
+        probes = {("type",)}
+        for text in texts:
+            probes.update(("gram", gram) for gram in KeywordIndex._text_grams(text))
+        probes.update(("attr", attr, getattr(item, attr)) for attr in item.attributes)
+        item_path = parse_location(item.location)
+        probes.update(("place", level, name) for level, name in zip(self.place_levels, item_path) if name)
+        values = {}  # (属性, 数值或日期) -> 物品的值
+        if self.ranges:
+            for attr in item.attributes:
+                for kind, parse in (("number", parse_number), ("date", parse_date)):
+                    value = parse(getattr(item, attr))
+                    if value is not None:
+                        values[attr, kind] = value
+        found = []
+        for category in (item.type_name, None):
+            candidates = [key for probe in probes for key in self.anchors.get((category, probe), ())]
+            # 下界不超过物品值的、上界不低于物品值的搜索，严格不等号由 accepts 核对
+            for (attr, kind), value in values.items():
+                bounds, keys = self.ranges.get((category, attr, kind, "lower"), ((), ()))
+                candidates += keys[:bisect.bisect_right(bounds, value)]
+                bounds, keys = self.ranges.get((category, attr, kind, "upper"), ((), ()))
+                candidates += keys[bisect.bisect_left(bounds, value):]
+            for key in candidates:
+                if key[0] != item.added_by and self.accepts(self.searches[key], item, texts, item_path):
+                    found.append(key)
+        return [(username, self.searches[username, search_id]) for username, search_id in sorted(found)]
+
+# 冷存储：归档的物品按 JSON Lines 追加到单独的文件，不参与加载和搜索
+# 每行为 {"archived": 归档日期, "reason": 原因, "item": 物品记录}；同一物品出现多次时以最后一行为准
+class ArchiveStore:
+    def __init__(self, filename):
+        self.filename = filename
+
+    # 先把记录写入并落盘，再从热数据中删除；中途崩溃时物品最多在两边各有一份
+    def append(self, records, reason="expired"):
+        archived = datetime.date.today().isoformat()
+        lines = [json.dumps({"archived": archived, "reason": reason, "item": data}, ensure_ascii=False) + "\n"
+                 for data in records]
+        with FileLock(self.filename):
+            with open(self.filename, "ab") as file:
+                file.write("".join(lines).encode("utf-8"))
+                file.flush()
+                os.fsync(file.fileno())
+        metrics.count("bytes_written", sum(len(line.encode("utf-8")) for line in lines), "archive")
+
+    # 依次产出归档记录，末尾写了一半的行忽略
+    def iter_records(self):
+        latest = {}
+        try:
+            with FileLock(self.filename, shared=True), open(self.filename, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    latest.pop(record["item"]["id"], None)
+                    latest[record["item"]["id"]] = record
+        except FileNotFoundError:
+            return
+        yield from latest.values()
+
+# 通知队列：保存的搜索命中新物品时给搜索的主人追加通知，按用户分开，按序号先后排列
+# 存成 JSON Lines 文件，多个进程都可以追加；每行是一条通知，或某个用户“已读到第几号”的标记
+# 各进程记住读到的位置，之后只读新追加的部分；已读的行占大半时整理文件，第一行记下最大序号
+class NotificationQueue:
+    compact_threshold = 1000
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.inode = None
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.lines = 0
+        self.last_seq = 0
+        self.acked = {}    # 用户名 -> 已读到的序号
+        self.pending = {}  # 用户名 -> {序号: 通知}
+
+    def _apply(self, record):
+        self.lines += 1
+        if "last" in record:
+            self.last_seq = max(self.last_seq, record["last"])
+            return
+        username = record["user"]
+        if "ack" in record:
+            self.acked[username] = max(self.acked.get(username, 0), record["ack"])
+            queue = self.pending.get(username, {})
+            for seq in [seq for seq in queue if seq <= record["ack"]]:
+                del queue[seq]
+            if not queue:
+                self.pending.pop(username, None)
+        else:
+            self.last_seq = max(self.last_seq, record["seq"])
+            if record["seq"] > self.acked.get(username, 0):
+                self.pending.setdefault(username, {})[record["seq"]] = record
+
+    # 读入其他进程新追加的行；文件被整理过（换了 inode 或变短）时从头读，末尾写了一半的行留到下次
+    def _refresh(self):
+        try:
+            file = open(self.filename, "rb")
+        except FileNotFoundError:
+            self.inode = None
+            self._reset()
+            return
+        with file:
+            stat = os.fstat(file.fileno())
+            if stat.st_ino != self.inode or stat.st_size < self.offset:
+                self.inode = stat.st_ino
+                self._reset()
+            if stat.st_size == self.offset:
+                return
+            file.seek(self.offset)
+            data = file.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue
+        self.offset += end
+
+    def _append(self, records):
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.filename, "ab") as file:
+            file.write(data)
+        metrics.count("bytes_written", len(data), "notifications")
+
+    # notifications 为不含序号的通知字典（含 user），一次写入，返回编好序号的通知
+    def append(self, notifications):
+        if not notifications:
+            return []
+        with self.lock, FileLock(self.filename):
+            self._refresh()
+            records = []
+            for notification in notifications:
+                self.last_seq += 1
+                records.append(dict(notification, seq=self.last_seq))
+            self._append(records)
+            self._refresh()
+        return records
+
+    def pending_for(self, username):
+        with self.lock, FileLock(self.filename, shared=True):
+            self._refresh()
+            return sorted(self.pending.get(username, {}).values(), key=lambda record: record["seq"])
+
+    # 把 username 序号不超过 seq 的通知标为已读
+    def ack(self, username, seq):
+        with self.lock, FileLock(self.filename):
+            self._refresh()
+            if seq <= self.acked.get(username, 0):
+                return
+            self._append([{"user": username, "ack": seq}])
+            self._refresh()
+            live = sum(len(queue) for queue in self.pending.values())
+            if self.lines > self.compact_threshold and self.lines > 2 * live:
+                self._compact()
+
+    def _compact(self):
+        records = [{"last": self.last_seq}]
+        records += sorted((record for queue in self.pending.values() for record in queue.values()),
+                          key=lambda record: record["seq"])
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, self.filename)
+        self.inode = None
+        self._refresh()
+
+# 存储层：用户、物品类型和物品的持久化接口，可切换 JSON 文件或 SQLite 后端
+class Storage(ABC):
+    @abstractmethod
+    def load_users(self):
+        pass
+
+    @abstractmethod
+    def save_user(self, user):
+        pass
+
+    @abstractmethod
+    def save_users(self, users):
+        pass
+
+    @abstractmethod
+    def load_item_types(self):
+        pass
+
+    @abstractmethod
+    def add_item_type(self, item_type):
+        pass
+
+    @abstractmethod
+    def save_item_types(self, item_types):
+        pass
+
+    # 逐个产出 (列表项, 完整物品)；lazy 为 True 时列表项是只含名称和种类的 LazyItem
+    @abstractmethod
+    def iter_items(self, lazy=False):
+        pass
+
+    def load_items(self):
+        return [entry for entry, item in self.iter_items()]
+
+    # 逐个产出完整物品，不建立列表项和编号表，内存占用与物品数无关（导出用）
+    def iter_records(self):
+        for entry, item in self.iter_items():
+            yield item
+
+    @abstractmethod
+    def hydrate(self, entry):
+        pass
+
+    # 读出多件物品的完整内容；已经是完整物品的直接返回
+    def hydrate_items(self, entries):
+        return [entry.hydrate() for entry in entries]
+
+    # 后台正在重写数据文件，此时读物品会等待；可以推迟的工作（如归档）先不做
+    def busy(self):
+        return False
+
+    @abstractmethod
+    def add_item(self, item):
+        pass
+
+    # 批量添加，各后端尽量在一次提交中写入
+    def add_items(self, items):
+        for item in items:
+            self.add_item(item)
+
+    @abstractmethod
+    def delete_item(self, item):
+        pass
+
+    def delete_items(self, items):
+        for item in items:
+            self.delete_item(item)
+
+    # 把物品移到冷存储：先把完整记录写入归档文件，再从热数据中删除
+    def archive_items(self, items, reason="expired"):
+        self.archive.append([item.to_dict() for item in self.hydrate_items(items)], reason)
+        self.delete_items(items)
+
+    def iter_archived(self):
+        return self.archive.iter_records()
+
+    # 保存的搜索命中新物品后的通知，按用户排队；返回编好序号的通知
+    def push_notifications(self, notifications):
+        return self.notifications.append(notifications)
+
+    def pending_notifications(self, username):
+        return self.notifications.pending_for(username)
+
+    # 把用户序号不超过 seq 的通知标为已读
+    def ack_notifications(self, username, seq):
+        self.notifications.ack(username, seq)
+
+    # 物品种类结构变更后，在后台把该种类的旧记录改写成新结构；读出时本来就会升级，不改写也不影响正确性
+    def compact_items(self, item_type):
+        pass
+
+    @abstractmethod
+    def save_items(self, items):
+        pass
+
+    # 按编号游标分页读取物品，可以限定添加用户和种类，返回 (当前页, 下一页的游标, 总数)
+    # 不需要先加载全部物品；没有可用的磁盘索引时返回 None，由服务层用内存中的归属索引分页
+    def page_items(self, cursor=None, limit=50, owner=None, item_type=None):
+        return None
+
+    # 等待后台写入完成
+    def flush(self):
+        pass
+
+    # 返回 Future：此前的增删全部落盘后完成。写入在调用线程同步完成的后端直接返回已完成的 Future；
+    # 界面和服务器在回复“已保存”之前等它，而不是在调用线程里等磁盘
+    def durable(self):
+        return completed_future()
+
+    # 取出后台写入时发生的错误，由界面线程显示
+    def take_errors(self):
+        return []
+
+    # 取出读入时发现的损坏区域 [(文件名, 字节偏移, 长度)]，损坏的记录已被跳过
+    def take_damaged(self):
+        return []
+
+    # 取出其他进程写入的修改 [(主题, 动作, 数据)]：users / item_types 为记录字典，
+    # 物品的 add 为 (列表项, 完整物品)，remove 为物品编号
+    def poll_changes(self):
+        return []
+
+    def close(self):
+        pass
+
+# JSON 文件后端：沿用原有的 users.json / item_types.json / items.json（物品走追加日志）
+# 传入 worker 时所有写盘都在后台线程进行，写入前在调用线程取好数据快照
+# 多个进程可以同时使用同一组文件：用户和物品类型按记录合并保存，物品日志按编号重放
+class JsonStorage(Storage):
+    def __init__(self, users_filename="users.json", item_types_filename="item_types.json", items_filename="items.json", worker=None):
+        self.users_filename = users_filename
+        self.item_types_filename = item_types_filename
+        self.items_filename = items_filename
+        self.worker = worker
+        self.users_file = SharedJsonFile(users_filename, "username", ensure_ascii=True)
+        self.item_types_file = SharedJsonFile(item_types_filename, "name")
+        self.journal = ItemJournal(items_filename, worker=worker)
+        self.archive = ArchiveStore(items_filename + ".archive")
+        self.notifications = NotificationQueue(items_filename + ".notifications")
+        self.users = UserRepository()
+        self.item_types = []
+        self.items_by_id = {}  # 当前全部物品（或 LazyItem），同步时用来去重
+        self.lock = threading.Lock()
+        self.user_changes = {}       # 尚未写盘的用户修改：用户名 -> 记录
+        self.item_type_changes = {}  # 尚未写盘的物品类型修改：名称 -> 记录
+
+    def load_users(self):
+        self.users = UserRepository(User.from_dict(data) for data in self.users_file.load())
+        return self.users
+
+    def _write(self, key, func, *args):
+        if self.worker is None:
+            func(*args)
+        else:
+            self.worker.submit(key, lambda: func(*args))
+
+    # 在后台线程中取出累积的修改并合并写盘；与其他进程冲突的记录不写入，报告给界面
+    def _commit(self, shared_file, changes_attr, description):
+        with self.lock:
+            changes = getattr(self, changes_attr)
+            setattr(self, changes_attr, {})
+        conflicts = shared_file.commit(changes)
+        if conflicts:
+            raise ValueError(f"{description} {', '.join(conflicts)} 已被其他进程修改，本次修改未保存")
+
+    def save_user(self, user):
+        self.save_users([user])
+
+    def save_users(self, users):
+        with self.lock:
+            for user in users:
+                if user.username not in self.users:
+                    self.users.append(user)
+                self.user_changes[user.username] = user.to_dict()
+        self._write("users", self._commit, self.users_file, "user_changes", "用户")
+
+    def load_item_types(self):
+        self.item_types = [ItemType.from_dict(data) for data in self.item_types_file.load()]
+        return self.item_types
+
+    def add_item_type(self, item_type):
+        if item_type not in self.item_types:
+            self.item_types.append(item_type)
+        self.save_item_types([item_type], replace=False)
+
+    def save_item_types(self, item_types, replace=True):
+        if replace:
+            self.item_types = item_types
+        with self.lock:
+            for item_type in item_types:
+                self.item_type_changes[item_type.name] = item_type.to_dict()
+        self._write("item_types", self._commit, self.item_types_file, "item_type_changes", "物品类型")
+
+    def iter_records(self):
+        return self.journal.iter_records()
+
+    def iter_items(self, lazy=False):
+        self.items_by_id = {}
+        for entry, item in self.journal.iter_load(lazy):
+            self.items_by_id[entry.item_id] = entry
+            yield entry, item
+        if self.journal.needs_repair or self.journal.needs_compaction():
+            self.journal.compact()
+
+    def hydrate(self, entry):
+        return self.journal.hydrate(entry)
+
+    def hydrate_items(self, entries):
+        lazy = [entry for entry in entries if isinstance(entry, LazyItem)]
+        items = dict(zip((entry.item_id for entry in lazy), self.journal.hydrate_many(lazy))) if lazy else {}
+        return [items.get(entry.item_id, entry) for entry in entries]
+
+    def busy(self):
+        return self.journal.busy
+
+    # 压缩在后台线程中进行，写新快照时顺便把旧版本的记录升级
+    def compact_items(self, item_type):
+        self.journal.compact()
+
+    def add_item(self, item):
+        self.add_items([item])
+
+    def add_items(self, items):
+        self.journal.append_adds(items)
+        for item in items:
+            self.items_by_id[item.item_id] = item
+        if self.journal.needs_compaction():
+            self.journal.compact()
+
+    def delete_item(self, item):
+        self.journal.append_delete(item)
+        self.items_by_id.pop(item.item_id, None)
+        if self.journal.needs_compaction():
+            self.journal.compact()
+
+    def delete_items(self, items):
+        self.journal.append_deletes(items)
+        for item in items:
+            self.items_by_id.pop(item.item_id, None)
+        if self.journal.needs_compaction():
+            self.journal.compact()
+
+    @metrics.timed("save_items")
+    def save_items(self, items):
+        for item in items:
+            self.journal.allocate_id(item)
+        self.items_by_id = {item.item_id: item for item in items}
+        self.journal.replace(items)
+
+    # 先读物品日志再读物品类型：日志中出现的新种类一定已经写进了 item_types.json
+    def poll_changes(self):
+        records = self.journal.poll()
+        with self.lock:
+            pending_item_types = set(self.item_type_changes)
+            pending_users = set(self.user_changes)
+        changes = []
+        for action, data in self.item_types_file.poll(pending_item_types):
+            if action != "remove":
+                if data["name"] not in item_classes:
+                    item_classes.register(data["name"], data["attributes"], data.get("changes", ()))
+                changes.append(("item_types", action, data))
+        for action, data in self.users_file.poll(pending_users):
+            if action != "remove":
+                changes.append(("users", action, data))
+
+        if records is None:
+            changes.extend(self._resync_items())
+            return changes
+        for record in records:
+            if record["op"] == "add":
+                item = Item.from_dict(record["item"])
+                if item.item_id not in self.items_by_id:
+                    self.items_by_id[item.item_id] = item
+                    changes.append(("items", "add", (item, item)))
+            elif self.items_by_id.pop(record["id"], None) is not None:
+                changes.append(("items", "remove", record["id"]))
+        return changes
+
+    # 快照被其他进程重写后按编号整体比对；先等本进程的写入落盘，磁盘上的状态才完整
+    def _resync_items(self):
+        self.flush()
+        state = self.journal.resync()
+        changes = []
+        for item_id in [item_id for item_id in self.items_by_id if item_id not in state]:
+            del self.items_by_id[item_id]
+            changes.append(("items", "remove", item_id))
+        for item_id, data in state.items():
+            if item_id not in self.items_by_id:
+                item = Item.from_dict(data)
+                self.items_by_id[item_id] = item
+                changes.append(("items", "add", (item, item)))
+        return changes
+
+    def flush(self):
+        if self.worker is not None:
+            self.worker.flush()
+
+    # 后台按提交顺序写日志，最近一次追加落盘时之前的也都已落盘
+    def durable(self):
+        return self.journal.last_write
+
+    def take_errors(self):
+        return self.worker.take_errors() if self.worker is not None else []
+
+    def take_damaged(self):
+        return self.users_file.take_damaged() + self.item_types_file.take_damaged() + self.journal.take_damaged()
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.close()
+
+# SQLite 后端（WAL 模式）：单行事务读写，按种类、添加用户、地址建索引
+# 各物品种类的特有属性存放在 JSON 列中，并为每个属性建表达式索引
+class SQLiteStorage(Storage):
+    base_fields = ("name", "description", "location", "contact_phone", "email", "added_by")
+
+    def __init__(self, filename="item_revive.db"):
+        self.filename = filename
+        self.archive = ArchiveStore(filename + ".archive")
+        self.notifications = NotificationQueue(filename + ".notifications")
+        import sqlite3
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.create_schema()
+        self.closing = threading.Event()
+        self.compactions = []  # 后台改写旧记录的线程
+        self.errors = queue.Queue()
+
+    def create_schema(self):
+        with self.conn:
+            # 旧数据库的 item_types 表没有结构变更记录列
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(item_types)")]
+            if columns and "changes" not in columns:
+                self.conn.execute("ALTER TABLE item_types ADD COLUMN changes TEXT NOT NULL DEFAULT '[]'")
+            if columns and "expires" not in columns:
+                self.conn.execute("ALTER TABLE item_types ADD COLUMN expires TEXT")
+                self.conn.execute("DROP TRIGGER IF EXISTS trg_item_types_update")  # 下面按新条件重建
+            # 旧数据库的 users 表没有保存的搜索列
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(users)")]
+            if columns and "searches" not in columns:
+                self.conn.execute("ALTER TABLE users ADD COLUMN searches TEXT NOT NULL DEFAULT '[]'")
+                self.conn.execute("DROP TRIGGER IF EXISTS trg_users_update")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password TEXT NOT NULL,
+                    address TEXT NOT NULL,
+                    contact_info TEXT NOT NULL,
+                    user_type TEXT NOT NULL,
+                    is_approved INTEGER NOT NULL,
+                    searches TEXT NOT NULL DEFAULT '[]'
+                );
+                CREATE INDEX IF NOT EXISTS idx_users_is_approved ON users(is_approved);
+                CREATE TABLE IF NOT EXISTS item_types (
+                    name TEXT PRIMARY KEY,
+                    attributes TEXT NOT NULL,
+                    changes TEXT NOT NULL DEFAULT '[]',
+                    expires TEXT
+                );
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    contact_phone TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    added_by TEXT NOT NULL,
+                    attributes TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_items_type ON items(type);
+                CREATE INDEX IF NOT EXISTS idx_items_added_by ON items(added_by);
+                CREATE INDEX IF NOT EXISTS idx_items_location ON items(location);
+
+                -- 变更记录：由触发器写入，其他进程按序号增量读取
+                CREATE TABLE IF NOT EXISTS changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    op TEXT NOT NULL
+                );
+                CREATE TRIGGER IF NOT EXISTS trg_users_insert AFTER INSERT ON users BEGIN
+                    INSERT INTO changes (topic, key, op) VALUES ('users', NEW.username, 'add');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_users_update AFTER UPDATE ON users
+                WHEN OLD.password IS NOT NEW.password OR OLD.address IS NOT NEW.address
+                    OR OLD.contact_info IS NOT NEW.contact_info OR OLD.user_type IS NOT NEW.user_type
+                    OR OLD.is_approved IS NOT NEW.is_approved OR OLD.searches IS NOT NEW.searches BEGIN
+                    INSERT INTO changes (topic, key, op) VALUES ('users', NEW.username, 'update');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_item_types_insert AFTER INSERT ON item_types BEGIN
+                    INSERT INTO changes (topic, key, op) VALUES ('item_types', NEW.name, 'add');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_item_types_update AFTER UPDATE ON item_types
+                WHEN OLD.changes IS NOT NEW.changes OR OLD.expires IS NOT NEW.expires BEGIN
+                    INSERT INTO changes (topic, key, op) VALUES ('item_types', NEW.name, 'update');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_items_insert AFTER INSERT ON items BEGIN
+                    INSERT INTO changes (topic, key, op) VALUES ('items', NEW.id, 'add');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_items_delete AFTER DELETE ON items BEGIN
+                    INSERT INTO changes (topic, key, op) VALUES ('items', OLD.id, 'remove');
+                END;
+            """)
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self.last_change = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def is_empty(self):
+        row = self.conn.execute("SELECT (SELECT COUNT(*) FROM users) + (SELECT COUNT(*) FROM item_types)").fetchone()
+        return row[0] == 0
+
+    @staticmethod
+    def _json_path(attr):
+        # 属性名可能是中文或含引号，生成 '$."属性名"' 形式的 SQL 字面量
+        path = '$."' + attr.replace('"', '\\"') + '"'
+        return "'" + path.replace("'", "''") + "'"
+
+    def _create_attribute_indexes(self, item_type):
+        for attr in item_type.attributes:
+            digest = hashlib.md5(f"{item_type.name}\0{attr}".encode("utf-8")).hexdigest()[:12]
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_items_attr_{digest} "
+                f"ON items(type, json_extract(attributes, {self._json_path(attr)}))"
+            )
+
+    @staticmethod
+    def _row_to_user(row):
+        return User(*row[:5], is_approved=bool(row[5]), searches=json.loads(row[6]))
+
+    def load_users(self):
+        rows = self.conn.execute("SELECT username, password, address, contact_info, user_type, is_approved, searches "
+                                 "FROM users ORDER BY rowid")
+        return UserRepository(self._row_to_user(row) for row in rows)
+
+    def _upsert_user(self, user):
+        self.conn.execute("""
+            INSERT INTO users (username, password, address, contact_info, user_type, is_approved, searches)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(username) DO UPDATE SET
+                password = excluded.password,
+                address = excluded.address,
+                contact_info = excluded.contact_info,
+                user_type = excluded.user_type,
+                is_approved = excluded.is_approved,
+                searches = excluded.searches
+        """, (user.username, user.password, user.address, user.contact_info, user.user_type, int(user.is_approved),
+              json.dumps(user.searches, ensure_ascii=False)))
+
+    def save_user(self, user):
+        with self.conn:
+            self._upsert_user(user)
+
+    def save_users(self, users):
+        with self.conn:
+            for user in users:
+                self._upsert_user(user)
+
+    def load_item_types(self):
+        rows = self.conn.execute("SELECT name, attributes, changes, expires FROM item_types ORDER BY rowid")
+        return [ItemType(name, json.loads(attributes), json.loads(changes), expires)
+                for name, attributes, changes, expires in rows]
+
+    def _upsert_item_type(self, item_type):
+        self.conn.execute(
+            "INSERT INTO item_types (name, attributes, changes, expires) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET attributes = excluded.attributes, changes = excluded.changes, "
+            "expires = excluded.expires",
+            (item_type.name, json.dumps(item_type.attributes, ensure_ascii=False),
+             json.dumps(item_type.changes, ensure_ascii=False), item_type.expires))
+        self._create_attribute_indexes(item_type)
+
+    def add_item_type(self, item_type):
+        with self.conn:
+            self._upsert_item_type(item_type)
+
+    def save_item_types(self, item_types):
+        with self.conn:
+            for item_type in item_types:
+                self._upsert_item_type(item_type)
+
+    def _row_to_item(self, row):
+        data = json.loads(row[8])
+        data.update(zip(("id", "type") + self.base_fields, row[:8]))
+        return Item.from_dict(data)
+
+    def _select_items(self, where="", params=(), limit=None):
+        rows = self.conn.execute(
+            "SELECT id, type, name, description, location, contact_phone, email, added_by, attributes "
+            f"FROM items {where} ORDER BY id" + (f" LIMIT {int(limit)}" if limit else ""), params)
+        return [self._row_to_item(row) for row in rows]
+
+    def iter_items(self, lazy=False, page_size=1000):
+        # 按主键分页读取，只读到开始时的最大编号，避免加载过程中新插入的物品重复出现
+        last_id = 0
+        self.last_change = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        max_id = self.conn.execute("SELECT MAX(id) FROM items").fetchone()[0] or 0
+        while last_id < max_id:
+            items = self._select_items("WHERE id > ? AND id <= ?", (last_id, max_id), limit=page_size)
+            if not items:
+                break
+            for item in items:
+                if lazy:
+                    yield LazyItem(item.item_id, item.name, item.type_name, item.item_id, self), item
+                else:
+                    yield item, item
+            last_id = items[-1].item_id
+
+    def hydrate(self, entry):
+        return self._select_items("WHERE id = ?", (entry.item_id,))[0]
+
+    def _insert_item(self, item):
+        data = item.to_dict()
+        attributes = {attr: data[attr] for attr in item.attributes}
+        if "schema" in data:
+            attributes["schema"] = data["schema"]  # 结构版本和特有属性一起存在 JSON 列中
+        cursor = self.conn.execute(
+            "INSERT OR REPLACE INTO items (id, type, name, description, location, contact_phone, email, added_by, attributes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (item.item_id, data["type"]) + tuple(data[field] for field in self.base_fields)
+            + (json.dumps(attributes, ensure_ascii=False),))
+        item.item_id = cursor.lastrowid
+
+    def add_item(self, item):
+        with self.conn:
+            self._insert_item(item)
+
+    def add_items(self, items):
+        with self.conn:
+            for item in items:
+                self._insert_item(item)
+
+    def delete_item(self, item):
+        with self.conn:
+            self.conn.execute("DELETE FROM items WHERE id = ?", (item.item_id,))
+
+    def delete_items(self, items):
+        with self.conn:
+            self.conn.executemany("DELETE FROM items WHERE id = ?", [(item.item_id,) for item in items])
+
+    def compact_items(self, item_type):
+        thread = threading.Thread(target=self._upgrade_rows, args=(item_type.name,),
+                                  name="schema-compaction", daemon=True)
+        self.compactions.append(thread)
+        thread.start()
+
+    # 后台线程用单独的连接按编号分批改写，每批一个短事务，不长时间占用写锁
+    # 只改 JSON 列；改写期间被删除的物品 UPDATE 不到，新写入的物品已经是新结构
+    def _upgrade_rows(self, type_name, batch_size=500):
+        import sqlite3
+        conn = sqlite3.connect(self.filename)
+        conn.execute("PRAGMA busy_timeout=5000")
+        try:
+            last_id = 0
+            while not self.closing.is_set():
+                rows = conn.execute("SELECT id, attributes FROM items WHERE type = ? AND id > ? ORDER BY id LIMIT ?",
+                                    (type_name, last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                updates = []
+                for item_id, attributes in rows:
+                    data = json.loads(attributes)
+                    data["type"] = type_name
+                    upgraded = upgrade_record(data)
+                    if upgraded is not data:
+                        del upgraded["type"]
+                        updates.append((json.dumps(upgraded, ensure_ascii=False), item_id))
+                with conn:
+                    conn.executemany("UPDATE items SET attributes = ? WHERE id = ?", updates)
+                last_id = rows[-1][0]
+        except Exception as e:
+            self.errors.put(e)
+        finally:
+            conn.close()
+
+    def take_errors(self):
+        errors = []
+        while not self.errors.empty():
+            errors.append(self.errors.get())
+        return errors
+
+    @metrics.timed("save_items")
+    def save_items(self, items):
+        # 每次增删已经单独提交，这里只把列表中尚未入库的物品补写进去
+        with self.conn:
+            for item in items:
+                if item.item_id is None:
+                    self._insert_item(item)
+
+    # 条件走 added_by / type 索引（二级索引中带有主键），按编号从游标处开始读一页
+    def page_items(self, cursor=None, limit=50, owner=None, item_type=None):
+        conditions = []
+        params = []
+        if owner is not None:
+            conditions.append("added_by = ?")
+            params.append(owner)
+        if item_type is not None:
+            conditions.append("type = ?")
+            params.append(item_type)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        total = self.conn.execute(f"SELECT COUNT(*) FROM items {where}", params).fetchone()[0]
+        if cursor is not None:
+            conditions.append("id > ?")
+            params.append(cursor)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        items = self._select_items(where, params, limit=limit + 1)
+        return items[:limit], items[limit - 1].item_id if len(items) > limit else None, total
+
+    # data_version 只在其他连接提交后才变化，没有变化时不必查询变更表
+    # 本进程自己的修改也会出现在变更表中，服务层按编号和内容去重
+    def poll_changes(self):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return []
+        self.data_version = data_version
+        rows = self.conn.execute("SELECT seq, topic, key, op FROM changes WHERE seq > ? ORDER BY seq",
+                                 (self.last_change,)).fetchall()
+        changes = []
+        for seq, topic, key, op in rows:
+            self.last_change = seq
+            if topic == "users":
+                row = self.conn.execute("SELECT username, password, address, contact_info, user_type, is_approved, "
+                                        "searches FROM users WHERE username = ?", (key,)).fetchone()
+                if row:
+                    changes.append(("users", op, self._row_to_user(row).to_dict()))
+            elif topic == "item_types":
+                row = self.conn.execute("SELECT name, attributes, changes, expires FROM item_types WHERE name = ?",
+                                        (key,)).fetchone()
+                if row:
+                    item_type = ItemType(row[0], json.loads(row[1]), json.loads(row[2]), row[3])
+                    if item_type.name not in item_classes:
+                        item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+                    changes.append(("item_types", op, item_type.to_dict()))
+            elif op == "add":
+                items = self._select_items("WHERE id = ?", (int(key),))
+                if items:
+                    changes.append(("items", "add", (items[0], items[0])))
+            else:
+                changes.append(("items", "remove", int(key)))
+        return changes
+
+    # 从 JSON 文件导入，整个导入在一个事务中完成
+    def import_json(self, source):
+        item_types = source.load_item_types()
+        for item_type in item_types:
+            if item_type.name not in item_classes:
+                item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+        users = source.load_users()
+        items = source.load_items()
+        with self.conn:
+            for user in users:
+                self._upsert_user(user)
+            for item_type in item_types:
+                self._upsert_item_type(item_type)
+            for item in items:
+                self._insert_item(item)
+
+    # 导出为 JSON 文件
+    def export_json(self, target):
+        target.save_users(self.load_users())
+        target.save_item_types(self.load_item_types())
+        target.save_items(self.load_items())
+
+    # 变更表只保留最近的记录；运行中的进程每隔几百毫秒就会读取，远远落不到这么多
+    def close(self):
+        self.closing.set()
+        for thread in self.compactions:
+            thread.join()
+        with self.conn:
+            self.conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - 100000")
+        self.conn.close()
+
+# 在 JSON 快照和二进制快照之间转换：读出源文件的快照加日志，写成目标格式的快照
+# 目标的日志被清空；返回转换的物品数。写二进制快照需要知道各种类的结构，先登记 item_types_filename 中的种类
+def convert_snapshot(source, target, item_types_filename="item_types.json"):
+    for item_type in load_item_types(item_types_filename):
+        if item_type.name not in item_classes:
+            item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+    source_journal = ItemJournal(source)
+    target_journal = ItemJournal(target)
+    with FileLock(source, shared=True):
+        records, end = source_journal._read_records()
+        items = [data for offset, data in source_journal._iter_state(records)]
+    with FileLock(target):
+        target_journal._write_snapshot(items)
+    return len(items)
+
+def open_storage(backend="json", db_filename="item_revive.db"):
+    if backend == "sqlite":
+        storage = SQLiteStorage(db_filename)
+        if storage.is_empty():
+            storage.import_json(JsonStorage())  # 首次使用时导入现有 JSON 数据
+        return storage
+    if backend == "binary":
+        if not os.path.exists("items.bin") and os.path.exists("items.json"):
+            convert_snapshot("items.json", "items.bin")  # 首次使用时转换现有 JSON 数据
+        return JsonStorage(items_filename="items.bin", worker=PersistenceWorker())
+    return JsonStorage(worker=PersistenceWorker())
+
+# 数据变化通知：服务层每改动一条记录就按主题（users / item_types / items）发出
+# (动作, 记录) 事件，动作为 add、remove 或 update；界面订阅后只按事件增量更新
+class ModelEvents:
+    def __init__(self):
+        self.listeners = {}  # 主题 -> 回调列表
+
+    # 返回取消订阅的函数，窗口关闭时调用
+    def subscribe(self, topic, callback):
+        self.listeners.setdefault(topic, []).append(callback)
+        return lambda: self.listeners[topic].remove(callback)
+
+    def emit(self, topic, action, record):
+        for callback in list(self.listeners.get(topic, ())):
+            callback(action, record)
+
+# 无界面的服务层：注册、登录、审核用户、添加物品类型以及物品的增删查都在这里完成
+# Tk 界面和 HTTP 服务都只是它的调用方；出错时抛出带提示信息的 ValueError / PermissionError
+# auto_archive 为 True 时界面和 HTTP 服务定时归档过期物品（默认关闭，示例数据中的食品早已过期）；
+# 过期超过 archive_grace_days 天才归档；clock 返回今天的日期，测试时可以换成固定日期
+class ItemReviveService:
+    def __init__(self, storage, auto_archive=False, archive_grace_days=0, clock=datetime.date.today):
+        self.storage = storage
+        self.auto_archive = auto_archive
+        self.archive_grace_days = archive_grace_days
+        self.clock = clock
+        self.item_types = storage.load_item_types()
+        # 登记每个物品种类，对应的类在第一次用到时再生成
+        for item_type in self.item_types:
+            item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+        self.users = storage.load_users()
+        self.items = {}  # 物品编号 -> 物品（懒加载时为 LazyItem），按添加顺序
+        self.loaded = False  # 物品是否已全部加载，索引是否完整
+        self.index = KeywordIndex()
+        self.facets = FacetIndex()
+        self.locations = LocationIndex()
+        self.owners = OwnerIndex()
+        self.expiry = ExpiryScheduler()
+        self.searches = SearchMatcher()  # 全部用户保存的搜索，物品加载完后按物品中的频率重选锚点
+        self.searches.rebuild(self.users)
+        self.events = ModelEvents()
+        self.sessions = SessionCache()
+        self.login_throttle = LoginThrottle()
+        # PBKDF2 在 hashlib 中计算时会释放 GIL，用线程池即可并行
+        self.password_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        self.password_upgrades = []  # 后台迁移中的 (用户, 明文, Future)
+        self.closed = False
+        self.dummy_password = f"{PASSWORD_SCHEME}${PASSWORD_ITERATIONS}${'0' * 32}${'0' * 64}"
+
+    # 注册与登录一样分两步：begin_register 做完不需要哈希的检查后把 PBKDF2 交给工作线程，返回 Future；
+    # end_register 拿到哈希后再查一次用户名（等待期间可能已被别人注册），然后保存
+    def begin_register(self, username, password, address, contact_info):
+        if not all([username, password, address, contact_info]):
+            raise ValueError("请输入所有必填信息")
+        self.sync()
+        if username in self.users:
+            raise ValueError("用户名已存在")
+        return self.password_pool.submit(hash_password, password)
+
+    def end_register(self, username, address, contact_info, password_hash):
+        self.sync()
+        if username in self.users:
+            raise ValueError("用户名已存在")
+        user = User(username, password_hash, address, contact_info)
+        self.users.append(user)
+        self.storage.save_user(user)
+        self.events.emit("users", "add", user)
+        return user
+
+    def register(self, username, password, address, contact_info):
+        future = self.begin_register(username, password, address, contact_info)
+        return self.end_register(username, address, contact_info, future.result())
+
+    # 登录分两步，便于界面和 HTTP 服务在等待 PBKDF2 时不阻塞：
+    # begin_login 检查限流后把密码校验交给工作线程，返回 Future；
+    # 在调用方线程拿到 Future 的结果后交给 end_login，由它更新限流、会话缓存并迁移旧密码
+    def begin_login(self, username, password):
+        self.login_throttle.check(username)
+        user = self.users.get(username)
+        if user is not None and self.sessions.recall(user, password):
+            future = Future()
+            future.set_result((True, None))
+            return future
+        # 用户不存在时也做一次同样耗时的校验，不让响应时间暴露用户名是否存在
+        stored = user.password if user is not None else self.dummy_password
+        return self.password_pool.submit(check_password, stored, password)
+
+    def end_login(self, username, password, result):
+        user = self.users.get(username)
+        ok, upgraded = result
+        if user is None or not ok:
+            if user is not None:
+                self.login_throttle.failed(username)
+            raise PermissionError("用户名、密码错误或未批准。")
+        self.login_throttle.succeeded(username)
+        if upgraded is not None:
+            user.password = upgraded
+            self.storage.save_user(user)
+        self.sessions.prune()
+        self.sessions.remember(user, password)
+        if not user.is_approved:
+            raise PermissionError("用户名、密码错误或未批准。")
+        return user
+
+    @metrics.timed("login")
+    def login(self, username, password):
+        return self.end_login(username, password, self.begin_login(username, password).result())
+
+    # 在后台把仍是明文的密码换成哈希，结果在 sync 中写回
+    def migrate_passwords(self):
+        for user in self.users:
+            if not is_password_hash(user.password):
+                future = self.password_pool.submit(hash_password, user.password)
+                self.password_upgrades.append((user, user.password, future))
+
+    def apply_password_upgrades(self):
+        if not self.password_upgrades:
+            return
+        upgraded = []
+        remaining = []
+        for user, plaintext, future in self.password_upgrades:
+            if not future.done():
+                remaining.append((user, plaintext, future))
+            elif future.cancelled():
+                continue
+            elif user.password == plaintext:  # 期间密码没有被登录迁移或其他进程修改
+                user.password = future.result()
+                upgraded.append(user)
+        self.password_upgrades = remaining
+        if upgraded:
+            self.storage.save_users(upgraded)
+
+    def get_user(self, username):
+        return self.users.get(username)
+
+    def pending_users(self):
+        return self.users.pending()
+
+    @metrics.timed("approve")
+    def approve(self, usernames):
+        for username in usernames:
+            if username not in self.users:
+                raise ValueError(f"用户 '{username}' 不存在")
+        approved = [self.users.set_approved(username) for username in usernames]
+        self.storage.save_users(approved)
+        for user in approved:
+            self.events.emit("users", "update", user)
+        return approved
+
+    def add_item_type(self, name, attributes):
+        attributes = [attr.strip() for attr in attributes if attr.strip()]
+        if not name or not attributes:
+            raise ValueError("请输入物品类型名称和特有属性")
+        self.sync()
+        if any(item_type.name == name for item_type in self.item_types):
+            raise ValueError("物品类型已存在")
+        item_type = ItemType(name, attributes)
+        self.item_types.append(item_type)
+        self.storage.add_item_type(item_type)
+        item_classes.register(name, attributes)  # 登记新的物品种类类
+        self.events.emit("item_types", "add", item_type)
+        return item_type
+
+    def get_item_type(self, name):
+        for item_type in self.item_types:
+            if item_type.name == name:
+                return item_type
+        return None
+
+    # 修改物品种类的结构：op 为 add（value 为默认值）、rename（value 为新属性名）或 remove
+    # 不做全量迁移：旧记录读出时按变更记录升级，后台压缩再慢慢把文件中的记录改写成新结构
+    def change_item_type(self, name, op, attr, value=None):
+        self.sync()
+        item_type = self.get_item_type(name)
+        if item_type is None:
+            raise ValueError(f"未知的物品种类 '{name}'")
+        attr = (attr or "").strip()
+        reserved = set(Item.__slots__) | {"type", "id", "schema"}
+        if op == "add":
+            if not attr or attr in item_type.attributes or attr in reserved:
+                raise ValueError(f"属性名 '{attr}' 为空或已存在")
+            change = {"op": "add", "attr": attr, "default": value or ""}
+        elif op == "rename":
+            new_name = (value or "").strip()
+            if attr not in item_type.attributes:
+                raise ValueError(f"种类 '{name}' 没有属性 '{attr}'")
+            if not new_name or new_name in item_type.attributes or new_name in reserved:
+                raise ValueError(f"属性名 '{new_name}' 为空或已存在")
+            change = {"op": "rename", "attr": attr, "to": new_name}
+        elif op == "remove":
+            if attr not in item_type.attributes:
+                raise ValueError(f"种类 '{name}' 没有属性 '{attr}'")
+            if len(item_type.attributes) == 1:
+                raise ValueError("物品种类至少要保留一个特有属性")
+            change = {"op": "remove", "attr": attr}
+        else:
+            raise ValueError(f"不支持的结构变更: {op}")
+        self._apply_schema_changes(item_type, [change])
+        self.storage.add_item_type(item_type)  # 两个后端都按名称覆盖写入
+        self.storage.compact_items(item_type)
+        self.events.emit("item_types", "update", item_type)
+        return item_type
+
+    # 更新内存中的结构和该种类物品的索引：先按旧结构把物品移出索引，重新登记类后再按新结构加入
+    # 已完整加载的物品换成新类的对象；懒加载的物品下次读出时自然是新结构
+    def _apply_schema_changes(self, item_type, changes):
+        entries = list(self.index.by_type.get(item_type.name, {}).values())
+        for entry in entries:
+            self.index.remove(entry)
+            self.facets.remove(entry)
+        for change in changes:
+            item_type.apply_change(change)
+        item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+        for entry in entries:
+            if not isinstance(entry, LazyItem):
+                entry = Item.from_dict(entry.to_dict())
+                self.items[entry.item_id] = entry
+                self.events.emit("items", "update", entry)
+            item = entry.hydrate()
+            self.index.add(item, entry)
+            self.facets.add(item)
+            self._schedule_expiry(item)
+
+    # 逐个产出加载的物品，同时建立关键词索引；界面可以边加载边显示
+    def iter_load_items(self, lazy=False):
+        self.loaded = False
+        self.items = {}
+        self.index.rebuild([])
+        self.facets.rebuild([])
+        self.facets.start_bulk()
+        self.locations.rebuild([])
+        self.owners.rebuild([])
+        self.expiry.rebuild()
+        expiry_attributes = self._expiry_attributes()
+        # 界面边加载边显示时，计时包含界面渲染各块的时间
+        with metrics.timer("load_items"):
+            for entry, item in self.storage.iter_items(lazy):
+                self.items[entry.item_id] = entry
+                self.index.add(item, entry)
+                self.facets.add(item)
+                self.locations.add(item)
+                self.owners.add(item)
+                self._schedule_expiry(item, expiry_attributes)
+                yield entry
+        self.facets.finish_bulk()
+        self.loaded = True
+        self.searches.rebuild(self.users, self._anchor_frequency)
+
+    def load_items(self, lazy=False):
+        for entry in self.iter_load_items(lazy):
+            pass
+
+    def add_item(self, user, category, name, description, location, contact_phone, email, attributes):
+        item_class = item_classes.get(category)
+        if not item_class:
+            raise ValueError("物品种类不匹配")
+        attributes = {attr: attributes.get(attr, "") for attr in item_class.attributes}
+        item = item_class(name, description, location, contact_phone, email, user.username, **attributes)
+        self.storage.add_item(item)
+        self._index_item(item)
+        self._notify_matches([item])
+        return item
+
+    # 批量添加已校验的记录（含 type、基本字段和特有属性），整批只提交一次存储
+    # 记录中没有 added_by 时记为当前用户添加
+    def add_items(self, user, records):
+        items = []
+        for data in records:
+            item_class = item_classes.get(data["type"])
+            if not item_class:
+                raise ValueError("物品种类不匹配")
+            attributes = {attr: data.get(attr, "") for attr in item_class.attributes}
+            items.append(item_class(data["name"], data["description"], data["location"], data["contact_phone"],
+                                    data["email"], data.get("added_by") or user.username, **attributes))
+        self.storage.add_items(items)
+        for item in items:
+            self._index_item(item)
+        self._notify_matches(items)
+        return items
+
+    def _index_item(self, item):
+        self.items[item.item_id] = item
+        self.index.add(item)
+        self.facets.add(item)
+        self.locations.add(item)
+        self.owners.add(item)
+        self._schedule_expiry(item)
+        self.events.emit("items", "add", item)
+
+    # 新物品与全部保存的搜索匹配，命中的通知整批写入各搜索主人的队列
+    # 其他进程添加的物品由添加它的进程负责匹配，同步时不再匹配
+    @metrics.timed("match_searches")
+    def _notify_matches(self, items):
+        notifications = []
+        for item in items:
+            for username, search in self.searches.match(item):
+                notifications.append({"user": username, "search": search["id"], "item": item.item_id,
+                                      "name": item.name, "type": item.type_name})
+        for record in self.storage.push_notifications(notifications):
+            self.events.emit("notifications", "add", record)
+        return notifications
+
+    # 锚点在现有物品中出现的件数，越少见的锚点匹配时要核对的候选越少
+    def _anchor_frequency(self, anchor):
+        if anchor[0] == "gram":
+            return len(self.index.postings.get(anchor[1], ()))
+        if anchor[0] == "place":
+            level, name = anchor[1:]
+            if level == "district":
+                return sum(len(self.locations.districts[key]) for key in self.locations.district_names.get(name, ()))
+            return len((self.locations.cities if level == "city" else self.locations.provinces).get(name, ()))
+        return len(self.facets.values.get(anchor[1], {}).get(anchor[2], ()))
+
+    # 保存搜索（求购条件）：以后添加的物品满足全部条件时通知该用户
+    # conditions 可以是 "数量>10, 品牌=华为" 形式的文字，也可以是 (属性, 运算符, 值) 列表
+    def save_search(self, user, category=None, keyword=None, conditions=(), location=None):
+        if isinstance(conditions, str):
+            conditions = parse_conditions(conditions)
+        keyword = (keyword or "").strip()
+        location = (location or "").strip()
+        if not any([category, keyword, conditions, location]):
+            raise ValueError("请至少输入一个查询条件")
+        if category and category not in item_classes:
+            raise ValueError("物品种类不匹配")
+        for attr, op, value in conditions:
+            if category and attr not in item_classes[category].attributes:
+                raise ValueError(f"物品种类 '{category}' 没有属性 '{attr}'")
+            if op != "=" and parse_number(value) is None and parse_date(value) is None:
+                raise ValueError(f"属性 '{attr}' 只能按数值或日期比较大小")
+        search = {"id": max((search["id"] for search in user.searches), default=0) + 1,
+                  "category": category or None, "keyword": keyword or None,
+                  "conditions": [list(condition) for condition in conditions], "location": location or None}
+        user.searches = user.searches + [search]
+        self.storage.save_user(user)
+        self.searches.add(user.username, search, self._anchor_frequency)
+        self.events.emit("users", "update", user)
+        return search
+
+    def delete_search(self, user, search_id):
+        searches = [search for search in user.searches if search["id"] != search_id]
+        if len(searches) == len(user.searches):
+            raise ValueError("保存的搜索不存在")
+        user.searches = searches
+        self.storage.save_user(user)
+        self.searches.remove(user.username, search_id)
+        self.events.emit("users", "update", user)
+
+    def list_searches(self, user):
+        return list(user.searches)
+
+    # 用户未读的通知，按先后顺序
+    def notifications(self, user):
+        return self.storage.pending_notifications(user.username)
+
+    # 把序号不超过 seq 的通知标为已读，不传 seq 时全部标为已读
+    def dismiss_notifications(self, user, seq=None):
+        if seq is None:
+            pending = self.notifications(user)
+            if not pending:
+                return
+            seq = pending[-1]["seq"]
+        self.storage.ack_notifications(user.username, seq)
+
+    def _register_searches(self, user, searches):
+        for search in user.searches:
+            self.searches.remove(user.username, search["id"])
+        user.searches = list(searches)
+        for search in user.searches:
+            self.searches.add(user.username, search, self._anchor_frequency)
+
+    def get_item(self, item_id):
+        entry = self.items.get(item_id)
+        if entry is None:
+            raise ValueError("物品不存在" if self.loaded else "物品还在加载中，请稍后再试")
+        return entry
+
+    # 传入 user 时检查权限：普通用户只能删除自己添加的物品，管理员可以删除任何物品
+    def delete_item(self, item_id, user=None):
+        entry = self.get_item(item_id)
+        if user is not None and not self.can_delete(user, item_id):
+            raise PermissionError("只能删除自己添加的物品")
+        self._unindex(entry)
+        self.storage.delete_item(entry)
+        del self.items[item_id]
+        self.events.emit("items", "remove", entry)
+        return entry
+
+    # entry 可以是列表项，也可以是已读出的完整物品（省去再读一次）
+    def _unindex(self, entry):
+        self.index.remove(entry)
+        self.facets.remove(entry)
+        self.locations.remove(entry)
+        self.owners.remove(entry)
+        self.expiry.remove(entry.item_id)
+
+    # 种类 -> 表示到期日的属性，只含会过期的种类
+    def _expiry_attributes(self):
+        return {item_type.name: item_type.expires for item_type in self.item_types if item_type.expires}
+
+    # 到期日无法识别（空白或不是日期）的物品不会被归档
+    def _schedule_expiry(self, item, expiry_attributes=None):
+        attr = (expiry_attributes if expiry_attributes is not None else self._expiry_attributes()).get(item.type_name)
+        date = parse_date(getattr(item, attr, "")) if attr else None
+        if date is None:
+            self.expiry.remove(item.item_id)
+        else:
+            self.expiry.add(item.item_id, date)
+
+    # 设置某个种类表示到期日的属性，attr 为空表示该种类不再过期；已有物品按新设置重新排期
+    def set_item_expiry(self, name, attr):
+        item_type = self.get_item_type(name)
+        if item_type is None:
+            raise ValueError("物品种类不存在")
+        attr = attr or None
+        if attr is not None and attr not in item_type.attributes:
+            raise ValueError(f"种类 '{name}' 没有属性 '{attr}'")
+        self._set_expiry(item_type, attr)
+        self.storage.add_item_type(item_type)
+        self.events.emit("item_types", "update", item_type)
+        return item_type
+
+    def _set_expiry(self, item_type, attr):
+        item_type.expires = attr
+        expiry_attributes = self._expiry_attributes()
+        for entry in list(self.index.by_type.get(item_type.name, {}).values()):
+            if attr is None:
+                self.expiry.remove(entry.item_id)
+            else:
+                self._schedule_expiry(entry.hydrate(), expiry_attributes)
+
+    # 最早的到期日（ISO 日期），没有会过期的物品时为 None
+    def next_expiry(self):
+        return self.expiry.next_date()
+
+    # 到期日早于这一天的物品应当归档：today（ISO 日期，默认取 clock）往前推 archive_grace_days 天
+    def archive_cutoff(self, today=None):
+        today = datetime.date.fromisoformat(today) if today else self.clock()
+        return (today - datetime.timedelta(days=self.archive_grace_days)).isoformat()
+
+    def has_expired(self, today=None):
+        date = self.next_expiry()
+        return date is not None and date < self.archive_cutoff(today)
+
+    # 把过期超过宽限期的物品移到冷存储（见 archive_cutoff），每次最多 limit 件，返回归档的物品
+    # 界面和 HTTP 服务定时调用；一次没归档完时调用方稍后再调用，每批只占用很短的时间
+    # 存储正在后台重写数据文件时本批跳过（读物品要等重写完成），has_expired 仍为 True，调用方稍后重试
+    @metrics.timed("archive_expired")
+    def archive_expired(self, today=None, limit=500):
+        if self.storage.busy():
+            return []
+        entries = [self.items[item_id] for item_id in self.expiry.pop_due(self.archive_cutoff(today), limit)
+                   if item_id in self.items]
+        if not entries:
+            return []
+        items = self.storage.hydrate_items(entries)
+        try:
+            self.storage.archive_items(items)
+        except Exception:
+            for item in items:
+                self._schedule_expiry(item)  # 写入失败，下次再试
+            raise
+        for item in items:
+            self._unindex(item)
+            entry = self.items.pop(item.item_id)
+            self.events.emit("items", "remove", entry)
+        metrics.count("items_archived", len(items))
+        return items
+
+    def iter_archived(self):
+        return self.storage.iter_archived()
+
+    # 同步其他进程的修改：只处理变化的记录，更新内存和索引后发出事件
+    # 本进程自己的修改可能也会出现（SQLite 变更表），按编号和内容跳过
+    def sync(self):
+        self.apply_password_upgrades()
+        for topic, action, data in self.storage.poll_changes():
+            if topic == "item_types":
+                item_type = self.get_item_type(data["name"])
+                if item_type is None:
+                    item_type = ItemType.from_dict(data)
+                    self.item_types.append(item_type)
+                    if item_type.name not in item_classes:
+                        item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+                    self.events.emit("item_types", "add", item_type)
+                elif len(data.get("changes", ())) > len(item_type.changes):
+                    # 其他进程修改了结构，只补上本进程还没有的变更
+                    self._apply_schema_changes(item_type, data["changes"][len(item_type.changes):])
+                    self.events.emit("item_types", "update", item_type)
+                if data.get("expires") != item_type.expires:
+                    self._set_expiry(item_type, data.get("expires"))
+                    self.events.emit("item_types", "update", item_type)
+            elif topic == "users":
+                user = self.users.get(data["username"])
+                if user is None:
+                    user = User.from_dict(data)
+                    self.users.append(user)
+                    self._register_searches(user, user.searches)
+                    self.events.emit("users", "add", user)
+                elif user.to_dict() != data:
+                    user.password = data["password"]
+                    user.address = data["address"]
+                    user.contact_info = data["contact_info"]
+                    user.user_type = data["user_type"]
+                    self.users.set_approved(user.username, data["is_approved"])
+                    if data.get("searches", []) != user.searches:
+                        self._register_searches(user, data.get("searches", ()))
+                    self.events.emit("users", "update", user)
+            elif action == "add":
+                entry, item = data
+                if entry.item_id in self.items:
+                    continue
+                self.items[entry.item_id] = entry
+                self.index.add(item, entry)
+                self.facets.add(item)
+                self.locations.add(item)
+                self.owners.add(item)
+                self._schedule_expiry(item)
+                self.events.emit("items", "add", entry)
+            else:
+                entry = self.items.pop(data, None)
+                if entry is None:
+                    continue
+                self.index.discard(entry)  # 物品已被删除，读不到完整内容
+                self.facets.remove(entry)
+                self.locations.remove(entry)
+                self.owners.remove(entry)
+                self.expiry.remove(entry.item_id)
+                self.events.emit("items", "remove", entry)
+
+    def can_delete(self, user, item_id):
+        return user.user_type == "admin" or self.owners.owner_of(item_id) == user.username
+
+    # 按游标分页浏览物品，可以限定添加用户和种类，按编号顺序
+    # cursor 为上一页返回的游标，第一页传 None；返回 (当前页, 下一页的游标, 总数)，没有下一页时游标为 None
+    # 物品还没加载完时归属索引不完整，存储能按索引分页（SQLite）时直接查询存储，不必等加载
+    def browse_items(self, cursor=None, limit=50, owner=None, category=None):
+        if not self.loaded:
+            page = self.storage.page_items(cursor, limit, owner or None, category or None)
+            if page is not None:
+                return page
+        item_ids, next_cursor = self.owners.page(cursor, limit, owner or None, category or None)
+        return [self.items[item_id] for item_id in item_ids], next_cursor, self.owners.count(owner or None, category or None)
+
+    # “我的物品”：只取当前用户添加的物品，按页读取
+    def my_items(self, user, cursor=None, limit=50, category=None):
+        return self.browse_items(cursor, limit, user.username, category)
+
+    # 分页列出物品，返回 (当前页, 总数)
+    def list_items(self, offset=0, limit=None):
+        stop = offset + limit if limit is not None else None
+        return list(itertools.islice(self.items.values(), offset, stop)), len(self.items)
+
+    @metrics.timed("find_items")
+    def find_items(self, category, keyword, offset=0, limit=None):
+        if not category or not keyword:
+            raise ValueError("请选择物品种类并输入关键词")
+        found_items = self.index.search(category, keyword)
+        stop = offset + limit if limit is not None else None
+        return found_items[offset:stop], len(found_items)
+
+    # 排序搜索：容许少量错字，按名称、特有属性、说明、添加用户的匹配程度打分排序
+    # 种类可以不选；同一查询在物品变动前直接从缓存返回。返回 (当前页, 总数)
+    @metrics.timed("search_items")
+    def search_items(self, keyword, category=None, offset=0, limit=None):
+        if not keyword or not keyword.strip():
+            raise ValueError("请输入关键词")
+        ranked = self.index.rank(keyword, category or None)
+        stop = offset + limit if limit is not None else None
+        return [self.items[item_id] for score, item_id in ranked[offset:stop]], len(ranked)
+
+    # 分面查询：种类、关键词、属性条件（等值或数值/日期区间）和地址可以任意组合
+    # 地址是可识别的省、市、区县时按行政区划查找，否则按前缀匹配
+    # conditions 可以是 parse_conditions 解析出的 (属性, 比较符, 值) 列表，也可以是原始的条件文字
+    # 返回 (当前页, 总数, 各属性的分面计数)
+    @metrics.timed("filter_items")
+    def filter_items(self, category=None, keyword=None, conditions=(), location=None, offset=0, limit=None):
+        if isinstance(conditions, str):
+            conditions = parse_conditions(conditions)
+        if not any([category, keyword, conditions, location]):
+            raise ValueError("请至少输入一个查询条件")
+        candidates = None
+        if keyword:
+            if not category:
+                raise ValueError("按关键词查找时请选择物品种类")
+            candidates = [entry.item_id for entry in self.index.search(category, keyword)]
+        region = self.locations.region(location) if location else None
+        if region is not None:
+            candidates = region if candidates is None else [item_id for item_id in candidates if item_id in region]
+            location = None
+        item_ids = sorted(self.facets.query(category, conditions, location, candidates))
+
+        if category:
+            attributes = item_classes[category].attributes if category in item_classes else []
+        else:
+            attributes = list(dict.fromkeys(attr for item_type in self.item_types for attr in item_type.attributes))
+        facet_counts = self.facets.facet_counts(item_ids, attributes)
+
+        stop = offset + limit if limit is not None else None
+        return [self.items[item_id] for item_id in item_ids[offset:stop]], len(item_ids), facet_counts
+
+    # 按与 address（通常是当前用户的住址）的远近列出物品：同区县、同城市、同省份，最后是其他物品
+    # region 限定在某个省、市或区县内；返回 (当前页, 总数)
+    @metrics.timed("items_near")
+    def items_near(self, address, region=None, offset=0, limit=None):
+        scope = None
+        if region:
+            scope = self.locations.region(region)
+            if scope is None:
+                raise ValueError(f"无法识别的地区: {region}")
+        total = len(scope if scope is not None else self.locations.paths)
+        stop = offset + limit if limit is not None else None
+        item_ids = itertools.islice(self.locations.iter_nearby(address, scope), offset, stop)
+        return [self.items[item_id] for item_id in item_ids], total
+
+    def flush(self):
+        self.storage.flush()
+
+    # 此前的增删全部落盘后完成的 Future，不在调用线程里等磁盘
+    def durable(self):
+        return self.storage.durable()
+
+    def take_errors(self):
+        return self.storage.take_errors()
+
+    # 读入时从损坏的文件中抢救了数据：每个文件一条提示
+    def take_damaged(self):
+        regions = {}
+        for filename, offset, length in self.storage.take_damaged():
+            regions.setdefault(filename, []).append(length)
+        return [f"{filename} 中有 {len(lengths)} 处损坏（共 {sum(lengths)} 字节），已跳过损坏的记录，"
+                f"原文件备份为 {filename}.damaged" for filename, lengths in regions.items()]
+
+    # 退出时保存用户信息和物品类型信息并关闭存储
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.password_pool.shutdown(cancel_futures=True)
+        self.apply_password_upgrades()
+        self.storage.save_users(self.users)
+        self.storage.save_item_types(self.item_types)
+        self.storage.close()
+
+# 虚拟列表控件：数据保存在 rows 中，Listbox 只渲染当前可见的几行
+# 对外的 insert/delete/get/curselection 使用数据行号，与 tk.Listbox 的用法保持一致
+# 每行另有一个只增不减的编号（ids，与 rows 对应、有序），过滤结果和选中行按编号保存，
+# 删除行时不必给后面的行重新编号；编号换算成行号只需一次二分查找
+class VirtualListbox:
+    def __init__(self, parent, font=None, width=16, height=10, selectmode="browse", filterable=True):
+        self.frame = tk.Frame(parent)
+        self.height = height
+        self.selectmode = selectmode
+        self.rows = []
+        self.ids = []
+        self.next_id = 0
+        self.view = None       # 过滤后的行编号列表（有序）；None 表示未过滤
+        self.filter_text = ""
+        self.top = 0           # 可见窗口第一行在 view 中的位置
+        self.selected = set()  # 选中行的编号
+
+        if filterable:
+            self.filter_var = tk.StringVar(self.frame)
+            self.filter_var.trace("w", lambda *args: self.apply_filter(self.filter_var.get()))
+            tk.Entry(self.frame, textvariable=self.filter_var, font=font, width=width).pack(fill=tk.X)
+
+        self.listbox = tk.Listbox(self.frame, font=font, width=width, height=height,
+                                  selectmode=selectmode, exportselection=False)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.listbox.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(1))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def bind(self, sequence, func):
+        self.listbox.bind(sequence, func)
+
+    # 行编号 -> 数据行号
+    def row_of(self, row_id):
+        return bisect.bisect_left(self.ids, row_id)
 
-# 定义用户类
-class User:
-    def __init__(self, username, password, address, contact_info, user_type="user", is_approved=False):
-        self.username = username
-        self.password = password
-        self.address = address
-        self.contact_info = contact_info
-        self.user_type = user_type
-        self.is_approved = is_approved
+    def visible_count(self):
+        return len(self.view) if self.view is not None else len(self.rows)
 
-    def to_dict(self):
-        return {
-            "username": self.username,
-            "password": self.password,
-            "address": self.address,
-            "contact_info": self.contact_info,
-            "user_type": self.user_type,
-            "is_approved": self.is_approved
-        }
+    # 可见窗口中各行的数据行号
+    def window(self):
+        self.top = max(0, min(self.top, self.visible_count() - self.height))
+        if self.view is None:
+            return range(self.top, min(self.top + self.height, len(self.rows)))
+        return [self.row_of(row_id) for row_id in self.view[self.top:self.top + self.height]]
 
-    @staticmethod
-    def from_dict(data):
-        return User(
-            data["username"],
-            data["password"],
-            data["address"],
-            data["contact_info"],
-            data["user_type"],
-            data["is_approved"]
-        )
+    # 只重绘可见窗口中的行
+    def render(self):
+        window = self.window()
+        self.listbox.delete(0, tk.END)
+        if window:
+            self.listbox.insert(tk.END, *[self.rows[index] for index in window])
+        for position, index in enumerate(window):
+            if self.ids[index] in self.selected:
+                self.listbox.selection_set(position)
+        self.render_scrollbar()
 
-# 保存和加载用户信息
-def save_users(users, filename="users.json"):
-    users_data = [user.to_dict() for user in users]
-    with open(filename, "w") as file:
-        json.dump(users_data, file, indent=4)
+    def render_scrollbar(self):
+        total = self.visible_count()
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.height) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
-def load_users(filename="users.json"):
-    try:
-        with open(filename, "r") as file:
-            users_data = json.load(file)
-            return [User.from_dict(data) for data in users_data]
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError:
-        raise ValueError("文件格式不正确")
+    def yview(self, *args):
+        total = self.visible_count()
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = self.height if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.render()
 
-# 保存和加载物品类型信息
-def save_item_types(item_types, filename="item_types.json"):
-    item_types_data = [{"name": it.name, "attributes": it.attributes} for it in item_types]
-    with open(filename, "w", encoding="utf-8") as file:
-        json.dump(item_types_data, file, ensure_ascii=False, indent=4)
+    def scroll(self, units):
+        self.yview("scroll", units, "units")
 
-def load_item_types(filename="item_types.json"):
-    try:
-        with open(filename, "r", encoding="utf-8") as file:
-            item_types_data = json.load(file)
-            return [ItemType(it["name"], it["attributes"]) for it in item_types_data]
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError:
-        raise ValueError("文件格式不正确")
+    def on_select(self, event):
+        window = [self.ids[index] for index in self.window()]
+        chosen = {window[position] for position in self.listbox.curselection() if position < len(window)}
+        if self.selectmode in (tk.BROWSE, tk.SINGLE):
+            self.selected = chosen
+        else:
+            self.selected.difference_update(window)
+            self.selected.update(chosen)
 
-# 定义抽象基类 Item
-class Item(ABC):
-    def __init__(self, name, description, location, contact_phone, email, added_by, **kwargs):
-        self.name = name
-        self.description = description
-        self.location = location
-        self.contact_phone = contact_phone
-        self.email = email
-        self.added_by = added_by
-        for key, value in kwargs.items():
-            setattr(self, key, value)
+    def curselection(self):
+        return tuple(sorted(self.row_of(row_id) for row_id in self.selected))
 
-    @abstractmethod
-    def get_details(self):
-        pass
+    def get(self, index):
+        return self.rows[index]
 
-    def to_dict(self):
-        data = {
-            "name": self.name,
-            "description": self.description,
-            "location": self.location,
-            "contact_phone": self.contact_phone,
-            "email": self.email,
-            "added_by": self.added_by,
-            "type": self.__class__.__name__
-        }
-        for key, value in self.__dict__.items():
-            if key not in data:
-                data[key] = value
-        return data
+    def size(self):
+        return len(self.rows)
 
-    @staticmethod
-    def from_dict(data):
-        item_type = data.get("type")
-        if item_type in item_classes:
-            item_class = item_classes[item_type]
-            args = {
-                "name": data["name"],
-                "description": data["description"],
-                "location": data["location"],
-                "contact_phone": data["contact_phone"],
-                "email": data["email"],
-                "added_by": data["added_by"]
-            }
-            for attr in item_class.attributes:
-                args[attr] = data[attr]
-            return item_class(**args)
+    # 在末尾追加时，如果可见窗口已经排满，只需要更新滚动条
+    # 在中间插入时新行没有合适的编号，整表重新编号（列表绑定只在末尾追加）
+    def insert(self, index, *names):
+        before = self.visible_count()
+        if index != tk.END and index < len(self.rows):
+            selected = {self.row_of(row_id) for row_id in self.selected}
+            view = [self.row_of(row_id) for row_id in self.view] if self.view is not None else None
+            self.rows[index:index] = names
+            self.ids = list(range(len(self.rows)))
+            self.next_id = len(self.rows)
+            self.selected = {i + len(names) if i >= index else i for i in selected}
+            if view is not None:
+                self.view = [i + len(names) if i >= index else i for i in view]
+                keyword = self.filter_text.lower()
+                self.view.extend(i for i in range(index, index + len(names)) if keyword in self.rows[i].lower())
+                self.view.sort()
+            self.render()
+            return
+        ids = range(self.next_id, self.next_id + len(names))
+        self.next_id += len(names)
+        self.rows.extend(names)
+        self.ids.extend(ids)
+        if self.view is not None:
+            keyword = self.filter_text.lower()
+            self.view.extend(row_id for row_id, name in zip(ids, names) if keyword in name.lower())
+        if before < self.top + self.height:
+            self.render()
         else:
-            raise ValueError("Unknown item type")
+            self.render_scrollbar()
 
-# 动态创建的物品种类类
-item_classes = {}
+    # 删除连续的几行：数据、编号和过滤结果都只删掉对应的一段
+    def delete(self, first, last=None):
+        if first == 0 and last == tk.END:
+            self.rows = []
+            self.ids = []
+            self.view = [] if self.view is not None else None
+            self.selected = set()
+            self.top = 0
+            self.render()
+            return
+        last = first if last is None else last
+        low, high = self.ids[first], self.ids[last]
+        del self.rows[first:last + 1]
+        del self.ids[first:last + 1]
+        if self.selected:
+            self.selected = {row_id for row_id in self.selected if not low <= row_id <= high}
+        if self.view is not None:
+            del self.view[bisect.bisect_left(self.view, low):bisect.bisect_right(self.view, high)]
+        self.render()
 
-def create_item_class(name, attributes):
-    def get_details(self):
-        details = (f"物品名称: {self.name}\n"
-                   f"物品说明: {self.description}\n"
-                   f"所在地址: {self.location}\n"
-                   f"联系人手机: {self.contact_phone}\n"
-                   f"邮箱: {self.email}\n"
-                   f"物品种类: {self.__class__.__name__}\n"
-                   f"添加用户名: {self.added_by}\n")
-        for attr in attributes:
-            details += f"{attr}: {getattr(self, attr)}\n"
-        return details
+    # 修改一行的文字；只有这一行在可见窗口中时才重绘
+    def set(self, index, name):
+        self.rows[index] = name
+        if self.view is not None:
+            row_id = self.ids[index]
+            position = bisect.bisect_left(self.view, row_id)
+            present = position < len(self.view) and self.view[position] == row_id
+            matched = self.filter_text.lower() in name.lower()
+            if matched and not present:
+                self.view.insert(position, row_id)
+            elif present and not matched:
+                del self.view[position]
+            else:
+                if present and self.top <= position < self.top + self.height:
+                    self.render()
+                return
+            self.render()
+        elif self.top <= index < self.top + self.height:
+            self.render()
 
-    def to_dict(self):
-        data = super(type(self), self).to_dict()
-        data.update({attr: getattr(self, attr) for attr in attributes})
-        data["type"] = name
-        return data
+    # 输入过滤文字时，如果是在原有文字后追加，只需在当前结果中继续筛选
+    def apply_filter(self, text):
+        keyword = text.lower()
+        if not keyword:
+            self.view = None
+        elif self.view is not None and keyword.startswith(self.filter_text.lower()):
+            self.view = [row_id for row_id in self.view if keyword in self.rows[self.row_of(row_id)].lower()]
+        else:
+            self.view = [row_id for row_id, name in zip(self.ids, self.rows) if keyword in name.lower()]
+        self.filter_text = text
+        self.top = 0
+        self.render()
 
-    def from_dict(data):
-        args = {
-            "name": data["name"],
-            "description": data["description"],
-            "location": data["location"],
-            "contact_phone": data["contact_phone"],
-            "email": data["email"],
-            "added_by": data["added_by"]
-        }
-        for attr in attributes:
-            args[attr] = data[attr]
-        return type(name, (Item,), args)(**args)
+# 把 ModelEvents 的某个主题绑定到 VirtualListbox：records 与列表行一一对应，
+# 收到事件时只插入、删除或修改对应的一行，不再整表重载
+# accept 决定记录是否应该出现在列表中（例如只显示待审核的用户），label 生成显示文字
+# 记录只追加在末尾，每条记录按追加顺序得到一个只增不减的序号：slots 为 键 -> 序号，
+# order 为与 records 对应的有序序号表，键换算成行号只需一次二分查找，删除后也不必重新编号
+class ListBinding:
+    def __init__(self, listbox, events, topic, key, label, accept=None):
+        self.listbox = listbox
+        self.key = key
+        self.label = label
+        self.accept = accept or (lambda record: True)
+        self.records = []
+        self.slots = {}
+        self.order = []
+        self.next_slot = 0
+        self.unsubscribe = events.subscribe(topic, self.on_event)
 
-    item_class = type(name, (Item,), {
-        "__init__": lambda self, name, description, location, contact_phone, email, added_by, **kwargs: Item.__init__(self, name, description, location, contact_phone, email, added_by, **kwargs),
-        "get_details": get_details,
-        "to_dict": to_dict,
-        "from_dict": from_dict,
-        "attributes": attributes  # 存储属性列表
-    })
-    item_classes[name] = item_class
-    return item_class
+    # 已经显示的记录（如提前显示的自己添加的物品）不重复追加
+    def extend(self, records):
+        records = [record for record in records if self.key(record) not in self.slots and self.accept(record)]
+        for record in records:
+            self.slots[self.key(record)] = self.next_slot
+            self.order.append(self.next_slot)
+            self.next_slot += 1
+        self.records.extend(records)
+        if records:
+            self.listbox.insert(tk.END, *[self.label(record) for record in records])
+
+    def clear(self):
+        self.records.clear()
+        self.slots.clear()
+        self.order.clear()
+        self.listbox.delete(0, tk.END)
+
+    def find(self, key):
+        slot = self.slots.get(key)
+        return bisect.bisect_left(self.order, slot) if slot is not None else None
+
+    def on_event(self, action, record):
+        key = self.key(record)
+        index = self.find(key)
+        if action == "remove" or not self.accept(record):
+            if index is not None:
+                del self.records[index]
+                del self.order[index]
+                del self.slots[key]
+                self.listbox.delete(index)
+        elif index is None:
+            self.extend([record])
+        else:
+            self.records[index] = record
+            self.listbox.set(index, self.label(record))
+
+    # 窗口关闭时取消订阅
+    def bind_lifetime(self, window):
+        window.bind("<Destroy>", lambda event: self.unsubscribe() if event.widget is window else None, add="+")
 
 # 主窗口
 class MainWindow:
-    def __init__(self, root, users, item_types):
+    def __init__(self, root, service, lazy_load=False):
         self.root = root
         self.root.title("物品复活软件")
         adjust_window_size(root, 300, 200)
         #self.root.geometry("300x300+300+100")
 
-        self.users = users
-        self.item_types = item_types
+        self.service = service
+        self.lazy_load = lazy_load
 
         # 用户名输入框
         tk.Label(root, text="用户名:", font=MiSans()).pack()
@@ -220,45 +4356,83 @@ class MainWindow:
         self.register_button = tk.Button(root, text="注册", font=MiSans(10), command=self.register_user)
         self.register_button.pack(pady=5)
 
+        self.poll_storage_errors()
+        self.poll_changes()
+
+    # 定时检查后台写入是否出错，在界面线程中提示
+    def poll_storage_errors(self):
+        for error in self.service.take_errors():
+            messagebox.showerror("保存失败", str(error))
+        for message in self.service.take_damaged():
+            messagebox.showwarning("数据已修复", message)
+        self.root.after(200, self.poll_storage_errors)
+
+    # 定时同步其他进程对共享文件的修改，界面通过事件只更新变化的行
+    def poll_changes(self):
+        try:
+            self.service.sync()
+        except ValueError as e:
+            messagebox.showerror("同步失败", str(e))
+        self.root.after(1000, self.poll_changes)
+
     def register_user(self):
-        RegisterDialog(self.root, self.users)
+        RegisterDialog(self.root, self.service)
 
     def login_user(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
 
-        for user in self.users:
-            if user.username == username and user.password == password and user.is_approved:
-                if user.user_type == "admin":
-                    self.show_admin_interface(user)
-                else:
-                    self.show_user_interface(user)
-                return
-        messagebox.showerror("登录失败", "用户名、密码错误或未批准。")
+        try:
+            future = self.service.begin_login(username, password)
+        except PermissionError as e:
+            messagebox.showerror("登录失败", str(e))
+            return
+        # 密码在工作线程中校验，界面保持响应，完成后再继续
+        self.login_button.config(state=tk.DISABLED)
+        self.wait_login(username, password, future, time.perf_counter())
+
+    def wait_login(self, username, password, future, start):
+        if not future.done():
+            self.root.after(20, self.wait_login, username, password, future, start)
+            return
+        self.login_button.config(state=tk.NORMAL)
+        try:
+            user = self.service.end_login(username, password, future.result())
+        except PermissionError as e:
+            messagebox.showerror("登录失败", str(e))
+            return
+        finally:
+            if metrics.enabled:
+                metrics.observe_latency("login", time.perf_counter() - start)
+        if user.user_type == "admin":
+            self.show_admin_interface(user)
+        else:
+            self.show_user_interface(user)
 
     def show_admin_interface(self, user):
         self.root.withdraw()  # 隐藏主窗口
         admin_root = tk.Toplevel(self.root)
         admin_root.title("管理员界面")
-        AdminInterface(admin_root, self.item_types, self.users)
+        AdminInterface(admin_root, self.service)
         admin_root.protocol("WM_DELETE_WINDOW", self.on_close)  # 监听关闭事件
 
     def show_user_interface(self, user):
         self.root.withdraw()  # 隐藏主窗口
         user_root = tk.Toplevel(self.root)
         user_root.title("用户界面")
-        UserInterface(user_root, self.item_types, user)
+        UserInterface(user_root, self.service, user, self.lazy_load)
         user_root.protocol("WM_DELETE_WINDOW", self.on_close)  # 监听关闭事件
 
     def on_close(self):
+        self.service.flush()  # 等待后台写入完成
         self.root.destroy()  # 销毁主窗口
 
 
 # 注册对话框
 class RegisterDialog:
-    def __init__(self, parent, users):
+    def __init__(self, parent, service):
         self.parent = parent
-        self.users = users
+        self.service = service
         self.top = tk.Toplevel(parent)
         self.top.title("注册")
         adjust_window_size(self.top, 300, 200)
@@ -284,7 +4458,8 @@ class RegisterDialog:
         tk.Label(self.top, text="联系方式:", font=MiSans()).grid(row=3, column=0, sticky="e")
         tk.Entry(self.top, textvariable=self.contact_info_var, font=MiSans(), width=16).grid(row=3, column=1, sticky="w")
 
-        tk.Button(self.top, text="注册", command=self.on_register, font=MiSans(10)).grid(row=4, column=0, columnspan=2)
+        self.register_button = tk.Button(self.top, text="注册", command=self.on_register, font=MiSans(10))
+        self.register_button.grid(row=4, column=0, columnspan=2)
 
     def on_register(self):
         username = self.username_var.get()
@@ -292,44 +4467,66 @@ class RegisterDialog:
         address = self.address_var.get()
         contact_info = self.contact_info_var.get()
 
-        if not all([username, password, address, contact_info]):
-            messagebox.showerror("错误", "请输入所有必填信息")
+        try:
+            future = self.service.begin_register(username, password, address, contact_info)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
             return
+        # 密码在工作线程中哈希，界面保持响应，完成后再保存
+        self.register_button.config(state=tk.DISABLED)
+        self.wait_register(username, address, contact_info, future)
 
-        user = User(username, password, address, contact_info)
-        self.users.append(user)
-        save_users(self.users)
+    def wait_register(self, username, address, contact_info, future):
+        if not future.done():
+            self.top.after(20, self.wait_register, username, address, contact_info, future)
+            return
+        self.register_button.config(state=tk.NORMAL)
+        try:
+            self.service.end_register(username, address, contact_info, future.result())
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
         messagebox.showinfo("注册成功", "您的注册申请已提交，等待管理员批准。")
         self.top.destroy()
 
 # 管理员界面
 class AdminInterface:
-    def __init__(self, root, item_types, users):
+    def __init__(self, root, service):
         self.root = root
         adjust_window_size(root, 300, 300)
         #self.root.geometry("300x400+300+100")
-        self.item_types = item_types
-        self.users = users
+        self.service = service
+        self.item_types = service.item_types
 
-        self.listbox = tk.Listbox(root, font=MiSans(), width=16, height=10)
+        self.listbox = VirtualListbox(root, font=MiSans(), width=16, height=10)
         self.listbox.pack(pady=10)
         self.listbox.bind("<Double-1>", self.show_item_type_details)
 
         self.add_button = tk.Button(root, text="添加物品类型", command=self.add_item_type, font=MiSans(10))
         self.add_button.pack(side=tk.LEFT, padx=5)
 
+        self.change_button = tk.Button(root, text="修改结构", command=self.change_item_type, font=MiSans(10))
+        self.change_button.pack(side=tk.LEFT, padx=5)
+
+        self.expiry_button = tk.Button(root, text="到期属性", command=self.set_item_expiry, font=MiSans(10))
+        self.expiry_button.pack(side=tk.LEFT, padx=5)
+
         self.approve_button = tk.Button(root, text="审核用户", command=self.approve_users, font=MiSans(10))
         self.approve_button.pack(side=tk.LEFT, padx=5)
 
+        self.type_binding = ListBinding(self.listbox, service.events, "item_types",
+                                        key=lambda item_type: item_type.name, label=lambda item_type: item_type.name)
+        self.type_binding.bind_lifetime(root)
         self.load_item_types()
-        #self.load_users()
         
     def show_item_type_details(self, event):
         try:
             index = self.listbox.curselection()[0]
-            item_type = self.item_types[index]
+            item_type = self.type_binding.records[index]
             details = (f"物品种类: {item_type.name}\n"
-                       f"物品属性: {', '.join(item_type.attributes)}\n")
+                       f"物品属性: {', '.join(item_type.attributes)}\n"
+                       f"结构版本: {item_type.version}\n"
+                       f"到期属性: {item_type.expires or '无'}\n")
             messagebox.showinfo("物品种类详细信息", details)
         except IndexError:
             messagebox.showerror("错误", "请选择一个物品种类")
@@ -343,26 +4540,66 @@ class AdminInterface:
         if not attributes:
             return
 
-        attributes = [attr.strip() for attr in attributes.split(",")]
-        item_type = ItemType(name, attributes)
-        self.item_types.append(item_type)
-        self.listbox.insert(tk.END, name)
-        save_item_types(self.item_types)
-        create_item_class(name, attributes)  # 动态创建新的物品种类类
-        
-    def load_users(self):
-        self.listbox.delete(0, tk.END)
-        for user in self.users:
-            if not user.is_approved:
-                self.listbox.insert(tk.END, user.username)
+        try:
+            self.service.add_item_type(name, attributes.split(","))
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+
+    # 给选中的物品种类添加、改名或删除一个特有属性
+    def change_item_type(self):
+        try:
+            item_type = self.type_binding.records[self.listbox.curselection()[0]]
+        except IndexError:
+            messagebox.showerror("错误", "请选择一个物品种类")
+            return
+        operations = {"添加": "add", "改名": "rename", "删除": "remove"}
+        operation = simpledialog.askstring("修改结构", "操作（添加 / 改名 / 删除）:")
+        if not operation:
+            return
+        if operation.strip() not in operations:
+            messagebox.showerror("错误", "请输入 添加、改名 或 删除")
+            return
+        op = operations[operation.strip()]
+        attr = simpledialog.askstring("修改结构", f"属性名（现有: {', '.join(item_type.attributes)}）:")
+        if not attr:
+            return
+        value = None
+        if op == "add":
+            value = simpledialog.askstring("修改结构", "已有物品的默认值（可留空）:")
+            if value is None:
+                return
+        elif op == "rename":
+            value = simpledialog.askstring("修改结构", "新属性名:")
+            if not value:
+                return
+        try:
+            self.service.change_item_type(item_type.name, op, attr, value)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+
+    # 指定选中种类中表示到期日的属性（如保质期），过期的物品会被移到归档文件；留空表示不过期
+    def set_item_expiry(self):
+        try:
+            item_type = self.type_binding.records[self.listbox.curselection()[0]]
+        except IndexError:
+            messagebox.showerror("错误", "请选择一个物品种类")
+            return
+        attr = simpledialog.askstring("到期属性", f"表示到期日的属性（现有: {', '.join(item_type.attributes)}，"
+                                                  f"留空表示不过期）:", initialvalue=item_type.expires or "")
+        if attr is None:
+            return
+        try:
+            self.service.set_item_expiry(item_type.name, attr.strip())
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
 
-    def show_user_details(self, event, user_listbox, users):
+    def show_user_details(self, event, user_listbox):
         try:
             index = user_listbox.curselection()[0]
             username = user_listbox.get(index)
-            user = next(u for u in users if u.username == username)
+            user = self.service.get_user(username)
             details = (f"用户名: {user.username}\n"
-                       f"密码: {user.password}\n"
                        f"住址: {user.address}\n"
                        f"联系方式: {user.contact_info}\n"
                        f"用户类型: {user.user_type}\n"
@@ -376,25 +4613,20 @@ class AdminInterface:
         top.title("审核用户")
         top.geometry("300x300+300+100")
 
-        user_listbox = tk.Listbox(top, font=MiSans(), width=16, height=10)
+        user_listbox = VirtualListbox(top, font=MiSans(), width=16, height=10, selectmode=tk.EXTENDED)
         user_listbox.pack(pady=10)
-        user_listbox.bind("<Double-1>", lambda event: self.show_user_details(event, user_listbox, self.users))  # 绑定双击事件
+        user_listbox.bind("<Double-1>", lambda event: self.show_user_details(event, user_listbox))  # 绑定双击事件
 
-        for user in self.users:
-            if not user.is_approved:
-                user_listbox.insert(tk.END, user.username)
+        # 只显示待审核的用户；批准后收到 update 事件，对应的行自动移除
+        user_binding = ListBinding(user_listbox, self.service.events, "users", key=lambda user: user.username,
+                                   label=lambda user: user.username, accept=lambda user: not user.is_approved)
+        user_binding.bind_lifetime(top)
+        user_binding.extend(self.service.pending_users())
 
         def approve_selected():
             selected_indices = user_listbox.curselection()
-            for index in selected_indices:
-                username = user_listbox.get(index)
-                user = next(u for u in self.users if u.username == username)
-                user.is_approved = True
-            save_users(self.users)
-            user_listbox.delete(0, tk.END)
-            self.load_users()
+            self.service.approve([user_listbox.get(index) for index in selected_indices])
             top.destroy()
-            self.load_item_types()
 
         approve_button = tk.Button(top, text="批准所选用户", font=MiSans(10), command=approve_selected)
         approve_button.pack(pady=10)
@@ -402,24 +4634,45 @@ class AdminInterface:
         top.mainloop()
 
     def load_item_types(self):
-        for item_type in self.item_types:
-            self.listbox.insert(tk.END, item_type.name)
+        self.type_binding.clear()
+        self.type_binding.extend(self.item_types)
 
 # 用户界面
 class UserInterface:
-    def __init__(self, root, item_types, user):
+    def __init__(self, root, service, user, lazy_load=False):
         self.root = root
         adjust_window_size(root, 300, 300)
         #self.root.geometry("300x400+300+100")
-        self.item_types = item_types
+        self.service = service
+        self.item_types = service.item_types
         self.user = user
-        self.items = []
-        self.filename = "items.json"
+        self.lazy_load = lazy_load
+        self.load_chunk_size = 500
+        self.page_size = 50
+        self.cursor = 0        # 列表已显示到的物品编号；None 表示已全部显示
+        self.loading = False
+        self.archive_interval = 60000  # 检查过期物品的间隔（毫秒）
+        self.archive_job = None
+        root.bind("<Destroy>", lambda event: self.stop_archiving() if event.widget is root else None, add="+")
+        self.notification_interval = 5000  # 刷新未读通知数的间隔（毫秒）
+        self.notification_job = None
+        root.bind("<Destroy>", lambda event: self.stop_notification_poll() if event.widget is root else None, add="+")
 
-        self.listbox = tk.Listbox(root, font=MiSans(), width=16, height=10)
+        self.listbox = VirtualListbox(root, font=MiSans(), width=16, height=10)
         self.listbox.pack(pady=10)
         self.listbox.bind("<Double-1>", self.show_item_details)  # 绑定双击事件
 
+        # 物品列表按游标分页显示，跟随服务层的事件增量更新，items 与列表框中的行一一对应
+        # 还没翻到的物品（编号在游标之后）不显示，翻到时再追加；自己添加的物品例外，见 shows_item
+        self.item_binding = ListBinding(self.listbox, service.events, "items",
+                                        key=lambda item: item.item_id, label=lambda item: item.name,
+                                        accept=self.shows_item)
+        self.item_binding.bind_lifetime(root)
+        self.items = self.item_binding.records
+
+        self.more_button = tk.Button(root, text="更多物品", font=MiSans(10), command=self.load_page)
+        self.more_button.pack()
+
         self.add_button = tk.Button(root, text="添加物品", font=MiSans(10), command=self.add_item)
         self.add_button.pack(side=tk.LEFT, padx=10)
 
@@ -429,7 +4682,20 @@ class UserInterface:
         self.find_button = tk.Button(root, text="查找物品", font=MiSans(10), command=self.find_item)
         self.find_button.pack(side=tk.LEFT, padx=10)
 
+        self.nearby_button = tk.Button(root, text="附近物品", font=MiSans(10), command=self.nearby_items)
+        self.nearby_button.pack(side=tk.LEFT, padx=10)
+
+        self.mine_button = tk.Button(root, text="我的物品", font=MiSans(10), command=self.my_items)
+        self.mine_button.pack(side=tk.LEFT, padx=10)
+
+        self.searches_button = tk.Button(root, text="我的求购", font=MiSans(10), command=self.show_searches)
+        self.searches_button.pack(side=tk.LEFT, padx=10)
+
+        self.notify_button = tk.Button(root, text="通知", font=MiSans(10), command=self.show_notifications)
+        self.notify_button.pack(side=tk.LEFT, padx=10)
+
         self.load_items()
+        self.poll_notifications()
 
     def add_item(self):
         top = tk.Toplevel(self.root)
@@ -515,30 +4781,41 @@ class UserInterface:
                 else:
                     attributes[attr] = ""  # 如果没有找到对应的输入字段，使用默认值
 
-            # 创建物品实例
-            item = item_class(name, description, location, contact_phone, email, self.user.username, **attributes)
-            self.items.append(item)
-            self.listbox.insert(tk.END, name)
-            self.save_items()
-            top.destroy()
+            # 创建物品实例，列表通过 items 事件追加这一行；写盘完成后再关闭对话框
+            self.service.add_item(self.user, category, name, description, location, contact_phone, email, attributes)
+            self.wait_saved(self.service.durable(), top)
         else:
             messagebox.showerror("错误", "物品种类不匹配")
 
+    # 和登录一样用 after 轮询后台写入，界面保持响应；top 为写盘完成后关闭的对话框
+    def wait_saved(self, future, top=None):
+        if not future.done():
+            self.root.after(20, self.wait_saved, future, top)
+            return
+        if top is not None:
+            top.destroy()
+        if future.exception() is not None:
+            messagebox.showerror("保存失败", str(future.exception()))
+
     def delete_item(self):
         try:
             index = self.listbox.curselection()[0]
-            item_name = self.items[index].name
-            if messagebox.askyesno("确认删除", f"确定要删除物品 '{item_name}' 吗？"):
-                self.items.pop(index)
-                self.listbox.delete(index)
-                self.save_items()
+            item = self.items[index]
+            self.service.get_item(item.item_id)  # 列表可能先于索引显示，还没加载到的物品暂时不能删除
+            if not self.service.can_delete(self.user, item.item_id):
+                messagebox.showerror("错误", "只能删除自己添加的物品")
+            elif messagebox.askyesno("确认删除", f"确定要删除物品 '{item.name}' 吗？"):
+                self.service.delete_item(item.item_id, self.user)
+                self.wait_saved(self.service.durable())
         except IndexError:
             messagebox.showerror("错误", "请选择要删除的物品")
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
 
     def find_item(self):
         top = tk.Toplevel(self.root)
         top.title("查找物品")
-        adjust_window_size(top, 300, 100)
+        adjust_window_size(top, 300, 150)
         #top.geometry("300x300+300+100")
 
         category_var = tk.StringVar(top)
@@ -553,37 +4830,226 @@ class UserInterface:
         keyword_entry = tk.Entry(top, textvariable=keyword_var, font=MiSans(), width=16)
         keyword_entry.grid(row=1, column=1, sticky="w")
 
+        # 属性条件示例：数量>=10，保质期<2025-03-01，颜色=红
+        conditions_var = tk.StringVar(top)
+        tk.Label(top, text="属性条件:", font=MiSans()).grid(row=2, column=0, sticky="e")
+        tk.Entry(top, textvariable=conditions_var, font=MiSans(), width=16).grid(row=2, column=1, sticky="w")
+
+        location_var = tk.StringVar(top)
+        tk.Label(top, text="地址前缀:", font=MiSans()).grid(row=3, column=0, sticky="e")
+        tk.Entry(top, textvariable=location_var, font=MiSans(), width=16).grid(row=3, column=1, sticky="w")
+
         def on_search():
-            category = category_var.get()
+            category = "" if category_var.get() == "请选择" else category_var.get()
             keyword = keyword_var.get()
-            if category == "请选择" or not keyword:
-                messagebox.showerror("错误", "请选择物品种类并输入关键词")
-                return
+            location = location_var.get().strip()
+            facet_counts = {}
+            try:
+                conditions = parse_conditions(conditions_var.get())
+                if not conditions and not location:
+                    # 只有关键词时使用排序搜索，结果分页显示
+                    self.service.search_items(keyword, category, limit=0)
+                    top.destroy()
 
-            found_items = []
-            for item in self.items:
-                if (item.__class__.__name__ == category and (
-                    keyword.lower() in item.name.lower() or 
-                    keyword.lower() in item.description.lower() or 
-                    keyword.lower() in item.added_by.lower()
-                )):
-                    found_items.append(item)
+                    # 排序结果按位置分页，游标就是下一页的起始位置
+                    def fetch(cursor, limit):
+                        offset = cursor or 0
+                        page, total = self.service.search_items(keyword, category, offset, limit)
+                        return page, offset + limit if offset + limit < total else None, total
+                    self.show_results(f"搜索 '{keyword}'", fetch)
+                    return
+                found_items, total, facet_counts = self.service.filter_items(category, keyword, conditions, location)
+            except ValueError as e:
+                messagebox.showerror("错误", str(e))
+                return
 
             if found_items:
                 items_info = ""
                 for item in found_items:
                     items_info += item.get_details() + "\n\n"
+                # 分面计数：每个属性最多列出 5 个最常见的值
+                for attr, counter in facet_counts.items():
+                    if counter:
+                        items_info += f"{attr}: " + "，".join(f"{value}({count})" for value, count in list(counter.items())[:5]) + "\n"
                 messagebox.showinfo("查找结果", items_info)
             else:
-                messagebox.showinfo("未找到", "未找到包含该关键词的物品")
+                messagebox.showinfo("未找到", "未找到符合条件的物品")
             top.destroy()
 
-        tk.Button(top, text="搜索", command=on_search, font=MiSans(10)).grid(row=2, column=0, columnspan=2)
+        # 把当前条件保存为求购，以后有符合条件的新物品时收到通知
+        def on_save():
+            category = "" if category_var.get() == "请选择" else category_var.get()
+            try:
+                self.service.save_search(self.user, category, keyword_var.get(), conditions_var.get(), location_var.get())
+            except ValueError as e:
+                messagebox.showerror("错误", str(e), parent=top)
+                return
+            messagebox.showinfo("已保存", "以后有符合条件的新物品时会通知您", parent=top)
+            top.destroy()
+
+        tk.Button(top, text="搜索", command=on_search, font=MiSans(10)).grid(row=4, column=0)
+        tk.Button(top, text="保存为求购", command=on_save, font=MiSans(10)).grid(row=4, column=1)
+
+    # 分页显示结果：fetch(cursor, limit) 返回 (当前页, 下一页的游标, 总数)，第一页的游标为 None
+    # 点“下一页”时追加下一页，双击查看详情；deletable 为 True 时可以删除选中的物品
+    def show_results(self, title, fetch, page_size=50, deletable=False):
+        top = tk.Toplevel(self.root)
+        top.title(title)
+        results = []
+        state = {"cursor": None, "total": 0}
+        listbox = VirtualListbox(top, font=MiSans(), width=30, height=15, filterable=False)
+        listbox.pack(fill=tk.BOTH, expand=True)
+        status = tk.Label(top, font=MiSans(10))
+        status.pack()
+
+        def update_status():
+            status.config(text=f"共 {state['total']} 件，已显示 {len(results)} 件")
+
+        def load_page():
+            page, state["cursor"], state["total"] = fetch(state["cursor"], page_size)
+            results.extend(page)
+            listbox.insert(tk.END, *[item.name for item in page])
+            update_status()
+            more.config(state=tk.NORMAL if state["cursor"] is not None else tk.DISABLED)
+
+        def show_details(event):
+            selection = listbox.curselection()
+            if selection:
+                messagebox.showinfo("物品详细信息", results[selection[0]].hydrate().get_details(), parent=top)
+
+        def delete_selected():
+            selection = listbox.curselection()
+            if not selection:
+                messagebox.showerror("错误", "请选择要删除的物品", parent=top)
+                return
+            item = results[selection[0]]
+            if not messagebox.askyesno("确认删除", f"确定要删除物品 '{item.name}' 吗？", parent=top):
+                return
+            try:
+                self.service.delete_item(item.item_id, self.user)
+            except (ValueError, PermissionError) as e:
+                messagebox.showerror("错误", str(e), parent=top)
+                return
+            self.wait_saved(self.service.durable())
+            del results[selection[0]]
+            listbox.delete(selection[0])
+            state["total"] -= 1
+            update_status()
+
+        more = tk.Button(top, text="下一页", command=load_page, font=MiSans(10))
+        more.pack(side=tk.LEFT if deletable else tk.TOP)
+        if deletable:
+            tk.Button(top, text="删除", command=delete_selected, font=MiSans(10)).pack(side=tk.LEFT)
+        listbox.bind("<Double-Button-1>", show_details)
+        load_page()
+
+    # 只列出当前用户添加的物品，按页读取
+    def my_items(self):
+        self.show_results("我的物品", lambda cursor, limit: self.service.my_items(self.user, cursor, limit),
+                          deletable=True)
             
+    @staticmethod
+    def describe_search(search):
+        parts = []
+        if search.get("category"):
+            parts.append(f"种类: {search['category']}")
+        if search.get("keyword"):
+            parts.append(f"关键词: {search['keyword']}")
+        parts += ["".join(condition) for condition in search.get("conditions", ())]
+        if search.get("location"):
+            parts.append(f"地区: {search['location']}")
+        return "，".join(parts)
+
+    # 列出保存的求购条件，可以删除
+    def show_searches(self):
+        top = tk.Toplevel(self.root)
+        top.title("我的求购")
+        searches = self.service.list_searches(self.user)
+        listbox = VirtualListbox(top, font=MiSans(), width=30, height=10, filterable=False)
+        listbox.pack(fill=tk.BOTH, expand=True)
+        listbox.insert(tk.END, *[self.describe_search(search) for search in searches])
+
+        def delete_selected():
+            selection = listbox.curselection()
+            if not selection:
+                messagebox.showerror("错误", "请选择要删除的求购", parent=top)
+                return
+            try:
+                self.service.delete_search(self.user, searches[selection[0]]["id"])
+            except ValueError as e:
+                messagebox.showerror("错误", str(e), parent=top)
+                return
+            del searches[selection[0]]
+            listbox.delete(selection[0])
+
+        tk.Button(top, text="删除", command=delete_selected, font=MiSans(10)).pack()
+
+    # 定时刷新未读通知数；其他进程添加的物品命中时也写进同一个通知队列
+    def poll_notifications(self):
+        try:
+            count = len(self.service.notifications(self.user))
+        except OSError:
+            count = 0
+        self.notify_button.config(text=f"通知({count})" if count else "通知")
+        self.notification_job = self.root.after(self.notification_interval, self.poll_notifications)
+
+    def stop_notification_poll(self):
+        if self.notification_job is not None:
+            self.root.after_cancel(self.notification_job)
+            self.notification_job = None
+
+    # 列出未读通知，双击查看物品；“全部已读”只标记窗口中显示的通知
+    def show_notifications(self):
+        notifications = self.service.notifications(self.user)
+        if not notifications:
+            messagebox.showinfo("通知", "没有新的通知")
+            return
+        top = tk.Toplevel(self.root)
+        top.title("通知")
+        listbox = VirtualListbox(top, font=MiSans(), width=30, height=10, filterable=False)
+        listbox.pack(fill=tk.BOTH, expand=True)
+        listbox.insert(tk.END, *[f"{record['name']}（{record['type']}）" for record in notifications])
+
+        def show_details(event):
+            selection = listbox.curselection()
+            if not selection:
+                return
+            try:
+                item = self.service.get_item(notifications[selection[0]]["item"])
+            except ValueError as e:
+                messagebox.showerror("错误", str(e), parent=top)
+                return
+            messagebox.showinfo("物品详细信息", item.hydrate().get_details(), parent=top)
+
+        def dismiss():
+            self.service.dismiss_notifications(self.user, notifications[-1]["seq"])
+            top.destroy()
+            self.stop_notification_poll()
+            self.poll_notifications()
+
+        listbox.bind("<Double-Button-1>", show_details)
+        tk.Button(top, text="全部已读", command=dismiss, font=MiSans(10)).pack()
+
+    # 按与当前用户住址的远近列出物品，可以限定在某个省、市或区县内
+    def nearby_items(self):
+        region = simpledialog.askstring("附近物品", "限定地区（省、市或区县，可留空）:", parent=self.root)
+        if region is None:
+            return
+        try:
+            found_items, total = self.service.items_near(self.user.address, region.strip(), limit=20)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        if not found_items:
+            messagebox.showinfo("未找到", "该地区没有物品")
+            return
+        items_info = "\n".join(f"{item.name}  {item.hydrate().location}" for item in found_items)
+        messagebox.showinfo("附近物品", f"共 {total} 件，按与您住址的远近排列，显示前 {len(found_items)} 件:\n\n{items_info}")
+
     def show_item_details(self, event):
         try:
             index = self.listbox.curselection()[0]
-            item = self.items[index]
+            item = self.items[index].hydrate()
             details = (f"物品名称: {item.name}\n"
                        f"物品说明: {item.description}\n"
                        f"所在地址: {item.location}\n"
@@ -591,51 +5057,145 @@ class UserInterface:
                        f"邮箱: {item.email}\n"
                        f"物品种类: {item.__class__.__name__}\n"
                        f"添加用户: {item.added_by}\n")
-            for attr in item.__dict__:
-                if attr not in ["name", "description", "location", "contact_phone", "email", "added_by"]:
-                    details += f"{attr}: {getattr(item, attr)}\n"
+            for attr in item.attributes:
+                details += f"{attr}: {getattr(item, attr)}\n"
             messagebox.showinfo("物品详细信息", details)
         except IndexError:
             messagebox.showerror("错误", "请选择一个物品")
 
-    def save_items(self):
-        items_data = [item.to_dict() for item in self.items]
-        with open(self.filename, "w", encoding="utf-8") as file:
-            json.dump(items_data, file, ensure_ascii=False, indent=4)
-
+    # 流式加载物品建立索引，每次 root.after 回调只处理一块；列表只显示第一页，其余的按“更多物品”翻页
+    # 列表和“我的物品”按页读取，存储有索引时（SQLite）第一页马上显示，不等索引建完；
+    # 查找、附近物品和求购通知要用到完整的内存索引
     def load_items(self):
+        self.item_binding.clear()
+        self.cursor = 0
+        self.loading = True
+        self.loader = self.service.iter_load_items(self.lazy_load)
+        self.load_page()
+        self.root.after(0, self.load_next_chunk)
+
+    def load_next_chunk(self):
+        count = 0
         try:
-            with open(self.filename, "r", encoding="utf-8") as file:
-                items_data = json.load(file)
-                self.items = [Item.from_dict(data) for data in items_data]
-                self.listbox.delete(0, tk.END)
-                for item in self.items:
-                    self.listbox.insert(tk.END, item.name)
-        except FileNotFoundError:
-            pass
-        except json.JSONDecodeError:
+            for entry in itertools.islice(self.loader, self.load_chunk_size):
+                count += 1
+        except ValueError:
             messagebox.showerror("错误", "文件格式不正确")
+            return
+        self.loading = count == self.load_chunk_size
+        if self.loading:
+            self.root.after(1, self.load_next_chunk)
+        elif self.service.auto_archive:
+            self.archive_job = self.root.after(0, self.archive_expired)
+        # 第一页还没填满时（包括刚开始加载）继续补齐；加载结束时已经翻到底的话不再显示“更多物品”
+        if len(self.items) < self.page_size:
+            self.load_page(self.page_size - len(self.items))
+        elif not self.loading and self.cursor is not None and not self.service.browse_items(self.cursor, 1)[0]:
+            self.cursor = None
+            self.more_button.config(state=tk.DISABLED)
+
+    # 定时把过期物品移到归档文件；一批没处理完时马上接着处理下一批，批与批之间界面照常响应
+    def archive_expired(self):
+        try:
+            archived = self.service.archive_expired()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"归档过期物品失败: {e}")
+            return
+        # 存储忙时本批被跳过，过一秒再试
+        delay = 1 if archived else 1000 if self.service.has_expired() else self.archive_interval
+        self.archive_job = self.root.after(delay, self.archive_expired)
+
+    def stop_archiving(self):
+        if self.archive_job is not None:
+            self.root.after_cancel(self.archive_job)
+            self.archive_job = None
+
+    # 当前用户自己添加的物品即使还没翻到也马上显示在列表末尾，翻到那一页时不再重复追加
+    def shows_item(self, item):
+        return (self.cursor is None or item.item_id <= self.cursor
+                or self.service.owners.owner_of(item.item_id) == self.user.username)
+
+    # 按游标追加下一页；还在加载时不能断定已经到底，游标保持为最后显示的编号
+    def load_page(self, limit=None):
+        if self.cursor is not None:
+            page, next_cursor, total = self.service.browse_items(self.cursor, limit or self.page_size)
+            if page:
+                self.cursor = page[-1].item_id
+            if next_cursor is None and not self.loading:
+                self.cursor = None
+            self.item_binding.extend(page)
+        self.more_button.config(state=tk.DISABLED if self.cursor is None else tk.NORMAL)
 
 # 主函数
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="物品复活软件")
+    parser.add_argument("--storage", choices=["json", "sqlite", "binary"], default="json", help="存储后端")
+    parser.add_argument("--db", default="item_revive.db", help="SQLite 数据库文件")
+    parser.add_argument("--lazy", action="store_true", help="懒加载物品，只在查看详情时读取完整记录")
+    parser.add_argument("--archive", action="store_true", help="定时把过期物品移到归档文件")
+    parser.add_argument("--archive-grace", type=int, default=0, metavar="DAYS", help="过期超过 DAYS 天才归档")
+    parser.add_argument("--import-json", metavar="DIR", help="把 DIR 中的 JSON 文件导入 SQLite 数据库后退出")
+    parser.add_argument("--export-json", metavar="DIR", help="把 SQLite 数据库导出为 DIR 中的 JSON 文件后退出")
+    parser.add_argument("--profile-startup", action="store_true", help="打印从启动到登录窗口首次绘制的耗时分解")
+    parser.add_argument("--metrics", metavar="FILE", help="记录运行指标，退出时写入 FILE（.prom 为 Prometheus 格式，否则为 JSON）")
+    parser.add_argument("--profile-sample", type=float, default=0, metavar="RATE",
+                        help="按比例抽样用 cProfile 分析被计时的操作（需要 --metrics），POSIX 上可用 SIGUSR1 开关")
+    parser.add_argument("--profile-output", default="item_revive.prof", help="cProfile 抽样结果文件")
+    args = parser.parse_args()
+    if args.profile_sample and not args.metrics:
+        parser.error("--profile-sample 需要同时指定 --metrics")
+    mark_startup("导入模块")
+    if args.metrics:
+        metrics.enable()
+        metrics.set_profile_rate(args.profile_sample)
+        metrics.install_profile_toggle(args.profile_sample or 0.01)
+
+    if args.import_json or args.export_json:
+        directory = args.import_json or args.export_json
+        json_storage = JsonStorage(os.path.join(directory, "users.json"),
+                                   os.path.join(directory, "item_types.json"),
+                                   os.path.join(directory, "items.json"))
+        sqlite_storage = SQLiteStorage(args.db)
+        if args.import_json:
+            sqlite_storage.import_json(json_storage)
+        else:
+            for item_type in sqlite_storage.load_item_types():
+                item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+            sqlite_storage.export_json(json_storage)
+        sqlite_storage.close()
+        raise SystemExit
+
     enable_high_dpi_awareness()
+    import_tk()
+    mark_startup("导入 tkinter")
     
     root = tk.Tk()
     root.title("物品复活软件")
+    mark_startup("创建 Tk")
 
-    # 初始化物品类型和用户列表
-    item_types = load_item_types()
-    users = load_users()
-
-    # 为每个物品种类动态创建继承类
-    for item_type in item_types:
-        create_item_class(item_type.name, item_type.attributes)
+    # 初始化物品类型和用户列表；物品在登录后才加载
+    service = ItemReviveService(open_storage(args.storage, args.db), args.archive, args.archive_grace)
+    service.migrate_passwords()
+    mark_startup("加载用户和类型")
 
     # 主窗口
-    app = MainWindow(root, users, item_types)
+    app = MainWindow(root, service, args.lazy)
+    mark_startup("构建登录窗口")
 
-    root.mainloop()
+    if args.profile_startup:
+        def on_first_paint(event):
+            root.unbind("<Map>")
+            root.update_idletasks()
+            mark_startup("首次绘制")
+            print_startup_profile()
+        root.bind("<Map>", on_first_paint)
 
-    # 程序退出时保存用户信息和物品类型信息
-    save_users(users)
-    save_item_types(item_types)
\ No newline at end of file
+    exit_on_sigterm()
+    try:
+        root.mainloop()
+    finally:
+        # 程序退出时保存用户信息和物品类型信息
+        service.close()
+        if args.metrics:
+            metrics.dump(args.metrics)
+            metrics.dump_profile(args.profile_output)
\ No newline at end of file
@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import item_revive_v2 as app
+
+# 物品种类登记在模块级的 item_classes 中，每个测试结束后恢复，结构变更不会影响其他测试
+@pytest.fixture(autouse=True)
+def item_classes():
+    classes = dict(app.item_classes)
+    pending = dict(app.item_classes.pending)
+    yield app.item_classes
+    app.item_classes.clear()
+    app.item_classes.update(classes)
+    app.item_classes.pending.clear()
+    app.item_classes.pending.update(pending)
+
+# 临时目录中的示例数据（users.json / item_types.json / items.json），并切换到该目录
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    for name in ("users.json", "item_types.json", "items.json"):
+        shutil.copy(os.path.join(ROOT, name), tmp_path / name)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def item_types(data_dir):
+    item_types = app.load_item_types(str(data_dir / "item_types.json"))
+    for item_type in item_types:
+        app.item_classes.register(item_type.name, item_type.attributes, item_type.changes)
+    return item_types
+
+# 不带后台写入线程的 JSON 存储，写盘在调用返回前完成
+@pytest.fixture
+def service(data_dir):
+    service = app.ItemReviveService(app.JsonStorage())
+    service.load_items()
+    yield service
+    service.close()
+
+def make_item(type_name="食品", name="测试物品", location="北京市朝阳区", added_by="user1", **attributes):
+    item_class = app.item_classes[type_name]
+    values = {attr: attributes.get(attr, "") for attr in item_class.attributes}
+    return item_class(name, "说明", location, "13800000000", "a@example.com", added_by, **values)
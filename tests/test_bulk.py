@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+
+import item_revive_bulk as bulk
+import item_revive_v2 as app
+
+def write_rows(path, count):
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(count):
+            file.write(json.dumps({"type": "食品", "name": f"导入物品{i}", "description": "", "location": "北京市",
+                                   "contact_phone": "", "email": "", "保质期": "2027-01-01", "数量": str(i)},
+                                  ensure_ascii=False) + "\n")
+
+def imported_names(service):
+    return [entry.name for entry in service.items.values() if entry.name.startswith("导入物品")]
+
+def test_export_streams_without_building_the_id_table(data_dir, service):
+    storage = app.JsonStorage()
+    count = bulk.export_items(storage, str(data_dir / "out.jsonl"))
+    assert count == len(service.items)
+    assert storage.items_by_id == {}  # 没有经过 iter_items
+    with open(data_dir / "out.jsonl", encoding="utf-8") as file:
+        names = [json.loads(line)["name"] for line in file]
+    assert sorted(names) == sorted(entry.name for entry in service.items.values())
+
+def test_export_skips_deleted_and_includes_journal_adds(data_dir, service):
+    user = service.get_user("user1")
+    service.delete_item(next(iter(service.items)), user)
+    service.add_item(user, "食品", "日志中的物品", "", "北京市", "", "", {})
+    count = bulk.export_items(app.JsonStorage(), str(data_dir / "out.jsonl"))
+    assert count == len(service.items)
+    with open(data_dir / "out.jsonl", encoding="utf-8") as file:
+        assert "日志中的物品" in file.read()
+
+def test_interrupted_import_resumes_without_duplicates(data_dir, service, monkeypatch):
+    source = str(data_dir / "in.jsonl")
+    write_rows(source, 10)
+    user = service.get_user("admin")
+    add_items = service.add_items
+    calls = []
+
+    def failing_add_items(user, records):
+        calls.append(len(records))
+        if len(calls) == 2:
+            raise OSError("磁盘已满")
+        return add_items(user, records)
+
+    monkeypatch.setattr(service, "add_items", failing_add_items)
+    with pytest.raises(OSError):
+        bulk.import_items(service, user, source, workers=1, batch_size=4)
+    assert len(imported_names(service)) == 4
+    assert bulk.read_progress(source) == 4
+
+    # 没有 --resume 时拒绝从头再导入一遍
+    with pytest.raises(ValueError):
+        bulk.import_items(service, user, source, workers=1, batch_size=4)
+
+    monkeypatch.setattr(service, "add_items", add_items)
+    imported, failed = bulk.import_items(service, user, source, workers=1, batch_size=4, resume=True)
+    assert (imported, failed) == (6, 0)
+    assert sorted(imported_names(service)) == sorted(f"导入物品{i}" for i in range(10))
+    assert bulk.read_progress(source) == 0  # 完成后进度文件已删除
+
+def test_invalid_rows_are_reported_and_skipped(data_dir, service):
+    source = data_dir / "in.jsonl"
+    source.write_text('{"type": "食品", "name": "好的", "保质期": "", "数量": "1"}\n'
+                      '{"type": "不存在", "name": "坏的"}\nnot json\n', encoding="utf-8")
+    errors = io.StringIO()
+    imported, failed = bulk.import_items(service, service.get_user("admin"), str(source), workers=1, errors=errors)
+    assert (imported, failed) == (1, 2)
+    assert "第 2 行" in errors.getvalue() and "第 3 行" in errors.getvalue()
+
+@pytest.mark.parametrize("name", ["out.jsonl", "out.csv"])
+def test_round_trip_after_schema_change(data_dir, service, name):
+    service.change_item_type("食品", "add", "产地", "未知")
+    target = str(data_dir / name)
+    exported = bulk.export_items(app.JsonStorage(), target)
+    errors = io.StringIO()
+    imported, failed = bulk.import_items(service, service.get_user("admin"), target, workers=1, dry_run=True,
+                                         errors=errors)
+    assert (imported, failed) == (exported, 0), errors.getvalue()
+
+def test_old_schema_rows_are_upgraded_on_import(data_dir, service):
+    service.change_item_type("食品", "rename", "数量", "件数")
+    source = data_dir / "in.jsonl"
+    source.write_text(json.dumps({"type": "食品", "name": "旧记录", "保质期": "", "数量": "3", "schema": 1},
+                                 ensure_ascii=False) + "\n", encoding="utf-8")
+    imported, failed = bulk.import_items(service, service.get_user("admin"), str(source), workers=1)
+    assert (imported, failed) == (1, 0)
+    item = next(entry for entry in service.items.values() if entry.name == "旧记录").hydrate()
+    assert item.件数 == "3"
@@ -0,0 +1,53 @@
+import datetime
+
+import item_revive_v2 as app
+
+def open_service(clock, grace=0):
+    service = app.ItemReviveService(app.JsonStorage(), auto_archive=True, archive_grace_days=grace, clock=clock)
+    service.load_items()
+    return service
+
+def food_names(service):
+    return sorted(entry.name for entry in service.items.values() if entry.type_name == "食品")
+
+def test_archives_items_expired_before_the_injected_date(data_dir):
+    service = open_service(lambda: datetime.date(2025, 3, 20))
+    try:
+        assert service.next_expiry() == "2025-02-01"
+        assert service.has_expired()
+        archived = service.archive_expired()
+        assert [item.保质期 for item in archived] == ["2025-02-01", "2025-03-15"]
+        assert not service.has_expired()
+        assert [record["item"]["保质期"] for record in service.iter_archived()] == ["2025-02-01", "2025-03-15"]
+    finally:
+        service.close()
+    # 归档是持久的：重新打开后这两件不再出现
+    reopened = open_service(lambda: datetime.date(2025, 3, 20))
+    try:
+        assert reopened.next_expiry() == "2025-05-31"
+    finally:
+        reopened.close()
+
+def test_grace_period_delays_archiving(data_dir):
+    service = open_service(lambda: datetime.date(2025, 3, 20), grace=30)
+    try:
+        assert service.archive_cutoff() == "2025-02-18"
+        assert [item.保质期 for item in service.archive_expired()] == ["2025-02-01"]
+        assert not service.has_expired()
+        assert service.has_expired("2025-04-20")
+    finally:
+        service.close()
+
+def test_archive_batches_respect_limit(data_dir):
+    service = open_service(lambda: datetime.date(2026, 1, 1))
+    try:
+        assert len(service.archive_expired(limit=2)) == 2
+        assert service.has_expired()
+        assert len(service.archive_expired(limit=2)) == 1
+        assert not service.has_expired()
+    finally:
+        service.close()
+
+def test_archiving_is_off_by_default(data_dir, service):
+    assert not service.auto_archive
+    assert len(food_names(service)) == 4  # 示例数据中过期的食品仍然可见
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import item_revive_v2 as app
+
+# 只记录行内容的列表框，测试不需要显示器
+class FakeListbox:
+    def __init__(self):
+        self.rows = []
+
+    def insert(self, index, *labels):
+        self.rows.extend(labels)
+
+    def delete(self, first, last=None):
+        if last is None:
+            del self.rows[first]
+        else:
+            self.rows.clear()
+
+    def set(self, index, label):
+        self.rows[index] = label
+
+# 用户界面中物品列表的分页状态，方法直接取自 UserInterface
+def user_list(service, user, page_size):
+    app.import_tk()  # ListBinding 用到 tk.END，导入 tkinter 不需要显示器
+    ui = SimpleNamespace(service=service, user=user, cursor=0, loading=False, page_size=page_size,
+                         more_button=SimpleNamespace(config=lambda **options: None))
+    ui.listbox = FakeListbox()
+    ui.item_binding = app.ListBinding(ui.listbox, service.events, "items", key=lambda item: item.item_id,
+                                      label=lambda item: item.name,
+                                      accept=lambda item: app.UserInterface.shows_item(ui, item))
+    ui.load_page = lambda limit=None: app.UserInterface.load_page(ui, limit)
+    ui.load_page()
+    return ui
+
+def add(service, user, name):
+    return service.add_item(user, "食品", name, "说明", "北京市朝阳区", "138", "a@b.c", {})
+
+def test_own_new_item_shows_before_paging_to_the_end(service):
+    user = service.get_user("user1")
+    ui = user_list(service, user, page_size=5)
+    assert len(ui.listbox.rows) == 5 and ui.cursor is not None  # 后面还有页
+
+    item = add(service, user, "刚添加的物品")
+    assert ui.listbox.rows[-1] == "刚添加的物品"
+    add(service, service.get_user("alice"), "别人添加的物品")
+    assert "别人添加的物品" not in ui.listbox.rows
+
+    while ui.cursor is not None:
+        ui.load_page()
+    ids = [record.item_id for record in ui.item_binding.records]
+    assert len(ids) == len(set(ids)) == len(service.items)
+    assert ui.listbox.rows.count("刚添加的物品") == 1
+    assert ui.listbox.rows == [record.name for record in ui.item_binding.records]
+
+    service.delete_item(item.item_id, user)
+    assert "刚添加的物品" not in ui.listbox.rows
@@ -0,0 +1,119 @@
+import os
+
+from conftest import make_item
+
+import item_revive_v2 as app
+
+def load_names(filename):
+    journal = app.ItemJournal(filename)
+    return {item.item_id: item.name for entry, item in journal.iter_load()}, journal
+
+def test_replay_adds_and_deletes(data_dir, item_types):
+    filename = str(data_dir / "items.json")
+    journal = app.ItemJournal(filename)
+    items = journal.load()
+    assert len(items) == 12
+    added = make_item(name="新物品")
+    journal.append_adds([added])
+    journal.append_delete(items[1])
+
+    names, _ = load_names(filename)
+    assert names[added.item_id] == "新物品"
+    assert items[1].item_id not in names
+    assert len(names) == 12
+
+def test_compaction_folds_journal_into_snapshot(data_dir, item_types):
+    filename = str(data_dir / "items.json")
+    journal = app.ItemJournal(filename, compact_threshold=3)
+    journal.load()
+    for index in range(3):
+        journal.append_adds([make_item(name=f"物品{index}")])
+    assert journal.needs_compaction()
+    before, _ = load_names(filename)
+    journal.compact()
+
+    assert os.path.getsize(filename + ".journal") == 0
+    after, _ = load_names(filename)
+    assert after == before
+
+def test_torn_journal_tail_is_truncated_before_next_append(data_dir, item_types):
+    filename = str(data_dir / "items.json")
+    journal = app.ItemJournal(filename)
+    journal.load()
+    journal.append_adds([make_item(name="完整")])
+    with open(filename + ".journal", "ab") as file:
+        file.write(b'{"op": "add", "item": {"name": "\xe5\x86')
+
+    names, reloaded = load_names(filename)
+    assert "完整" in names.values()
+    reloaded.append_adds([make_item(name="之后")])
+    names, _ = load_names(filename)
+    assert {"完整", "之后"} <= set(names.values())
+
+def test_journal_line_with_bad_checksum_is_skipped(data_dir, item_types):
+    filename = str(data_dir / "items.json")
+    journal = app.ItemJournal(filename)
+    journal.load()
+    journal.append_adds([make_item(name="甲"), make_item(name="乙"), make_item(name="丙")])
+    with open(filename + ".journal", "rb") as file:
+        lines = file.read().split(b"\n")
+    lines[1] = lines[1].replace("乙".encode("utf-8"), "丁".encode("utf-8"))
+    with open(filename + ".journal", "wb") as file:
+        file.write(b"\n".join(lines))
+
+    names, reloaded = load_names(filename)
+    assert {"甲", "丙"} <= set(names.values())
+    assert "乙" not in names.values() and "丁" not in names.values()
+    assert reloaded.take_damaged()
+
+def test_damaged_snapshot_record_is_salvaged_and_repaired(data_dir, item_types):
+    filename = str(data_dir / "items.json")
+    journal = app.ItemJournal(filename)
+    journal.load()
+    journal.compact()  # 写出带校验和的快照
+    with open(filename, "rb") as file:
+        data = bytearray(file.read())
+    position = data.index("牛奶".encode("utf-8"))
+    data[position:position + 3] = "羊".encode("utf-8")
+    with open(filename, "wb") as file:
+        file.write(data)
+
+    names, damaged = load_names(filename)
+    assert len(names) == 11
+    assert "牛奶" not in names.values() and "羊奶" not in names.values()
+    assert damaged.take_damaged()
+
+    # load() 发现损坏后压缩：先备份损坏的文件，再用抢救出的记录重写
+    app.ItemJournal(filename).load()
+    assert os.path.exists(filename + ".damaged")
+    names, repaired = load_names(filename)
+    assert len(names) == 11
+    assert not repaired.take_damaged()
+
+def test_truncated_snapshot_keeps_leading_records(data_dir, item_types):
+    filename = str(data_dir / "items.json")
+    journal = app.ItemJournal(filename)
+    journal.load()
+    journal.compact()
+    size = os.path.getsize(filename)
+    with open(filename, "r+b") as file:
+        file.truncate(size // 2)
+
+    names, damaged = load_names(filename)
+    assert 0 < len(names) < 12
+    assert damaged.take_damaged()
+
+def test_worker_append_returns_future_resolved_after_write(data_dir, item_types):
+    worker = app.PersistenceWorker(delay=0.2)
+    storage = app.JsonStorage(worker=worker)
+    try:
+        storage.load_items()
+        item = make_item(name="后台写入")
+        storage.add_item(item)
+        future = storage.durable()
+        assert not future.done()  # 调用线程不等磁盘
+        future.result(5)
+        with open(data_dir / "items.json.journal", encoding="utf-8") as file:
+            assert "后台写入" in file.read()
+    finally:
+        storage.close()
@@ -0,0 +1,40 @@
+import pytest
+
+import item_revive_v2 as app
+
+@pytest.mark.parametrize("text, expected", [
+    ("广州市天河区", ("广东省", "广州市", "天河区")),
+    ("深圳南山区", ("广东省", "深圳市", "南山区")),
+    ("广东深圳", ("广东省", "深圳市", None)),
+    ("广东", ("广东省", None, None)),
+    ("北京朝阳区", ("北京市", "北京市", "朝阳区")),
+    ("朝阳区", (None, None, "朝阳区")),
+    ("吉林", ("吉林省", None, None)),
+    ("吉林市船营区", ("吉林省", "吉林市", "船营区")),
+    ("内蒙古呼和浩特新城区", ("内蒙古自治区", "呼和浩特市", "新城区")),
+    ("延边朝鲜族自治州", ("吉林省", "延边朝鲜族自治州", None)),
+    ("某某省某某市某区", ("某某省", "某某市", "某区")),
+    ("中山路100号", (None, None, None)),
+    ("东上院", (None, None, None)),
+])
+def test_parse_location(text, expected):
+    assert app.parse_location(text) == expected
+
+def locations(service, item_ids):
+    return [service.items[item_id].hydrate().location for item_id in item_ids]
+
+def test_region_by_province(service):
+    found = service.locations.region("广东省")
+    assert sorted(locations(service, found)) == ["广州市天河区", "深圳市南山区"]
+    assert service.locations.region("广东") == found
+
+def test_items_near_ranks_same_province_first(service):
+    page, total = service.items_near("深圳市福田区")
+    nearby = [entry.hydrate().location for entry in page]
+    assert nearby[:2] == ["深圳市南山区", "广州市天河区"]
+
+def test_district_without_suffix_uses_known_districts(service):
+    user = service.get_user("user1")
+    item = service.add_item(user, "食品", "科技园的物品", "", "深圳南山科技园", "", "", {})
+    assert service.locations.paths[item.item_id] == ("广东省", "深圳市", "南山区")
+    assert item.item_id in service.locations.region("深圳市南山区")
@@ -0,0 +1,55 @@
+import json
+
+import item_revive_v2 as app
+
+def reload(data_dir):
+    service = app.ItemReviveService(app.JsonStorage())
+    service.load_items()
+    return service
+
+def test_old_records_are_upgraded_on_read(item_types):
+    app.item_classes.register("食品", ["保质期", "数量", "产地"],
+                              [{"op": "add", "attr": "产地", "default": "未知"}])
+    record = {"name": "苹果", "description": "", "location": "北京市", "contact_phone": "", "email": "",
+              "added_by": "user1", "type": "食品", "保质期": "2027-01-01", "数量": "1"}
+    item = app.Item.from_dict(record)
+    assert item.产地 == "未知"
+    assert item.to_dict()["schema"] == 2
+    assert "schema" not in record  # 原记录不变
+
+def test_rename_and_remove_chain(item_types):
+    changes = [{"op": "rename", "attr": "数量", "to": "件数"}, {"op": "remove", "attr": "保质期"}]
+    app.item_classes.register("食品", ["件数"], changes)
+    data = app.upgrade_record({"type": "食品", "保质期": "2027-01-01", "数量": "3"})
+    assert data == {"type": "食品", "件数": "3", "schema": 3}
+    # 已经是第 2 版的记录只应用之后的变更
+    data = app.upgrade_record({"type": "食品", "保质期": "2027-01-01", "件数": "3", "schema": 2})
+    assert data == {"type": "食品", "件数": "3", "schema": 3}
+
+def test_change_item_type_persists_and_upgrades(data_dir, service):
+    service.change_item_type("食品", "add", "产地", "未知")
+    food = [entry.hydrate() for entry in service.items.values() if entry.type_name == "食品"]
+    assert food and all(item.产地 == "未知" for item in food)
+
+    with open(data_dir / "item_types.json", encoding="utf-8") as file:
+        saved = {record["name"]: record for record in json.load(file)}
+    assert saved["食品"]["changes"] == [{"op": "add", "attr": "产地", "default": "未知"}]
+
+    service.close()
+    reloaded = reload(data_dir)
+    try:
+        food = [entry.hydrate() for entry in reloaded.items.values() if entry.type_name == "食品"]
+        assert all(item.产地 == "未知" for item in food)
+        found, total, facets = reloaded.filter_items("食品", conditions=[("产地", "=", "未知")])
+        assert total == len(food)
+    finally:
+        reloaded.close()
+
+def test_schema_change_validation(service):
+    for args in (("食品", "add", "数量"), ("食品", "rename", "没有", "新"), ("工具", "remove", "数量"),
+                 ("不存在", "add", "新"), ("食品", "add", "schema")):
+        try:
+            service.change_item_type(*args)
+        except ValueError:
+            continue
+        raise AssertionError(f"{args} 应当被拒绝")
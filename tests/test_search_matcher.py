@@ -0,0 +1,102 @@
+from conftest import make_item
+
+import item_revive_v2 as app
+
+def matcher_with(*searches):
+    matcher = app.SearchMatcher()
+    for index, (username, search) in enumerate(searches, 1):
+        matcher.add(username, dict({"id": index, "category": None, "keyword": None, "conditions": [],
+                                    "location": None}, **search))
+    return matcher
+
+def matched_users(matcher, item):
+    return [username for username, search in matcher.match(item)]
+
+def test_keyword_and_equality_anchors(item_types):
+    matcher = matcher_with(("bob", {"category": "食品", "keyword": "苹果"}),
+                           ("carol", {"category": "食品", "conditions": [["数量", "=", "5"]]}),
+                           ("dave", {"category": "书籍", "keyword": "苹果"}))
+    assert matched_users(matcher, make_item(name="红苹果", 数量="5")) == ["bob", "carol"]
+    assert matched_users(matcher, make_item(name="香蕉", 数量="6")) == []
+
+def test_range_location_and_category_only(item_types):
+    matcher = matcher_with(("bob", {"category": "食品", "conditions": [["数量", ">=", "10"]]}),
+                           ("carol", {"category": "食品", "location": "北京市"}),
+                           ("dave", {"category": "食品"}))
+    assert matched_users(matcher, make_item(数量="12", location="北京市海淀区")) == ["bob", "carol", "dave"]
+    assert matched_users(matcher, make_item(数量="3", location="上海市浦东新区")) == ["dave"]
+
+def test_own_items_and_removed_searches_do_not_match(item_types):
+    matcher = matcher_with(("bob", {"keyword": "苹果"}), ("carol", {"keyword": "苹果"}))
+    assert matched_users(matcher, make_item(name="苹果", added_by="bob")) == ["carol"]
+    matcher.remove("carol", 2)
+    assert matched_users(matcher, make_item(name="苹果", added_by="bob")) == []
+    assert len(matcher) == 1
+
+def test_service_notifies_search_owner(service):
+    alice = service.get_user("alice")
+    user1 = service.get_user("user1")
+    service.save_search(alice, "食品", "苹果", "数量>=10", "")
+    service.add_item(user1, "食品", "青苹果", "说明", "北京市朝阳区", "138", "a@b.c", {"数量": "20"})
+    service.add_item(user1, "食品", "青苹果", "说明", "北京市朝阳区", "138", "a@b.c", {"数量": "2"})
+    notifications = service.notifications(alice)
+    assert [record["name"] for record in notifications] == ["青苹果"]
+    service.dismiss_notifications(alice)
+    assert service.notifications(alice) == []
+
+def anchor_of(matcher, username, search_id=1):
+    return matcher.keys[username, search_id][1]
+
+def test_location_and_range_searches_get_their_own_anchors(item_types):
+    matcher = matcher_with(("bob", {"category": "食品", "location": "广州市天河区"}),
+                           ("carol", {"category": "食品", "location": "广东省"}),
+                           ("dave", {"category": "食品", "conditions": [["数量", ">", "10"]]}),
+                           ("erin", {"category": "食品"}),
+                           ("fay", {"location": "东上院"}))
+    assert anchor_of(matcher, "bob", 1) == ("place", "district", "天河区")
+    assert anchor_of(matcher, "carol", 2) == ("place", "province", "广东省")
+    assert anchor_of(matcher, "dave", 3) == ("range", "数量", "number", "lower", 10.0)
+    assert anchor_of(matcher, "erin", 4) == ("type",)
+    assert anchor_of(matcher, "fay", 5) == ("type",)  # 无法识别的地址只能按前缀比较
+
+    assert matched_users(matcher, make_item(location="深圳市南山区", 数量="10")) == ["carol", "erin"]
+    assert matched_users(matcher, make_item(location="广州天河", 数量="11")) == ["carol", "dave", "erin"]
+    assert matched_users(matcher, make_item(location="东上院 302", 数量="")) == ["erin", "fay"]
+
+def test_range_bounds_and_removal(item_types):
+    matcher = matcher_with(("a", {"conditions": [["数量", ">=", "5"]]}),
+                           ("b", {"conditions": [["数量", ">", "5"]]}),
+                           ("c", {"conditions": [["数量", "<", "5"]]}),
+                           ("d", {"conditions": [["数量", "<=", "5"]]}),
+                           ("e", {"category": "食品", "conditions": [["保质期", "<", "2025-03-01"]]}))
+    assert matched_users(matcher, make_item(数量="5")) == ["a", "d"]
+    assert matched_users(matcher, make_item(数量="6")) == ["a", "b"]
+    assert matched_users(matcher, make_item(数量="4.5", 保质期="2025-02-01")) == ["c", "d", "e"]
+    matcher.remove("d", 4)
+    matcher.remove("a", 1)
+    assert matched_users(matcher, make_item(数量="5")) == []
+    assert set(matcher.ranges) == {(None, "数量", "number", "lower"), (None, "数量", "number", "upper"),
+                                   ("食品", "保质期", "date", "upper")}
+
+def test_index_agrees_with_checking_every_search(item_types):
+    import random
+    rng = random.Random(7)
+    locations = ["北京市朝阳区", "广州市天河区", "深圳南山区", "广东省", "上海", "东上院", None]
+    searches = []
+    for i in range(300):
+        conditions = []
+        if rng.random() < 0.5:
+            conditions.append(["数量", rng.choice([">", ">=", "<", "<=", "="]), str(rng.randint(0, 20))])
+        if rng.random() < 0.2:
+            conditions.append(["保质期", rng.choice([">", "<"]), f"2025-0{rng.randint(1, 9)}-01"])
+        searches.append((f"user{i % 7}", {"category": rng.choice(["食品", None]),
+                                          "keyword": rng.choice([None, "苹果", "果", "牛奶"]),
+                                          "conditions": conditions, "location": rng.choice(locations)}))
+    matcher = matcher_with(*searches)
+    for i in range(200):
+        item = make_item(name=rng.choice(["苹果", "牛奶", "面包"]), location=rng.choice(locations[:-1]),
+                         added_by=f"user{i % 9}", 数量=str(rng.randint(0, 20)),
+                         保质期=f"2025-0{rng.randint(1, 9)}-15")
+        expected = [key[0] for key, search in sorted(matcher.searches.items())
+                    if key[0] != item.added_by and matcher.accepts(search, item)]
+        assert matched_users(matcher, item) == expected
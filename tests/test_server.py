@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+import item_revive_server as server_module
+
+@pytest.fixture
+def server(service):
+    return server_module.ItemReviveServer(service, max_body_size=1024)
+
+def call(server, method, target, body=None, token=None):
+    headers = {"authorization": f"Bearer {token}"} if token else {}
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    status, payload, extra_headers = asyncio.run(server.dispatch(method, target, headers, data))
+    return status, payload
+
+def login(server, username, password="123456"):
+    status, payload = call(server, "POST", "/login", {"username": username, "password": password})
+    assert status == 200, payload
+    return payload["token"]
+
+# 通过真实的连接发送原始请求，返回状态码
+def raw_request(server, request):
+    return raw_response(server, request)[0]
+
+# 返回 (状态码, 响应头)
+def raw_response(server, request):
+    async def run():
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), 5)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            writer.close()
+            return int(status_line.split()[1]), headers
+    return asyncio.run(run())
+
+def test_login_and_authenticated_routes(server):
+    status, payload = call(server, "GET", "/me/items")
+    assert status == 401
+    token = login(server, "user1")
+    status, payload = call(server, "GET", "/me/items", token=token)
+    assert status == 200
+    assert {item["added_by"] for item in payload["items"]} == {"user1"}
+    assert call(server, "POST", "/logout", {}, token=token)[0] == 200
+    assert call(server, "GET", "/me/items", token=token)[0] == 401
+
+def test_wrong_password_is_rejected(server):
+    status, payload = call(server, "POST", "/login", {"username": "user1", "password": "wrong"})
+    assert status == 401
+    status, payload = call(server, "POST", "/login", {"username": "nobody", "password": "wrong"})
+    assert status == 401
+
+def test_admin_only_routes(server):
+    user = login(server, "user1")
+    admin = login(server, "admin")
+    for method, path in (("GET", "/users/pending"), ("GET", "/metrics")):
+        assert call(server, method, path)[0] == 401
+        assert call(server, method, path, token=user)[0] == 403
+        assert call(server, method, path, token=admin)[0] == 200
+
+def test_cannot_delete_other_users_items(server):
+    token = login(server, "alice")
+    status, payload = call(server, "GET", "/items?owner=user1&limit=1", token=token)
+    item_id = payload["items"][0]["id"]
+    assert call(server, "DELETE", f"/items/{item_id}", token=token)[0] == 403
+    assert call(server, "GET", f"/items/{item_id}", token=token)[0] == 200
+
+def test_client_errors(server):
+    token = login(server, "user1")
+    assert call(server, "GET", "/nope")[0] == 404
+    assert call(server, "DELETE", "/items")[0] == 405
+    assert asyncio.run(server.dispatch("POST", "/login", {}, b"{not json"))[0] == 400
+    assert call(server, "POST", "/items", {"type": "不存在", "name": "x"}, token=token)[0] == 400
+    assert call(server, "GET", "/items/999999", token=token)[0] in (400, 404)
+
+def test_oversized_body_is_rejected(server):
+    request = b"POST /login HTTP/1.1\r\nContent-Length: 4096\r\n\r\n"
+    assert raw_request(server, request) == 413
+
+@pytest.mark.parametrize("length", ["abc", "-1", "+5", "1_0", "1.5"])
+def test_invalid_content_length_is_rejected(server, length):
+    request = f"POST /login HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("latin-1")
+    assert raw_request(server, request) == 400
+
+def test_throttled_login_returns_429_with_retry_after(server):
+    for attempt in range(server.service.login_throttle.free_attempts):
+        status, payload = call(server, "POST", "/login", {"username": "user1", "password": "wrong"})
+        assert status == 401
+    body = json.dumps({"username": "user1", "password": "123456"}).encode("utf-8")
+    request = (f"POST /login HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+               .encode("latin-1") + body)
+    status, headers = raw_response(server, request)
+    assert status == 429
+    assert int(headers["retry-after"]) >= 1